@@ -3,7 +3,8 @@ from django.contrib.auth.admin import UserAdmin
 from .models import (
     User, Formation, Session, SessionDate, 
     TrainingRoom, TrainingWish, 
-    CompletedTraining, Trainer, RPE
+    CompletedTraining, Trainer, RPE, PostalCode, GeocodeCache, ArchivedSession,
+    ArchivedParticipation, OutboxMessage,
 )
 
 # Register your models here.
@@ -58,6 +59,37 @@ class RPEAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
     ordering = ('name',)
 
+@admin.register(PostalCode)
+class PostalCodeAdmin(admin.ModelAdmin):
+    list_display = ('code_postal', 'commune', 'code_insee', 'latitude', 'longitude')
+    search_fields = ('code_postal', 'commune', 'nom_normalise')
+
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ('query', 'latitude', 'longitude', 'expires_at')
+    search_fields = ('query',)
+
+class ArchivedParticipationInline(admin.TabularInline):
+    model = ArchivedParticipation
+    fields = ('user', 'kind', 'status', 'created_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+@admin.register(ArchivedSession)
+class ArchivedSessionAdmin(admin.ModelAdmin):
+    list_display = ('formation_name', 'start_date', 'end_date', 'city', 'status', 'archived_at')
+    list_filter = ('status',)
+    search_fields = ('formation_name', 'city', 'postal_code')
+    readonly_fields = ('original_id', 'archived_at', 'moved_at', 'payload')
+    inlines = [ArchivedParticipationInline]
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'created_at', 'processed_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'payload', 'attempts', 'last_error', 'created_at', 'processed_at')
+
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'is_trainer')
     list_filter = ('is_staff', 'is_trainer', 'groups')
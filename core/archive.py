@@ -0,0 +1,185 @@
+"""
+Stockage froid des sessions archivées.
+
+Les sessions archivées depuis plus de ``SESSION_COLD_STORAGE_DELAY_DAYS``
+jours sont copiées dans ``ArchivedSession`` (colonnes de liste + détail en
+JSON), puis supprimées des tables actives avec leurs lignes dépendantes :
+dates, participants, commentaires, souhaits rattachés et distances.
+
+Les participants et les souhaits rattachés sont aussi copiés dans
+``ArchivedParticipation`` : la page profil continue d'afficher les formations
+suivies et les souhaits satisfaits par ces sessions.
+
+Les sessions à déplacer sont choisies sur ``updated_at``, mis à jour par
+``Session.archive_old_sessions``.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLD_STORAGE_DELAY_DAYS = 365
+BATCH_SIZE = 100
+
+
+def _user_name(user):
+    return user.get_full_name() if user else ''
+
+
+def serialize_session(session):
+    """Retourne l'instantané JSON d'une session et de ses lignes dépendantes."""
+    return {
+        'session': {
+            'address': session.address,
+            'iperia_opening_date': session.iperia_opening_date,
+            'iperia_deadline': session.iperia_deadline,
+            'latitude': session.latitude,
+            'longitude': session.longitude,
+            'created_at': session.created_at,
+            'last_status_change': session.last_status_change,
+        },
+        'dates': [
+            {
+                'date': d.date,
+                'location_id': d.location_id,
+                'location_name': d.location.name if d.location else '',
+            }
+            for d in session.dates.all()
+        ],
+        'trainers': [
+            {'id': t.pk, 'name': t.get_full_name()}
+            for t in session.trainers.all()
+        ],
+        'session_participants': [
+            {
+                'user_id': p.user_id,
+                'user_name': _user_name(p.user),
+                'status': p.status,
+                'created_at': p.created_at,
+                'comments': [
+                    {
+                        'author_id': c.author_id,
+                        'author_name': _user_name(c.author),
+                        'content': c.content,
+                        'created_at': c.created_at,
+                    }
+                    for c in p.participant_comments.all()
+                ],
+            }
+            for p in session.session_participants.all()
+        ],
+        'participants': [
+            {
+                'user_id': p.user_id,
+                'user_name': _user_name(p.user),
+                'file_status': p.file_status,
+                'comments': p.comments,
+                'created_at': p.created_at,
+            }
+            for p in session.formation_participants.all()
+        ],
+        'training_wishes': [
+            {
+                'user_id': w.user_id,
+                'formation_id': w.formation_id,
+                'created_at': w.created_at,
+                'notes': w.notes,
+            }
+            for w in session.training_wishes.all()
+        ],
+    }
+
+
+def participation_rows(payload):
+    """Retourne les (user_id, type, statut, created_at) des participants et souhaits d'un instantané."""
+    rows = [
+        (p['user_id'], 'PARTICIPANT', p['status'], p['created_at'])
+        for p in payload.get('session_participants', [])
+    ]
+    rows += [(w['user_id'], 'WISH', '', w['created_at']) for w in payload.get('training_wishes', [])]
+    return rows
+
+
+def cold_storage_cutoff():
+    delay = getattr(settings, 'SESSION_COLD_STORAGE_DELAY_DAYS', DEFAULT_COLD_STORAGE_DELAY_DAYS)
+    return timezone.now() - timedelta(days=delay)
+
+
+def _move_batch(session_ids):
+    from .models import (
+        ArchivedParticipation, ArchivedSession, ParticipantComment, Session, SessionDate,
+        SessionParticipant, TrainingWish,
+    )
+
+    sessions = Session.objects.filter(pk__in=session_ids).select_related('formation').prefetch_related(
+        Prefetch('dates', queryset=SessionDate.objects.select_related('location').order_by('date')),
+        'trainers',
+        Prefetch(
+            'session_participants',
+            queryset=SessionParticipant.objects.select_related('user').prefetch_related(
+                Prefetch('participant_comments', queryset=ParticipantComment.objects.select_related('author'))
+            ),
+        ),
+        'formation_participants__user',
+        'training_wishes',
+    )
+
+    now = timezone.now()
+    with transaction.atomic():
+        archived = [
+            ArchivedSession(
+                original_id=session.pk,
+                formation_id=session.formation_id,
+                formation_name=session.formation.name,
+                status=session.status,
+                start_date=session.start_date,
+                end_date=session.end_date,
+                city=session.city or '',
+                postal_code=session.postal_code or '',
+                archived_at=now,
+                payload=serialize_session(session),
+            )
+            for session in sessions
+        ]
+        ArchivedSession.objects.bulk_create(archived, ignore_conflicts=True)
+        # ignore_conflicts ne renseigne pas les clés primaires : relecture par identifiant d'origine
+        archived_ids = dict(
+            ArchivedSession.objects.filter(original_id__in=session_ids).values_list('original_id', 'pk')
+        )
+        ArchivedParticipation.objects.bulk_create([
+            ArchivedParticipation(
+                archived_session_id=archived_ids[entry.original_id],
+                user_id=user_id, kind=kind, status=status, created_at=created_at,
+            )
+            for entry in archived
+            for user_id, kind, status, created_at in participation_rows(entry.payload)
+        ], batch_size=1000)
+        # Les souhaits satisfaits par la session redeviendraient « non assignés »
+        # (on_delete=SET_NULL) : ils sont conservés dans l'instantané puis supprimés.
+        TrainingWish.objects.filter(session_id__in=session_ids).delete()
+        Session.objects.filter(pk__in=session_ids).delete()
+    return len(archived)
+
+
+def move_sessions_to_cold_storage(batch_size=BATCH_SIZE):
+    """
+    Déplace vers le stockage froid les sessions archivées depuis plus de
+    ``SESSION_COLD_STORAGE_DELAY_DAYS`` jours, par lots transactionnels.
+    Retourne le nombre de sessions déplacées.
+    """
+    from .models import Session
+
+    ids = list(
+        Session.objects.filter(is_archive=True, updated_at__lt=cold_storage_cutoff())
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    moved = 0
+    for start in range(0, len(ids), batch_size):
+        moved += _move_batch(ids[start:start + batch_size])
+    return moved
@@ -1,9 +1,16 @@
-from .models import Notification
+from django.utils.functional import SimpleLazyObject
+
+from .notification_counter import get_unread_count
+
 
 def unread_notifications(request):
-    """Contexte pour le nombre de notifications non lues."""
+    """
+    Contexte pour le nombre de notifications non lues. Le compteur n'est lu
+    (depuis le cache) que si le gabarit l'affiche.
+    """
     if request.user.is_authenticated:
+        user_id = request.user.pk
         return {
-            'unread_notifications_count': request.user.notifications.filter(is_read=False).count()
+            'unread_notifications_count': SimpleLazyObject(lambda: get_unread_count(user_id))
         }
     return {}
@@ -0,0 +1,157 @@
+"""
+Table matérialisée des distances utilisateur ↔ session (``UserSessionDistance``).
+
+Seules les sessions non archivées et les lignes géolocalisées y figurent. Les
+distances sont recalculées en tâche de fond (NumPy, une requête par côté)
+lorsque les coordonnées d'un utilisateur ou d'une session changent, puis
+écrites par ``bulk_create(update_conflicts=True)``. Les vues trient ensuite
+par distance avec un simple ``ORDER BY`` indexé.
+
+``USER_SESSION_DISTANCE_MAX_KM`` permet de ne conserver que les paires
+proches. Les paires absentes (hors distance maximale, ou pas encore
+calculées) sont calculées à la volée par ``annotate_session_distance``.
+Les lignes d'une session sont supprimées dès son archivage.
+"""
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .utils import TRIG_FUNCTION_VENDORS, annotate_distance, distance_expression, haversine_distances
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+
+
+def _max_distance():
+    return getattr(settings, 'USER_SESSION_DISTANCE_MAX_KM', None)
+
+
+def _write_rows(rows, owner):
+    """
+    Remplace les distances d'un utilisateur ou d'une session (``owner``, ex.
+    ``{'session_id': 3}``) par ``rows`` : les paires sont insérées ou mises à
+    jour, puis celles qui n'ont pas été réécrites sont supprimées.
+    """
+    from .models import UserSessionDistance
+
+    started = timezone.now()
+    with transaction.atomic():
+        if rows:
+            UserSessionDistance.objects.bulk_create(
+                rows,
+                batch_size=BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['user', 'session'],
+                update_fields=['distance_km', 'updated_at'],
+            )
+        UserSessionDistance.objects.filter(updated_at__lt=started, **owner).delete()
+    return len(rows)
+
+
+def _pairs(lat, lon, rows):
+    """Filtre (pk, lat, lon) et retourne [(pk, distance)] selon la distance maximale."""
+    if lat is None or lon is None or not rows:
+        return []
+    pks, lats, lons = (np.array(column) for column in zip(*rows))
+    distances = haversine_distances(lat, lon, lats.astype(float), lons.astype(float))
+    limit = _max_distance()
+    if limit is not None:
+        inside = distances <= limit
+        pks, distances = pks[inside], distances[inside]
+    return list(zip(pks.tolist(), distances.tolist()))
+
+
+def refresh_session_distances(session_id):
+    """Recalcule les distances d'une session à tous les utilisateurs géolocalisés."""
+    from .models import Session, User, UserSessionDistance
+
+    session = Session.objects.filter(pk=session_id).values('latitude', 'longitude', 'is_archive').first()
+    if session is None:
+        return 0
+    rows = []
+    if not session['is_archive']:
+        users = User.objects.filter(latitude__isnull=False, longitude__isnull=False) \
+            .order_by().values_list('pk', 'latitude', 'longitude')
+        rows = [
+            UserSessionDistance(user_id=pk, session_id=session_id, distance_km=distance)
+            for pk, distance in _pairs(session['latitude'], session['longitude'], list(users))
+        ]
+    return _write_rows(rows, {'session_id': session_id})
+
+
+def refresh_user_distances(user_id):
+    """Recalcule les distances d'un utilisateur à toutes les sessions non archivées."""
+    from .models import Session, User, UserSessionDistance
+
+    user = User.objects.filter(pk=user_id).values('latitude', 'longitude').first()
+    if user is None:
+        return 0
+    sessions = Session.objects.filter(
+        is_archive=False, latitude__isnull=False, longitude__isnull=False
+    ).order_by().values_list('pk', 'latitude', 'longitude')
+    rows = [
+        UserSessionDistance(user_id=user_id, session_id=pk, distance_km=distance)
+        for pk, distance in _pairs(user['latitude'], user['longitude'], list(sessions))
+    ]
+    return _write_rows(rows, {'user_id': user_id})
+
+
+def rebuild_distances():
+    """Reconstruit toute la table, session par session."""
+    from .models import Session, UserSessionDistance
+
+    UserSessionDistance.objects.filter(session__is_archive=True).delete()
+    total = 0
+    for session_id in Session.objects.filter(is_archive=False).values_list('pk', flat=True).iterator():
+        total += refresh_session_distances(session_id)
+    return total
+
+
+def annotate_session_distance(sessions, user, lat, lon):
+    """
+    Annote les sessions de leur distance (``distance``, km) à l'utilisateur et
+    les trie par distance, sessions sans coordonnées à la fin.
+
+    Les distances sont lues dans la table ; celles qui manquent (nouvelle
+    session, coordonnées modifiées depuis le dernier calcul) sont calculées en
+    SQL. Sans aucune ligne pour l'utilisateur, ``annotate_distance`` est utilisé.
+    """
+    from .models import UserSessionDistance
+
+    if not UserSessionDistance.objects.filter(user=user).exists():
+        return annotate_distance(sessions, lat, lon)
+    distance = Subquery(
+        UserSessionDistance.objects.filter(user=user, session=OuterRef('pk')).values('distance_km')[:1],
+        output_field=FloatField(),
+    )
+    if connections[sessions.db].vendor in TRIG_FUNCTION_VENDORS:
+        distance = Coalesce(distance, distance_expression(lat, lon), output_field=FloatField())
+    return sessions.annotate(distance=distance).order_by(F('distance').asc(nulls_last=True), 'start_date')
+
+
+def delete_session_distances(sessions):
+    """Supprime les distances des sessions données (queryset ou identifiants), par exemple à l'archivage."""
+    from .models import UserSessionDistance
+
+    return UserSessionDistance.objects.filter(session__in=sessions).delete()[0]
+
+
+def schedule_distance_refresh(instance):
+    """Planifie, après le commit, le recalcul des distances d'un utilisateur ou d'une session."""
+    from .models import Session
+
+    def enqueue():
+        from .tasks import refresh_distances
+        kind = 'session' if isinstance(instance, Session) else 'user'
+        try:
+            refresh_distances.apply_async((kind, instance.pk), retry=False)
+        except Exception as e:
+            logger.error(f"Impossible de planifier le recalcul des distances ({kind} #{instance.pk}) : {e}")
+
+    transaction.on_commit(enqueue)
@@ -0,0 +1,197 @@
+"""
+Événements en direct diffusés aux navigateurs (Server-Sent Events).
+
+Les vues et signaux publient, après le commit, des événements sur des
+canaux : ``user:<id>`` pour les notifications d'un utilisateur, ``staff``
+pour les changements de statut des sessions et des participants. La vue
+``event_stream`` (servie par ``formation_assmat/asgi.py``) abonne chaque
+navigateur à ses canaux.
+
+Le broker est choisi par ``EVENTS_BROKER`` :
+
+- ``core.events.InProcessBroker`` (défaut) : en mémoire, les événements ne
+  sortent pas du processus. Convient à un seul processus ASGI ; les
+  publications faites par les workers Celery ne sont pas relayées.
+- ``core.events.RedisBroker`` : pub/sub Redis (``EVENTS_REDIS_URL``, par
+  défaut le broker Celery), pour plusieurs processus et les workers.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+STAFF_CHANNEL = 'staff'
+# Événements en attente par abonné au-delà desquels les plus anciens sont abandonnés
+QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+class InProcessSubscription:
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, message):
+        """Appelé depuis la boucle de l'abonné (voir ``InProcessBroker.publish``)."""
+        if self.queue.full():
+            # Client trop lent : on abandonne le plus ancien événement
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """Retourne le prochain message, ou None après ``timeout`` secondes."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Broker en mémoire, partagé par les threads et la boucle asyncio d'un processus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # Boucle fermée : l'abonné est parti sans se désabonner
+                self.unsubscribe(subscription)
+
+    async def subscribe(self, channels):
+        subscription = InProcessSubscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscriptions = self._subscriptions.get(channel)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self._subscriptions[channel]
+
+
+class RedisSubscription:
+    def __init__(self, client, pubsub):
+        self.client = client
+        self.pubsub = pubsub
+
+    async def get(self, timeout):
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        data = message['data']
+        return data.decode() if isinstance(data, bytes) else data
+
+    async def close(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class RedisBroker:
+    """Broker Redis (pub/sub) : relaie les événements entre processus et workers Celery."""
+
+    prefix = 'formasmat:events:'
+
+    def __init__(self, url=None):
+        import redis
+
+        self.url = url or getattr(settings, 'EVENTS_REDIS_URL', None) or settings.CELERY_BROKER_URL
+        self._client = redis.Redis.from_url(self.url)
+
+    def publish(self, channel, message):
+        self._client.publish(self.prefix + channel, message)
+
+    async def subscribe(self, channels):
+        from redis import asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(*(self.prefix + channel for channel in channels))
+        return RedisSubscription(client, pubsub)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Retourne le broker configuré par ``EVENTS_BROKER`` (instancié une fois par processus)."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'EVENTS_BROKER', 'core.events.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish(channel, event, data):
+    """Publie immédiatement ``data`` (sérialisable en JSON) sous le nom d'événement ``event``."""
+    message = json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder)
+    try:
+        get_broker().publish(channel, message)
+    except Exception as e:
+        # Le direct est un confort : une panne du broker ne doit pas faire échouer l'écriture
+        logger.error(f"Impossible de publier l'événement {event} sur {channel} : {e}")
+
+
+def publish_on_commit(channel, event, data):
+    """Publie l'événement après le commit de la transaction en cours."""
+    transaction.on_commit(lambda: publish(channel, event, data))
+
+
+def publish_notifications(notifications):
+    """Publie les notifications créées sur le canal de leurs destinataires."""
+    for notification in notifications:
+        publish_on_commit(user_channel(notification.user_id), 'notification', {
+            'id': notification.pk,
+            'type': notification.type,
+            'type_display': notification.get_type_display(),
+            'message': notification.message,
+            'created_at': notification.created_at,
+        })
+
+
+def format_sse(message):
+    """Met en forme un message publié (JSON) au format text/event-stream."""
+    payload = json.loads(message)
+    return f"event: {payload['event']}\ndata: {json.dumps(payload['data'])}\n\n"
+
+
+async def stream(channels):
+    """Flux text/event-stream des événements publiés sur ``channels``, avec battement de cœur."""
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+    subscription = await get_broker().subscribe(channels)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            message = await subscription.get(heartbeat)
+            # Commentaire SSE : maintient la connexion ouverte à travers les proxys
+            yield format_sse(message) if message is not None else ": ping\n\n"
+    finally:
+        await subscription.close()
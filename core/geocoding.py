@@ -0,0 +1,275 @@
+"""
+Géocodage des adresses et codes postaux.
+
+Les codes postaux sont résolus localement à partir du référentiel
+``PostalCode`` (chargé via ``manage.py load_postal_codes``). Nominatim n'est
+plus utilisé que pour les adresses complètes, et seulement si
+``GEOCODING_NOMINATIM_FALLBACK`` est activé.
+
+Toutes les résolutions passent par un cache LRU en mémoire ; les réponses de
+Nominatim sont en plus conservées dans la table ``GeocodeCache`` avec une
+durée de vie, y compris les adresses introuvables (cache négatif).
+
+Lors de l'enregistrement d'un modèle, le géocodage est délégué à une tâche
+Celery (``schedule_geocoding``) pour ne pas bloquer la requête HTTP.
+"""
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import outbox
+
+logger = logging.getLogger(__name__)
+
+NOMINATIM_USER_AGENT = "formasmat_app"
+
+DEFAULT_CACHE_TTL = 60 * 60 * 24 * 90       # 90 jours
+DEFAULT_NEGATIVE_CACHE_TTL = 60 * 60 * 24   # 1 jour
+DEFAULT_LRU_SIZE = 2048
+
+_MISSING = object()
+
+# Champs (adresse, code postal, ville) utilisés pour géocoder chaque modèle
+GEOCODED_FIELDS = {
+    'core.user': ('address', 'code_postal', 'city'),
+    'core.formation': (None, 'code_postal', 'city'),
+    'core.session': ('address', 'postal_code', 'city'),
+    'core.trainingroom': ('address', 'postal_code', 'city'),
+}
+
+
+class GeocodingError(Exception):
+    """Erreur transitoire du géocodeur (réseau, quota...) : jamais mise en cache."""
+
+
+class LRUCache:
+    """Cache LRU en mémoire, borné en taille, avec expiration par entrée."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_lru = LRUCache(getattr(settings, 'GEOCODING_LRU_SIZE', DEFAULT_LRU_SIZE))
+_geolocator = None
+
+
+def _ttl(negative):
+    if negative:
+        return getattr(settings, 'GEOCODING_NEGATIVE_CACHE_TTL', DEFAULT_NEGATIVE_CACHE_TTL)
+    return getattr(settings, 'GEOCODING_CACHE_TTL', DEFAULT_CACHE_TTL)
+
+
+def _strip_accents(value):
+    value = unicodedata.normalize('NFKD', str(value))
+    return ''.join(c for c in value if not unicodedata.combining(c))
+
+
+def normalize_place_name(value):
+    """Normalise un nom de commune : majuscules, sans accents ni ponctuation."""
+    if not value:
+        return ''
+    value = re.sub(r"[^A-Za-z0-9]+", ' ', _strip_accents(value)).upper()
+    # La Poste abrège "SAINT" en "ST" dans les libellés d'acheminement
+    value = re.sub(r"\bSAINTE\b", 'STE', value)
+    value = re.sub(r"\bSAINT\b", 'ST', value)
+    return ' '.join(value.split())
+
+
+def normalize_postal_code(value):
+    """Retourne le code postal sur 5 chiffres, ou une chaîne vide."""
+    digits = re.sub(r"\D", '', str(value or ''))
+    if not digits or len(digits) > 5:
+        return ''
+    return digits.zfill(5)
+
+
+def normalize_query(value):
+    """
+    Normalise une requête de géocodage : minuscules, sans accents, espaces et
+    ponctuation réduits, suffixe "France" retiré.
+    """
+    if not value:
+        return ''
+    value = re.sub(r"[^a-z0-9]+", ' ', _strip_accents(value).lower()).strip()
+    value = re.sub(r"(\s*\bfrance\b)+$", '', value)
+    return ' '.join(value.split())
+
+
+def lookup_postal_code(postal_code, city=None):
+    """
+    Résout (code postal, ville) en (latitude, longitude) via le référentiel local.
+
+    Si la ville ne correspond à aucune commune du code postal, la première
+    commune desservie est utilisée.
+    """
+    code = normalize_postal_code(postal_code)
+    if not code:
+        return None, None
+
+    name = normalize_place_name(city)
+    key = f"cp:{code}:{name}"
+    cached = _lru.get(key)
+    if cached is not _MISSING:
+        return cached
+
+    from .models import PostalCode
+
+    entries = PostalCode.objects.filter(code_postal=code)
+    match = None
+    if name:
+        match = entries.filter(nom_normalise=name).values_list('latitude', 'longitude').first()
+    if match is None:
+        match = entries.values_list('latitude', 'longitude').first()
+    if match is None:
+        # Référentiel pas encore chargé : ne pas mémoriser d'échecs qui n'en sont pas
+        if not PostalCode.objects.exists():
+            return None, None
+        _lru.set(key, (None, None), _ttl(True))
+        return None, None
+    result = tuple(match)
+    _lru.set(key, result, _ttl(False))
+    return result
+
+
+def _get_geolocator():
+    global _geolocator
+    if _geolocator is None:
+        from geopy.geocoders import Nominatim
+        _geolocator = Nominatim(user_agent=NOMINATIM_USER_AGENT)
+    return _geolocator
+
+
+def _query_nominatim(query):
+    try:
+        location = _get_geolocator().geocode(query)
+    except Exception as e:
+        raise GeocodingError(str(e)) from e
+    if location:
+        return location.latitude, location.longitude
+    return None, None
+
+
+def nominatim_geocode(query, raise_errors=False):
+    """
+    Interroge Nominatim pour une adresse complète, à travers le cache LRU et
+    la table ``GeocodeCache``.
+
+    Les erreurs transitoires sont journalisées et renvoient (None, None), sauf
+    si ``raise_errors`` est vrai (tâches Celery qui doivent réessayer).
+    """
+    from .models import GeocodeCache
+
+    key = normalize_query(query)
+    if not key:
+        return None, None
+
+    cached = _lru.get(f"adr:{key}")
+    if cached is not _MISSING:
+        return cached
+
+    now = timezone.now()
+    entry = GeocodeCache.objects.filter(query=key, expires_at__gt=now).first()
+    if entry is not None:
+        result = (entry.latitude, entry.longitude)
+        remaining = (entry.expires_at - now).total_seconds()
+        _lru.set(f"adr:{key}", result, min(remaining, _ttl(entry.is_negative)))
+        return result
+
+    try:
+        # La forme normalisée ne sert que de clé : Nominatim reçoit la requête d'origine
+        result = _query_nominatim(f"{' '.join(str(query).split())}, France")
+    except GeocodingError as e:
+        if raise_errors:
+            raise
+        logger.warning(f"Erreur géocodage Nominatim pour '{query}' : {e}")
+        return None, None
+
+    negative = result[0] is None
+    ttl = _ttl(negative)
+    GeocodeCache.objects.update_or_create(
+        query=key,
+        defaults={
+            'latitude': result[0],
+            'longitude': result[1],
+            'expires_at': now + timedelta(seconds=ttl),
+        },
+    )
+    _lru.set(f"adr:{key}", result, ttl)
+    return result
+
+
+def geocode_address(address, postal_code=None, city=None, raise_errors=False):
+    """
+    Géocode une adresse : d'abord le référentiel local (code postal / ville),
+    puis Nominatim en repli pour l'adresse complète si autorisé.
+    """
+    lat, lon = lookup_postal_code(postal_code, city)
+    if lat is not None and lon is not None:
+        return lat, lon
+
+    if address and getattr(settings, 'GEOCODING_NOMINATIM_FALLBACK', True):
+        return nominatim_geocode(
+            f"{address} {postal_code or ''} {city or ''}", raise_errors=raise_errors
+        )
+    return None, None
+
+
+def get_geocoding_source(instance):
+    """Retourne le triplet (adresse, code postal, ville) d'une instance géocodable."""
+    fields = GEOCODED_FIELDS[instance._meta.label_lower]
+    return tuple(getattr(instance, name) if name else None for name in fields)
+
+
+def needs_geocoding(instance):
+    """Vrai si l'instance a une adresse ou un code postal mais pas de coordonnées."""
+    if instance._meta.label_lower not in GEOCODED_FIELDS:
+        return False
+    if instance.latitude is not None and instance.longitude is not None:
+        return False
+    address, postal_code, _city = get_geocoding_source(instance)
+    return bool(address or postal_code)
+
+
+def schedule_geocoding(instance):
+    """
+    Planifie le géocodage asynchrone d'une instance via la boîte d'envoi
+    transactionnelle : la demande est annulée si la transaction l'est.
+
+    Les demandes répétées pour une même ligne sont fusionnées par le
+    traitement de la boîte d'envoi : seule la plus récente encore en attente
+    planifie la tâche.
+    """
+    if instance.pk is not None:
+        outbox.enqueue('geocode', {'model_label': instance._meta.label_lower, 'pk': instance.pk})
@@ -0,0 +1,95 @@
+"""
+Encodage geohash des coordonnées, pour les recherches de voisinage en SQL.
+
+Deux points proches partagent en général le même préfixe de geohash ; une
+recherche sur la cellule d'un point et ses 8 voisines (``geohash__startswith``)
+trouve donc tous les points situés à moins d'une taille de cellule.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {c: i for i, c in enumerate(BASE32)}
+
+# Précision stockée en base (~5 m)
+GEOHASH_PRECISION = 9
+
+# Hauteur (km) d'une cellule selon la précision ; la largeur est du même
+# ordre à l'équateur et diminue avec cos(latitude).
+_CELL_HEIGHT_KM = {1: 5000, 2: 625, 3: 156, 4: 19.5, 5: 4.89, 6: 0.61, 7: 0.153, 8: 0.019}
+_CELL_WIDTH_KM = {1: 5000, 2: 1250, 3: 156, 4: 39.1, 5: 4.89, 6: 1.22, 7: 0.153, 8: 0.038}
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Retourne le geohash de (lat, lon), ou une chaîne vide sans coordonnées."""
+    if lat is None or lon is None:
+        return ''
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+
+def decode_bounds(geohash):
+    """Retourne (lat_min, lat_max, lon_min, lon_max) de la cellule."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def neighbors(geohash):
+    """Retourne la cellule et ses voisines (jusqu'à 9 cellules, sans doublon)."""
+    lat_min, lat_max, lon_min, lon_max = decode_bounds(geohash)
+    lat_c, lon_c = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+    d_lat, d_lon = lat_max - lat_min, lon_max - lon_min
+
+    cells = []
+    for i in (-1, 0, 1):
+        lat = lat_c + i * d_lat
+        if lat > 90 or lat < -90:
+            continue
+        for j in (-1, 0, 1):
+            lon = (lon_c + j * d_lon + 180) % 360 - 180
+            cell = encode(lat, lon, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def precision_for_radius(radius_km, lat=0.0):
+    """
+    Plus grande précision dont les cellules couvrent ``radius_km`` : la
+    cellule du point et ses voisines contiennent alors tout le cercle.
+    """
+    shrink = max(math.cos(math.radians(lat)), 0.01)
+    for precision in range(8, 0, -1):
+        if min(_CELL_HEIGHT_KM[precision], _CELL_WIDTH_KM[precision] * shrink) >= radius_km:
+            return precision
+    return 0
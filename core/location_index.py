@@ -0,0 +1,158 @@
+"""
+Index spatial en mémoire des utilisateurs géolocalisés.
+
+L'index est construit par processus à partir d'une seule requête
+``values_list``. Chaque changement de coordonnées (signaux ``post_save`` /
+``post_delete`` de ``User``, tâche ``geocode_instance``) est appliqué à l'index
+local et incrémente une version partagée dans le cache Django : les autres
+processus reconstruisent leur index à leur prochaine recherche. Les écritures
+en masse (``geocode_backfill``) appellent ``invalidate``. La reconstruction
+complète après ``USER_LOCATION_INDEX_TTL`` secondes reste un filet de sécurité
+(cache non partagé, écritures hors ORM).
+
+Les points sont rangés par latitude croissante : une recherche par rayon ne
+calcule les distances que sur la bande de latitudes concernée (recherche
+dichotomique), et les k plus proches sont sélectionnés par ``argpartition``.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .utils import EARTH_RADIUS_KM, haversine_distances
+
+DEFAULT_INDEX_TTL = 60 * 10
+_VERSION_KEY = 'users:location-index:version'
+
+_EMPTY = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+
+
+class UserLocationIndex:
+    """Index (id, latitude, longitude) des utilisateurs, trié par latitude."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._points = {}
+        self._arrays = None
+        self._built_at = None
+        self._version = None
+
+    def _ttl(self):
+        return getattr(settings, 'USER_LOCATION_INDEX_TTL', DEFAULT_INDEX_TTL)
+
+    def _load(self):
+        from .models import User
+
+        rows = User.objects.filter(
+            latitude__isnull=False, longitude__isnull=False
+        ).order_by().values_list('pk', 'latitude', 'longitude')
+        self._points = {pk: (lat, lon) for pk, lat, lon in rows}
+        self._arrays = None
+        self._built_at = time.monotonic()
+
+    def _get_arrays(self):
+        # Lue avant le chargement : une modification pendant celui-ci provoquera une nouvelle lecture
+        version = cache.get(_VERSION_KEY)
+        with self._lock:
+            if (
+                self._built_at is None or version != self._version
+                or time.monotonic() - self._built_at > self._ttl()
+            ):
+                self._load()
+                self._version = version
+            if self._arrays is None:
+                if self._points:
+                    pks = np.fromiter(self._points, dtype=np.int64, count=len(self._points))
+                    coords = np.array(list(self._points.values()), dtype=float)
+                    order = np.argsort(coords[:, 0], kind='stable')
+                    self._arrays = (pks[order], coords[order, 0], coords[order, 1])
+                else:
+                    self._arrays = _EMPTY
+            return self._arrays
+
+    def _publish(self):
+        """Incrémente la version partagée et la retourne."""
+        try:
+            return cache.incr(_VERSION_KEY)
+        except ValueError:
+            cache.add(_VERSION_KEY, 0, None)
+            return cache.incr(_VERSION_KEY)
+
+    def update(self, pk, lat, lon):
+        """
+        Met à jour (ou retire, sans coordonnées) un utilisateur de l'index, et
+        signale le changement aux autres processus.
+        """
+        with self._lock:
+            previous = self._version
+            if self._built_at is not None:
+                if lat is None or lon is None:
+                    changed = self._points.pop(pk, None) is not None
+                else:
+                    changed = self._points.get(pk) != (lat, lon)
+                    self._points[pk] = (lat, lon)
+                if changed:
+                    self._arrays = None
+        version = self._publish()
+        with self._lock:
+            # Aucune autre modification entre-temps : l'index local est déjà à jour
+            if self._built_at is not None and self._version == previous and version == (previous or 0) + 1:
+                self._version = version
+
+    def remove(self, pk):
+        self.update(pk, None, None)
+
+    def invalidate(self):
+        """
+        Force la reconstruction complète à la prochaine recherche, dans ce
+        processus et dans les autres (écritures en masse hors signaux).
+        """
+        with self._lock:
+            self._built_at = None
+            self._arrays = None
+        self._publish()
+
+    def __len__(self):
+        return len(self._get_arrays()[0])
+
+    def _restrict(self, arrays, candidates):
+        pks, lats, lons = arrays
+        if candidates is None:
+            return arrays
+        mask = np.isin(pks, np.fromiter(candidates, dtype=np.int64))
+        return pks[mask], lats[mask], lons[mask]
+
+    def nearest(self, lat, lon, k=None, candidates=None):
+        """
+        Retourne (ids, distances) des ``k`` utilisateurs les plus proches du
+        point, triés par distance croissante (tous si ``k`` est None).
+        ``candidates`` restreint la recherche à un ensemble d'identifiants.
+        """
+        pks, lats, lons = self._restrict(self._get_arrays(), candidates)
+        distances = haversine_distances(lat, lon, lats, lons)
+        if k is not None and k < len(distances):
+            idx = np.argpartition(distances, k)[:k]
+            idx = idx[np.argsort(distances[idx], kind='stable')]
+        else:
+            idx = np.argsort(distances, kind='stable')
+        return pks[idx], distances[idx]
+
+    def within_radius(self, lat, lon, radius_km, candidates=None):
+        """Retourne (ids, distances) des utilisateurs à moins de ``radius_km``, triés."""
+        pks, lats, lons = self._get_arrays()
+        delta = np.degrees(radius_km / EARTH_RADIUS_KM)
+        start = np.searchsorted(lats, lat - delta, side='left')
+        stop = np.searchsorted(lats, lat + delta, side='right')
+        band = (pks[start:stop], lats[start:stop], lons[start:stop])
+        pks, lats, lons = self._restrict(band, candidates)
+
+        distances = haversine_distances(lat, lon, lats, lons)
+        inside = distances <= radius_km
+        pks, distances = pks[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return pks[order], distances[order]
+
+
+user_location_index = UserLocationIndex()
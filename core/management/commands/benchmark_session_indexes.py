@@ -0,0 +1,140 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Formation, Session
+
+# Index ajoutés pour les écrans de gestion des sessions (migration 0026)
+BENCHMARKED_INDEXES = [
+    'core_session_status_start_idx',
+    'core_session_form_start_idx',
+    'core_session_active_start_idx',
+    'core_session_to_archive_idx',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare les plans d'exécution et les temps des requêtes sur les sessions avec et sans "
+        "les index composites / partiels, sur des données générées puis annulées"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=50000,
+                            help='Nombre de sessions générées')
+        parser.add_argument('--formations', type=int, default=50,
+                            help='Nombre de formations générées')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Nombre d'exécutions de chaque requête pour la mesure")
+
+    def handle(self, *args, **options):
+        if options['sessions'] < 1 or options['formations'] < 1 or options['repeat'] < 1:
+            raise CommandError('--sessions, --formations et --repeat doivent être positifs')
+        if not connection.features.can_rollback_ddl:
+            raise CommandError(
+                f"Le moteur {connection.vendor} ne permet pas d'annuler la suppression des index"
+            )
+
+        indexes = [index for index in Session._meta.indexes if index.name in BENCHMARKED_INDEXES]
+        self.repeat = options['repeat']
+
+        # Tout est fait dans une transaction annulée : ni les données ni la
+        # suppression temporaire des index ne sont conservées. SQLite impose de
+        # désactiver les contraintes avant la transaction pour modifier le schéma.
+        connection.disable_constraint_checking()
+        try:
+            before, after, queries = self._benchmark(indexes, options)
+        finally:
+            connection.enable_constraint_checking()
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nRésumé (ms par requête)'))
+        for label in queries:
+            gain = before[label] / after[label] if after[label] else float('inf')
+            self.stdout.write(f"  {label:<45} {before[label]:8.2f} → {after[label]:8.2f}  (x{gain:.1f})")
+
+    def _benchmark(self, indexes, options):
+        with transaction.atomic():
+            formation = self._seed(options['formations'], options['sessions'])
+            queries = self._queries(formation)
+
+            with connection.schema_editor(atomic=False) as editor:
+                for index in indexes:
+                    editor.remove_index(Session, index)
+            self._analyze()
+            before = self._run('Sans les index', queries)
+
+            with connection.schema_editor(atomic=False) as editor:
+                for index in indexes:
+                    editor.add_index(Session, index)
+            self._analyze()
+            after = self._run('Avec les index', queries)
+
+            transaction.set_rollback(True)
+        return before, after, queries
+
+    def _seed(self, formation_count, session_count):
+        self.stdout.write(f'Génération de {formation_count} formations et {session_count} sessions...')
+        random.seed(42)
+        formations = Formation.objects.bulk_create([
+            Formation(name=f'Benchmark {i}', code_iperia=f'BENCH{i}', duration=10)
+            for i in range(formation_count)
+        ])
+        statuses = [code for code, _label in Session.STATUS_CHOICES]
+        now = timezone.now()
+        today = date.today()
+        sessions = []
+        for _ in range(session_count):
+            status = random.choice(statuses)
+            start = today + timedelta(days=random.randint(-1500, 365))
+            sessions.append(Session(
+                formation=random.choice(formations),
+                status=status,
+                start_date=start,
+                end_date=start + timedelta(days=random.randint(0, 10)),
+                last_status_change=now - timedelta(days=random.randint(0, 1500)),
+                # La majorité des sessions anciennes et terminées sont déjà archivées
+                is_archive=status == 'TERMINEE' and random.random() < 0.8,
+            ))
+        Session.objects.bulk_create(sessions, batch_size=2000)
+        return formations[0]
+
+    def _queries(self, formation):
+        return {
+            'Sessions non archivées par date': (
+                Session.objects.filter(is_archive=False).order_by('start_date')[:50]
+            ),
+            'Sessions non archivées par statut': (
+                Session.objects.filter(is_archive=False, status='OUVERTE').order_by('start_date')[:50]
+            ),
+            "Sessions non archivées d'une formation": (
+                Session.objects.filter(formation=formation, is_archive=False).order_by('start_date')[:50]
+            ),
+            'Sessions à archiver (tâche planifiée)': (
+                Session.objects.filter(
+                    status='TERMINEE', is_archive=False, last_status_change__lt=Session.archive_cutoff()
+                ).values('pk')
+            ),
+        }
+
+    def _analyze(self):
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def _run(self, title, queries):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n{title}'))
+        timings = {}
+        for label, queryset in queries.items():
+            self.stdout.write(self.style.SQL_KEYWORD(f'  {label}'))
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
+            start = time.perf_counter()
+            for _ in range(self.repeat):
+                list(queryset.all())
+            timings[label] = (time.perf_counter() - start) * 1000 / self.repeat
+            self.stdout.write(f'    {timings[label]:.2f} ms')
+        return timings
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.text import capfirst
+
+from core.geocoding import (
+    GEOCODED_FIELDS, lookup_postal_code, nominatim_geocode, normalize_place_name,
+    normalize_postal_code, normalize_query,
+)
+from core.geohash import encode as geohash_encode
+from core.location_index import user_location_index
+from core.tasks import rebuild_user_session_distances
+
+MODELS = ['core.user', 'core.formation', 'core.session', 'core.trainer', 'core.trainingroom']
+
+
+class RateLimiter:
+    """Limite globale du nombre d'appels par seconde, partagée entre les threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Command(BaseCommand):
+    help = 'Géocode par lots les lignes sans coordonnées (utilisateurs, formations, sessions, formateurs, salles)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', choices=MODELS, default=MODELS,
+                            help='Modèles à traiter')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Nombre de lignes lues par lot')
+        parser.add_argument('--workers', type=int, default=2,
+                            help="Nombre de threads pour les appels à Nominatim")
+        parser.add_argument('--rate', type=float, default=1.0,
+                            help='Nombre maximal de requêtes Nominatim par seconde (tous threads confondus)')
+        parser.add_argument('--state-file',
+                            help="Fichier de reprise : dernier identifiant traité par modèle")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="N'écrit rien et n'interroge pas Nominatim")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1 or options['rate'] <= 0:
+            raise CommandError('--chunk-size, --workers et --rate doivent être positifs')
+
+        self.dry_run = options['dry_run']
+        self.use_nominatim = not self.dry_run and getattr(settings, 'GEOCODING_NOMINATIM_FALLBACK', True)
+        self.limiter = RateLimiter(options['rate'])
+        self.state_file = options['state_file']
+        self.state = self._load_state()
+
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING('Mode simulation : aucune écriture'))
+
+        self.rebuild_distances = False
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for label in options['models']:
+                self._backfill_model(label, options['chunk_size'], pool)
+
+        if self.rebuild_distances:
+            rebuild_user_session_distances.delay()
+            self.stdout.write('Reconstruction des distances utilisateur / session planifiée')
+
+    def _backfill_model(self, label, chunk_size, pool):
+        model = apps.get_model(label)
+        name = capfirst(model._meta.verbose_name_plural)
+
+        fields = GEOCODED_FIELDS.get(label)
+        if fields is None:
+            self.stdout.write(f"{name} : aucun champ d'adresse, ignoré")
+            return
+
+        missing = Q(latitude__isnull=True) | Q(longitude__isnull=True)
+        last_pk = self.state.get(label, 0)
+        total = model.objects.filter(missing, pk__gt=last_pk).count()
+        self.stdout.write(f"{name} : {total} ligne(s) sans coordonnées")
+
+        source_fields = [f for f in fields if f]
+        seen = resolved = 0
+        while True:
+            rows = list(
+                model.objects.filter(missing, pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', *source_fields)[:chunk_size]
+            )
+            if not rows:
+                break
+
+            # Une seule résolution par couple (adresse, code postal, ville)
+            groups = {}
+            for pk, *values in rows:
+                source = dict(zip(source_fields, values))
+                address, postal_code, city = (source.get(f) if f else None for f in fields)
+                key = (
+                    normalize_query(address) if address else '',
+                    normalize_postal_code(postal_code),
+                    normalize_place_name(city),
+                )
+                groups.setdefault(key, (address, postal_code, city, []))[3].append((pk, tuple(values)))
+
+            results = self._resolve(groups, pool)
+
+            # Un UPDATE par adresse source exacte, comme geocode_instance : une ligne
+            # dont l'adresse a changé pendant le géocodage n'est pas écrasée
+            updates = {}
+            for key, (_address, _postal_code, _city, members) in groups.items():
+                lat, lon = results.get(key, (None, None))
+                if lat is None or lon is None:
+                    continue
+                for pk, values in members:
+                    updates.setdefault((lat, lon, values), []).append(pk)
+
+            written = 0
+            if self.dry_run:
+                written = sum(len(pks) for pks in updates.values())
+            elif updates:
+                with transaction.atomic():
+                    for (lat, lon, values), pks in updates.items():
+                        written += model.objects.filter(
+                            missing, pk__in=pks, **dict(zip(source_fields, values))
+                        ).update(latitude=lat, longitude=lon, geohash=geohash_encode(lat, lon))
+                if written and label == 'core.user':
+                    # update() ne déclenche pas les signaux : les index des autres processus sont périmés
+                    user_location_index.invalidate()
+
+            last_pk = rows[-1][0]
+            seen += len(rows)
+            resolved += written
+            self.state[label] = last_pk
+            self._save_state()
+            self.stdout.write(
+                f"  {seen}/{total} lues, {resolved} géocodées ({len(groups)} adresse(s) distincte(s) dans ce lot)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"{name} : {resolved}/{seen} ligne(s) géocodée(s)"))
+        if resolved and not self.dry_run and label in ('core.user', 'core.session'):
+            self.rebuild_distances = True
+
+    def _resolve(self, groups, pool):
+        results = {}
+        remote = []
+        for key, (address, postal_code, city, _pks) in groups.items():
+            lat, lon = lookup_postal_code(postal_code, city)
+            if lat is not None and lon is not None:
+                results[key] = (lat, lon)
+            elif address and self.use_nominatim:
+                remote.append((key, f"{address} {postal_code or ''} {city or ''}"))
+
+        if remote:
+            for key, coords in pool.map(self._geocode_remote, remote):
+                results[key] = coords
+        return results
+
+    def _geocode_remote(self, item):
+        key, query = item
+        self.limiter.acquire()
+        try:
+            return key, nominatim_geocode(query)
+        finally:
+            # Chaque thread ouvre sa propre connexion à la base (cache de géocodage)
+            connection.close()
+
+    def _load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Fichier de reprise illisible : {e}')
+
+    def _save_state(self):
+        if not self.state_file or self.dry_run:
+            return
+        with open(self.state_file, 'w') as f:
+            json.dump(self.state, f)
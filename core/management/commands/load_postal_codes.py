@@ -0,0 +1,122 @@
+import csv
+import io
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.geocoding import normalize_place_name, normalize_postal_code
+from core.models import PostalCode
+
+DEFAULT_SOURCE_URL = (
+    'https://datanova.laposte.fr/data-fair/api/v1/datasets/laposte-hexasmal/raw'
+)
+
+
+def _normalize_header(value):
+    return normalize_place_name(value).lower().replace(' ', '_')
+
+
+def _parse_geopoint(value):
+    """Lit une coordonnée GPS "lat, lon" de la base La Poste."""
+    try:
+        lat, lon = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        return None, None
+    return lat, lon
+
+
+class Command(BaseCommand):
+    help = 'Charge le référentiel local des codes postaux (base officielle La Poste)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source', nargs='?',
+            help="Chemin ou URL du fichier CSV La Poste (séparateur ';')",
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Conserver les entrées existantes au lieu de remplacer le référentiel',
+        )
+
+    def handle(self, *args, **options):
+        source = options['source'] or getattr(settings, 'POSTAL_CODES_SOURCE_URL', DEFAULT_SOURCE_URL)
+        raw = self._read_source(source)
+
+        try:
+            text = raw.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            text = raw.decode('latin-1')
+
+        reader = csv.reader(io.StringIO(text), delimiter=';')
+        try:
+            header = [_normalize_header(h) for h in next(reader)]
+        except StopIteration:
+            raise CommandError('Fichier vide')
+
+        columns = {name: index for index, name in enumerate(header)}
+        commune_col = columns.get('nom_de_la_commune', columns.get('nom_commune'))
+        cp_col = columns.get('code_postal')
+        gps_col = columns.get('geopoint', columns.get('coordonnees_gps'))
+        if commune_col is None or cp_col is None or gps_col is None:
+            raise CommandError(f'Colonnes inattendues : {header}')
+        insee_col = columns.get('code_commune_insee')
+        line5_col = columns.get('ligne_5')
+        routing_col = columns.get('libelle_d_acheminement')
+
+        entries = {}
+        skipped = 0
+        for row in reader:
+            if len(row) <= max(commune_col, cp_col, gps_col):
+                skipped += 1
+                continue
+            code = normalize_postal_code(row[cp_col])
+            lat, lon = _parse_geopoint(row[gps_col])
+            if not code or lat is None:
+                skipped += 1
+                continue
+
+            commune = row[commune_col].strip()
+            insee = row[insee_col].strip() if insee_col is not None else ''
+            # La commune, son libellé d'acheminement et le lieu-dit éventuel
+            # (ligne 5) pointent tous vers les coordonnées de la commune.
+            names = [commune]
+            for col in (routing_col, line5_col):
+                if col is not None and col < len(row) and row[col].strip():
+                    names.append(row[col].strip())
+
+            for name in names:
+                key = (code, normalize_place_name(name))
+                if key[1] and key not in entries:
+                    entries[key] = PostalCode(
+                        code_postal=code,
+                        code_insee=insee,
+                        commune=commune,
+                        nom_normalise=key[1],
+                        latitude=lat,
+                        longitude=lon,
+                    )
+
+        with transaction.atomic():
+            if not options['keep']:
+                PostalCode.objects.all().delete()
+            PostalCode.objects.bulk_create(entries.values(), batch_size=2000, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(entries)} entrées chargées ({skipped} lignes ignorées)'
+        ))
+
+    def _read_source(self, source):
+        if source.startswith(('http://', 'https://')):
+            self.stdout.write(f'Téléchargement de {source}...')
+            try:
+                with urllib.request.urlopen(source, timeout=60) as response:
+                    return response.read()
+            except OSError as e:
+                raise CommandError(f'Téléchargement impossible : {e}')
+        try:
+            with open(source, 'rb') as f:
+                return f.read()
+        except OSError as e:
+            raise CommandError(f'Lecture impossible : {e}')
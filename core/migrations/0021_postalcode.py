@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_trainingroomcomment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostalCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code_postal', models.CharField(max_length=5, verbose_name='Code postal')),
+                ('code_insee', models.CharField(blank=True, max_length=5, verbose_name='Code INSEE')),
+                ('commune', models.CharField(max_length=255, verbose_name='Commune')),
+                ('nom_normalise', models.CharField(max_length=255, verbose_name='Nom normalisé')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'Code postal',
+                'verbose_name_plural': 'Codes postaux',
+                'ordering': ['code_postal', 'commune'],
+                'indexes': [models.Index(fields=['code_postal', 'nom_normalise'], name='core_postal_cp_nom_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:39
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0022_geocodecache'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', core.models.GeoUserManager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='formation',
+            index=models.Index(fields=['latitude', 'longitude'], name='core_formation_latlon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['latitude', 'longitude'], name='core_session_latlon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trainer',
+            index=models.Index(fields=['latitude', 'longitude'], name='core_trainer_latlon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trainingroom',
+            index=models.Index(fields=['latitude', 'longitude'], name='core_room_latlon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['latitude', 'longitude'], name='core_user_latlon_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSessionDistance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_km', models.FloatField(verbose_name='Distance (km)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_distances', to='core.session')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_distances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Distance utilisateur / session',
+                'verbose_name_plural': 'Distances utilisateur / session',
+                'indexes': [models.Index(fields=['user', 'distance_km'], name='core_usd_user_dist_idx'), models.Index(fields=['session', 'distance_km'], name='core_usd_session_dist_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'session'), name='core_usd_user_session_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_usersessiondistance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['status', 'start_date'], name='core_session_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['formation', 'start_date'], name='core_session_form_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(condition=models.Q(('is_archive', False)), fields=['start_date'], name='core_session_active_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(condition=models.Q(('is_archive', False), ('status', 'TERMINEE')), fields=['last_status_change'], name='core_session_to_archive_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:49
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_session_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.PositiveIntegerField(unique=True, verbose_name="Identifiant d'origine")),
+                ('formation_name', models.CharField(max_length=255, verbose_name='Formation')),
+                ('status', models.CharField(choices=[('NON_OUVERTE', 'Non ouverte'), ('DEMANDEE', 'Demandée'), ('OUVERTE', 'Ouverte'), ('COMPLETE', 'Complète'), ('PREPAREE', 'Préparée'), ('ENVOYEE_FORMATEUR', 'Envoyée formateur'), ('ATTENTE_RETOUR', 'En attente retour'), ('ATTENTE_TRAITEMENT_SYLVAN', 'En attente traitement Sylvan'), ('ATTENTE_TRAITEMENT_IPERIA', 'En attente traitement Ipéria'), ('ERREUR_SYLVAN', 'Erreur à traiter Sylvan'), ('ERREUR_IPERIA', 'Erreur à traiter Ipéria'), ('TERMINEE', 'Terminée')], max_length=50)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('city', models.CharField(blank=True, max_length=100, verbose_name='Ville')),
+                ('postal_code', models.CharField(blank=True, max_length=10, verbose_name='Code postal')),
+                ('archived_at', models.DateTimeField(verbose_name='Archivée le')),
+                ('moved_at', models.DateTimeField(auto_now_add=True, verbose_name='Déplacée le')),
+                ('payload', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('formation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_sessions', to='core.formation')),
+            ],
+            options={
+                'verbose_name': 'Session archivée',
+                'verbose_name_plural': 'Sessions archivées',
+                'ordering': ['-start_date'],
+                'indexes': [models.Index(fields=['start_date'], name='core_archsession_start_idx')],
+            },
+        ),
+    ]
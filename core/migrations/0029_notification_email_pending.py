@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:03
+
+import core.notification_email
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_notification_inbox_index'),
+    ]
+
+    operations = [
+        # Les notifications existantes ne sont jamais envoyées par email
+        migrations.AddField(
+            model_name='notification',
+            name='email_pending',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='email_pending',
+            field=models.BooleanField(default=core.notification_email.emails_enabled, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('email_pending', True)), fields=['user', 'created_at'], name='core_notif_email_pending_idx'),
+        ),
+    ]
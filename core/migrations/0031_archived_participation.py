@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+from core.archive import participation_rows
+
+
+def copy_participations(apps, schema_editor):
+    """Reprend les participants et souhaits des sessions déjà déplacées (instantané JSON)."""
+    ArchivedSession = apps.get_model('core', 'ArchivedSession')
+    ArchivedParticipation = apps.get_model('core', 'ArchivedParticipation')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    user_ids = set(User.objects.values_list('pk', flat=True))
+    batch = []
+    for archived in ArchivedSession.objects.only('pk', 'payload').iterator(chunk_size=500):
+        for user_id, kind, status, created_at in participation_rows(archived.payload):
+            if user_id in user_ids:
+                batch.append(ArchivedParticipation(
+                    archived_session_id=archived.pk, user_id=user_id, kind=kind, status=status,
+                    created_at=parse_datetime(created_at) if created_at else None,
+                ))
+        if len(batch) >= 1000:
+            ArchivedParticipation.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ArchivedParticipation.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_outbox_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedParticipation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('PARTICIPANT', 'Participant'), ('WISH', 'Souhait')], max_length=20, verbose_name='Type')),
+                ('status', models.CharField(blank=True, max_length=50, verbose_name='Statut du participant')),
+                ('created_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participations', to='core.archivedsession')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_participations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Participation archivée',
+                'verbose_name_plural': 'Participations archivées',
+                'indexes': [models.Index(fields=['user', 'kind'], name='core_archpart_user_kind_idx')],
+            },
+        ),
+        migrations.RunPython(copy_participations, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,147 @@
-from datetime import timedelta
+import math
+from datetime import date, timedelta
 from django.conf import settings
-from django.db import models
-from django.contrib.auth.models import AbstractUser, User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.contrib.auth.models import AbstractUser, User, UserManager
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 from django.urls import reverse
-from geopy.geocoders import Nominatim
+from . import events, geohash
+from .notification_email import emails_enabled, schedule_digest
+from .geocoding import needs_geocoding, schedule_geocoding
+from .notification_counter import invalidate_unread_count
+from .utils import EARTH_RADIUS_KM, rank_by_distance
 from django.core.exceptions import ValidationError
 
+class GeoQuerySet(models.QuerySet):
+    """Requêtes de proximité pour les modèles ayant latitude/longitude."""
+
+    def within_bounding_box(self, lat, lon, radius_km):
+        """
+        Filtre SQL sur le rectangle englobant le cercle de rayon ``radius_km``
+        (utilise l'index latitude/longitude).
+        """
+        delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        min_lat, max_lat = lat - delta_lat, lat + delta_lat
+        qs = self.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+
+        # Près des pôles, le rectangle couvre toutes les longitudes
+        if max_lat >= 90 or min_lat <= -90:
+            return qs.filter(longitude__isnull=False)
+
+        delta_lon = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+        min_lon, max_lon = lon - delta_lon, lon + delta_lon
+        if min_lon < -180:
+            return qs.filter(models.Q(longitude__gte=min_lon + 360) | models.Q(longitude__lte=max_lon))
+        if max_lon > 180:
+            return qs.filter(models.Q(longitude__gte=min_lon) | models.Q(longitude__lte=max_lon - 360))
+        return qs.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+
+    def within_radius(self, lat, lon, radius_km, limit=None):
+        """
+        Objets situés à moins de ``radius_km`` km du point, triés par distance
+        et annotés d'un attribut ``distance``. Le rectangle englobant est filtré
+        en SQL ; la distance exacte n'est calculée que sur les lignes retenues.
+        """
+        # Tri partiel (argpartition) : au-delà des ``limit`` plus proches, rien n'est retenu
+        ids, distances = rank_by_distance(self.within_bounding_box(lat, lon, radius_km), lat, lon, limit=limit)
+        keep = distances <= radius_km
+        ids, distances = ids[keep], distances[keep]
+
+        objects = self.in_bulk(ids.tolist())
+        result = []
+        for pk, distance in zip(ids.tolist(), distances.tolist()):
+            obj = objects.get(pk)
+            if obj is not None:
+                obj.distance = round(distance, 2)
+                result.append(obj)
+        return result
+
+    def near(self, lat, lon, radius_km):
+        """
+        Pré-filtre SQL par geohash : lignes dont la cellule est celle du point
+        ou l'une de ses 8 voisines, à une précision couvrant ``radius_km``.
+        """
+        precision = geohash.precision_for_radius(radius_km, lat)
+        if precision == 0:
+            return self.exclude(geohash='')
+        condition = models.Q()
+        for cell in geohash.neighbors(geohash.encode(lat, lon, precision)):
+            condition |= models.Q(geohash__startswith=cell)
+        return self.filter(condition)
+
+
+class GeoUserManager(UserManager.from_queryset(GeoQuerySet)):
+    pass
+
+
+class SessionQuerySet(GeoQuerySet):
+    def refresh_date_bounds(self):
+        """
+        Recalcule start_date / end_date des sessions du queryset à partir de
+        leurs dates, en une seule requête UPDATE. Les sessions sans date
+        gardent leurs bornes actuelles.
+        """
+        dates = SessionDate.objects.filter(session=OuterRef('pk')).order_by().values('session')
+        first = dates.annotate(first=models.Min('date')).values('first')
+        last = dates.annotate(last=models.Max('date')).values('last')
+        return self.update(
+            start_date=Coalesce(Subquery(first), F('start_date')),
+            end_date=Coalesce(Subquery(last), F('end_date')),
+        )
+
+
+class SessionDateQuerySet(models.QuerySet):
+    """
+    Opérations groupées sur les dates de session : les bornes des sessions
+    concernées sont recalculées après chaque écriture.
+    """
+
+    def refresh_session_bounds(self, session_ids):
+        """Recalcule les bornes des sessions dont les identifiants sont donnés."""
+        session_ids = {pk for pk in session_ids if pk is not None}
+        if session_ids:
+            Session.objects.filter(pk__in=session_ids).refresh_date_bounds()
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self.refresh_session_bounds(obj.session_id for obj in objs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        session_ids = {obj.session_id for obj in objs}
+        if 'session' in fields:
+            # Les sessions d'origine perdent une date
+            session_ids.update(self.filter(pk__in=[obj.pk for obj in objs]).values_list('session_id', flat=True))
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if {'date', 'session'} & set(fields):
+            self.refresh_session_bounds(session_ids)
+        return rows
+
+    def update(self, **kwargs):
+        if not {'date', 'session', 'session_id'} & set(kwargs):
+            return super().update(**kwargs)
+        session_ids = set(self.values_list('session_id', flat=True))
+        rows = super().update(**kwargs)
+        new_session = kwargs.get('session', kwargs.get('session_id'))
+        session_ids.add(getattr(new_session, 'pk', new_session))
+        self.refresh_session_bounds(session_ids)
+        return rows
+
+    def delete(self):
+        session_ids = set(self.values_list('session_id', flat=True))
+        result = super().delete()
+        self.refresh_session_bounds(session_ids)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 def user_photo_path(instance, filename):
     return f'users/{instance.id}/photo/{filename}'
 
@@ -28,6 +162,7 @@ class User(AbstractUser):
     code_postal = models.CharField(max_length=10, blank=True, null=True, verbose_name="Code postal")
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
     
     # Nouveau champ
     rpe_association = models.CharField(
@@ -39,25 +174,38 @@ class User(AbstractUser):
     rpe = models.ForeignKey('RPE', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="RPE / Association")
     other_rpe = models.CharField(max_length=255, verbose_name="Autre RPE / Association", blank=True, null=True)
 
+    objects = GeoUserManager()
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    class Meta(AbstractUser.Meta):
+        swappable = 'AUTH_USER_MODEL'
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='core_user_latlon_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Adresse lue en base, pour ne géocoder qu'après un changement d'adresse
+        instance._loaded_address = tuple(instance.__dict__.get(name) for name in ('address', 'code_postal', 'city'))
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.username:
             self.username = self.email
         
-        if self.address and (not self.latitude or not self.longitude):
-            try:
-                geolocator = Nominatim(user_agent="formation_assmat")
-                location = geolocator.geocode(self.address)
-                if location:
-                    self.latitude = location.latitude
-                    self.longitude = location.longitude
-            except Exception as e:
-                print(f"Erreur de géolocalisation : {e}")
-        
         super().save(*args, **kwargs)
 
+        # Coordonnées renseignées plus tard par une tâche Celery. Les autres
+        # enregistrements (last_login...) ne relancent pas le géocodage d'une
+        # adresse introuvable ; geocode_backfill rattrape les oublis.
+        address = (self.address, self.code_postal, self.city)
+        if address != getattr(self, '_loaded_address', None) and needs_geocoding(self):
+            schedule_geocoding(self)
+        self._loaded_address = address
+
     def __str__(self):
         if self.first_name and self.last_name:
             return f"{self.last_name} {self.first_name}"
@@ -90,6 +238,9 @@ class Formation(models.Model):
     code_postal = models.CharField(max_length=10, null=True, blank=True, verbose_name="Code postal")
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
+
+    objects = GeoQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.name} ({self.code_iperia})"
@@ -112,6 +263,9 @@ class Formation(models.Model):
         verbose_name = "Formation"
         verbose_name_plural = "Formations"
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='core_formation_latlon_idx'),
+        ]
 
 class Trainer(models.Model):
     first_name = models.CharField(max_length=100, verbose_name="Prénom", null=True, blank=True)
@@ -125,6 +279,9 @@ class Trainer(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
+
+    objects = GeoQuerySet.as_manager()
 
     def get_full_name(self):
         """Retourne le nom complet du formateur."""
@@ -140,6 +297,9 @@ class Trainer(models.Model):
         verbose_name = "Formateur"
         verbose_name_plural = "Formateurs"
         ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='core_trainer_latlon_idx'),
+        ]
 
 class TrainingRoom(models.Model):
     name = models.CharField(max_length=255, verbose_name="Nom")
@@ -150,8 +310,17 @@ class TrainingRoom(models.Model):
     equipment = models.TextField(blank=True, verbose_name="Équipement")
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
+
+    objects = GeoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='core_room_latlon_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.capacity} places)"
 class TrainingRoomComment(models.Model):
@@ -180,6 +349,12 @@ class TrainingRoomComment(models.Model):
 
     def __str__(self):
         return f"Commentaire par {self.author or 'Anonyme'} le {self.created_at.strftime('%d/%m/%Y')}"
+
+
+# Délai par défaut (~18 mois) avant l'archivage d'une session terminée
+DEFAULT_SESSION_ARCHIVE_DELAY_DAYS = 18 * 30
+
+
 class Session(models.Model):
     """Modèle représentant une session de formation."""
 
@@ -224,6 +399,7 @@ class Session(models.Model):
 
     latitude = models.FloatField(null=True, blank=True, verbose_name="Latitude")
     longitude = models.FloatField(null=True, blank=True, verbose_name="Longitude")
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -232,12 +408,58 @@ class Session(models.Model):
     # ✅ Champ pour indiquer si la session est archivée
     is_archive = models.BooleanField(default=False, verbose_name="Archivée")
 
+    objects = SessionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='core_session_latlon_idx'),
+            # Listes du personnel : sessions filtrées par statut ou formation, triées par date
+            models.Index(fields=['status', 'start_date'], name='core_session_status_start_idx'),
+            models.Index(fields=['formation', 'start_date'], name='core_session_form_start_idx'),
+            # Index partiels (ignorés par les moteurs qui ne les gèrent pas) : sessions
+            # non archivées triées par date, et sessions à archiver par la tâche planifiée
+            models.Index(
+                fields=['start_date'],
+                condition=models.Q(is_archive=False),
+                name='core_session_active_start_idx',
+            ),
+            models.Index(
+                fields=['last_status_change'],
+                condition=models.Q(status='TERMINEE', is_archive=False),
+                name='core_session_to_archive_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.formation.name} - {self.start_date or 'Date inconnue'}"
+    @classmethod
+    def archive_cutoff(cls):
+        """Date avant laquelle une session terminée doit être archivée."""
+        delay = getattr(settings, 'SESSION_ARCHIVE_DELAY_DAYS', DEFAULT_SESSION_ARCHIVE_DELAY_DAYS)
+        return timezone.now() - timedelta(days=delay)
+
+    @classmethod
+    def archive_old_sessions(cls):
+        """
+        Archive en une seule requête UPDATE les sessions terminées depuis plus
+        de ``SESSION_ARCHIVE_DELAY_DAYS`` jours, et supprime leurs distances
+        matérialisées. Retourne le nombre de sessions archivées.
+        """
+        from .distance_table import delete_session_distances
+
+        sessions = cls.objects.filter(
+            status='TERMINEE',
+            is_archive=False,
+            last_status_change__lt=cls.archive_cutoff(),
+        )
+        with transaction.atomic():
+            delete_session_distances(sessions)
+            return sessions.update(is_archive=True, updated_at=timezone.now())
+
     def check_and_archive(self):
-        """Archive la session si elle est terminée depuis plus de 18 mois."""
+        """Archive la session si elle est terminée depuis plus de SESSION_ARCHIVE_DELAY_DAYS jours."""
         if self.status == "TERMINEE" and not self.is_archive:
-            if self.last_status_change and timezone.now() - self.last_status_change > timedelta(days=18*30):  # ~18 mois
+            if self.last_status_change and self.last_status_change < self.archive_cutoff():
                 self.is_archive = True
                 self.save()
 
@@ -249,29 +471,27 @@ class Session(models.Model):
             formation_name = "Formation inconnue"
         return f"{formation_name} - {self.get_status_display()}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Statut lu en base, pour détecter un changement au moment du save()
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def save(self, *args, **kwargs):
-        # Sauvegarder d'abord la session
-        super().save(*args, **kwargs)
-        
-        # Mettre à jour start_date et end_date à partir des dates de session
-        session_dates = self.dates.all()
-        if session_dates.exists():
-            self.start_date = session_dates.earliest('date').date
-            self.end_date = session_dates.latest('date').date
-            # Sauvegarder à nouveau sans appeler la méthode save pour éviter une boucle
-            Session.objects.filter(pk=self.pk).update(
-                start_date=self.start_date, 
-                end_date=self.end_date
-            )
-        
-        # Mettre à jour last_status_change à chaque sauvegarde si le statut a changé
-        old_status = Session.objects.get(pk=self.pk).status if self.pk else None
-        if old_status and old_status != self.status:
+        # start_date / end_date sont tenues à jour par SessionDate (voir refresh_date_bounds)
+        # Mettre à jour last_status_change si le statut a changé depuis le chargement
+        update_fields = kwargs.get('update_fields')
+        loaded_status = getattr(self, '_loaded_status', None)
+        status_saved = update_fields is None or 'status' in update_fields
+        if status_saved and loaded_status is not None and loaded_status != self.status:
             self.last_status_change = timezone.now()
-            # Sauvegarder à nouveau sans appeler la méthode save pour éviter une boucle
-            Session.objects.filter(pk=self.pk).update(
-                last_status_change=self.last_status_change
-            )
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'last_status_change'}
+
+        # Une seule écriture
+        super().save(*args, **kwargs)
+        self._loaded_status = self.status
     def get_status_class(self):
         """Retourne une classe Bootstrap en fonction du statut pour styliser le bouton."""
         return {
@@ -306,9 +526,30 @@ class SessionDate(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
 
+    objects = SessionDateQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.session.formation.name} - {self.date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_session_id = instance.__dict__.get('session_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Bornes de la session (et de l'ancienne session si la date a été déplacée)
+        session_ids = {self.session_id, getattr(self, '_loaded_session_id', None)}
+        SessionDate.objects.refresh_session_bounds(session_ids)
+        self._loaded_session_id = self.session_id
+
+    def delete(self, *args, **kwargs):
+        session_id = self.session_id
+        result = super().delete(*args, **kwargs)
+        SessionDate.objects.refresh_session_bounds([session_id])
+        return result
+
 class Participant(models.Model):
     FILE_STATUS = [
         ('requested', 'Demandé'),
@@ -443,6 +684,122 @@ class ParticipantComment(models.Model):
     def __str__(self):
         return f"Commentaire de {self.author.get_full_name()} sur {self.participant}"
 
+def _after_cursor(cursor):
+    """Lignes qui suivent ``cursor`` (is_read, created_at, id) dans l'ordre décroissant."""
+    _is_read, created_at, pk = cursor
+    return models.Q(created_at__lt=created_at) | models.Q(created_at=created_at, pk__lt=pk)
+
+
+class NotificationQuerySet(models.QuerySet):
+    """
+    Opérations groupées sur les notifications : le compteur de non lues des
+    utilisateurs concernés est invalidé après chaque écriture.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        invalidate_unread_count(obj.user_id for obj in objs)
+        events.publish_notifications(objs)
+        if any(obj.email_pending for obj in objs):
+            schedule_digest()
+        return objs
+
+    def update(self, **kwargs):
+        if not {'is_read', 'user', 'user_id'} & set(kwargs):
+            return super().update(**kwargs)
+        user_ids = set(self.values_list('user_id', flat=True).distinct())
+        rows = super().update(**kwargs)
+        new_user = kwargs.get('user', kwargs.get('user_id'))
+        user_ids.add(getattr(new_user, 'pk', new_user))
+        invalidate_unread_count(user_ids)
+        return rows
+
+    def delete(self):
+        user_ids = set(self.values_list('user_id', flat=True).distinct())
+        result = super().delete()
+        invalidate_unread_count(user_ids)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def inbox_page(self, cursor=None, page_size=20):
+        """
+        Page de la boîte de réception (``self`` filtré sur un utilisateur) :
+        non lues puis lues, des plus récentes aux plus anciennes.
+
+        Pagination par clé sur (is_read, created_at, id) : ``cursor`` est le
+        triplet de la dernière ligne de la page précédente. Chaque partie est
+        lue par un parcours de l'index ``core_notif_inbox_idx``. Retourne
+        ``(notifications, curseur suivant ou None)``.
+        """
+        order = ('-created_at', '-pk')
+        # is_read__in plutôt que is_read=False : SQLite compile ce dernier en
+        # « NOT is_read », qui ne permet pas de parcourir l'index dans l'ordre.
+        notifications = []
+        if cursor is None or not cursor[0]:
+            unread = self.filter(is_read__in=[False])
+            if cursor is not None:
+                unread = unread.filter(_after_cursor(cursor))
+            notifications = list(unread.order_by(*order)[:page_size + 1])
+            read = self.filter(is_read__in=[True])
+        else:
+            read = self.filter(is_read__in=[True]).filter(_after_cursor(cursor))
+        if len(notifications) <= page_size:
+            notifications += list(read.order_by(*order)[:page_size + 1 - len(notifications)])
+
+        if len(notifications) <= page_size:
+            return notifications, None
+        notifications = notifications[:page_size]
+        last = notifications[-1]
+        return notifications, (last.is_read, last.created_at, last.pk)
+
+    def bulk_notify(self, users, type, message, related_object=None, defer=None):
+        """
+        Crée la même notification pour plusieurs utilisateurs (instances ou
+        identifiants) en un seul INSERT.
+
+        Au-delà de ``NOTIFICATION_BULK_ASYNC_THRESHOLD`` destinataires (ou si
+        ``defer`` est vrai), l'insertion est confiée à la boîte d'envoi
+        transactionnelle (outbox.py) ; la méthode retourne alors une liste vide.
+        """
+        user_ids = list(dict.fromkeys(getattr(user, 'pk', user) for user in users))
+        if not user_ids:
+            return []
+        related_object_id = related_object.pk if related_object is not None else None
+        related_object_type = related_object.__class__.__name__ if related_object is not None else None
+
+        if defer is None:
+            threshold = getattr(settings, 'NOTIFICATION_BULK_ASYNC_THRESHOLD', None)
+            defer = threshold is not None and len(user_ids) > threshold
+        if defer:
+            from .outbox import enqueue
+            enqueue('notification', {
+                'user_ids': user_ids,
+                'type': type,
+                'message': message,
+                'related_object_type': related_object_type,
+                'related_object_id': related_object_id,
+            })
+            return []
+        return self.create_for_users(user_ids, type, message, related_object_type, related_object_id)
+
+    def create_for_users(self, user_ids, type, message, related_object_type=None, related_object_id=None):
+        """Insère une notification par identifiant d'utilisateur (utilisé par ``bulk_notify``)."""
+        now = timezone.now()
+        return self.bulk_create([
+            self.model(
+                user_id=user_id,
+                type=type,
+                message=message,
+                related_object_id=related_object_id,
+                related_object_type=related_object_type,
+                created_at=now,
+            )
+            for user_id in user_ids
+        ])
+
+
 class Notification(models.Model):
     """Modèle de notification pour les utilisateurs."""
     NOTIFICATION_TYPES = (
@@ -469,11 +826,25 @@ class Notification(models.Model):
     related_object_type = models.CharField(max_length=50, null=True, blank=True)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
+    # À envoyer par email dans le prochain récapitulatif (voir notification_email.py)
+    email_pending = models.BooleanField(default=emails_enabled, editable=False)
+
+    objects = NotificationQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Notification'
         verbose_name_plural = 'Notifications'
+        indexes = [
+            # Boîte de réception paginée par clé et compteur de non lues
+            models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='core_notif_inbox_idx'),
+            # Notifications en attente d'envoi par email (peu nombreuses)
+            models.Index(
+                fields=['user', 'created_at'],
+                name='core_notif_email_pending_idx',
+                condition=models.Q(email_pending=True),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.get_type_display()} - {self.message[:50]}"
@@ -507,7 +878,19 @@ class Notification(models.Model):
         if 'notification_type' in kwargs:
             kwargs['type'] = kwargs.pop('notification_type')
         
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        invalidate_unread_count([self.user_id])
+        if adding:
+            events.publish_notifications([self])
+            if self.email_pending:
+                schedule_digest()
+
+    def delete(self, *args, **kwargs):
+        user_id = self.user_id
+        result = super().delete(*args, **kwargs)
+        invalidate_unread_count([user_id])
+        return result
 
 class RPE(models.Model):
     name = models.CharField(max_length=255, verbose_name="Nom du RPE / Association")
@@ -524,3 +907,183 @@ class RPE(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class PostalCode(models.Model):
+    """Entrée du référentiel local des codes postaux (base officielle La Poste)."""
+    code_postal = models.CharField(max_length=5, verbose_name="Code postal")
+    code_insee = models.CharField(max_length=5, blank=True, verbose_name="Code INSEE")
+    commune = models.CharField(max_length=255, verbose_name="Commune")
+    nom_normalise = models.CharField(max_length=255, verbose_name="Nom normalisé")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        verbose_name = "Code postal"
+        verbose_name_plural = "Codes postaux"
+        ordering = ['code_postal', 'commune']
+        indexes = [
+            models.Index(fields=['code_postal', 'nom_normalise'], name='core_postal_cp_nom_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.code_postal} {self.commune}"
+
+
+class GeocodeCache(models.Model):
+    """Résultat de géocodage mis en cache (latitude/longitude nulles = échec)."""
+    query = models.CharField(max_length=500, unique=True, verbose_name="Requête normalisée")
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Expire le")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Cache de géocodage"
+        verbose_name_plural = "Cache de géocodage"
+
+    def __str__(self):
+        return self.query
+
+    @property
+    def is_negative(self):
+        return self.latitude is None or self.longitude is None
+
+
+class UserSessionDistance(models.Model):
+    """
+    Distance précalculée entre un utilisateur et une session non archivée,
+    mise à jour en tâche de fond quand les coordonnées de l'un ou l'autre changent.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='session_distances')
+    session = models.ForeignKey('Session', on_delete=models.CASCADE, related_name='user_distances')
+    distance_km = models.FloatField(verbose_name="Distance (km)")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Distance utilisateur / session"
+        verbose_name_plural = "Distances utilisateur / session"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'session'], name='core_usd_user_session_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'distance_km'], name='core_usd_user_dist_idx'),
+            models.Index(fields=['session', 'distance_km'], name='core_usd_session_dist_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} ↔ {self.session} : {self.distance_km:.1f} km"
+
+
+class ArchivedSession(models.Model):
+    """
+    Session archivée déplacée hors des tables actives (stockage froid).
+
+    Les colonnes servent aux listes et exports ; le détail (dates, formateurs,
+    participants, commentaires, souhaits) est conservé dans ``payload``.
+    """
+    original_id = models.PositiveIntegerField(unique=True, verbose_name="Identifiant d'origine")
+    formation = models.ForeignKey(
+        Formation, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_sessions'
+    )
+    formation_name = models.CharField(max_length=255, verbose_name="Formation")
+    status = models.CharField(max_length=50, choices=Session.STATUS_CHOICES)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    city = models.CharField(max_length=100, blank=True, verbose_name="Ville")
+    postal_code = models.CharField(max_length=10, blank=True, verbose_name="Code postal")
+    archived_at = models.DateTimeField(verbose_name="Archivée le")
+    moved_at = models.DateTimeField(auto_now_add=True, verbose_name="Déplacée le")
+    payload = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+
+    # Compatibilité avec les listes de sessions
+    is_archive = True
+
+    class Meta:
+        verbose_name = "Session archivée"
+        verbose_name_plural = "Sessions archivées"
+        ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['start_date'], name='core_archsession_start_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.formation_name} - {self.start_date or 'Date inconnue'} (archive)"
+
+    @property
+    def session_dates(self):
+        return [date.fromisoformat(d['date']) for d in self.payload.get('dates', [])]
+
+    @property
+    def trainer_names(self):
+        return [t['name'] for t in self.payload.get('trainers', [])]
+
+
+class ArchivedParticipation(models.Model):
+    """
+    Participation ou souhait rattaché à une session passée en stockage froid,
+    conservé en ligne pour l'historique des utilisateurs (page profil).
+    """
+    KIND_PARTICIPANT = 'PARTICIPANT'
+    KIND_WISH = 'WISH'
+    KIND_CHOICES = [
+        (KIND_PARTICIPANT, 'Participant'),
+        (KIND_WISH, 'Souhait'),
+    ]
+
+    archived_session = models.ForeignKey(
+        ArchivedSession, on_delete=models.CASCADE, related_name='participations'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_participations'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Type")
+    status = models.CharField(max_length=50, blank=True, verbose_name="Statut du participant")
+    created_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Participation archivée"
+        verbose_name_plural = "Participations archivées"
+        indexes = [
+            models.Index(fields=['user', 'kind'], name='core_archpart_user_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.archived_session} ({self.get_kind_display()})"
+
+
+class OutboxMessage(models.Model):
+    """Effet de bord à exécuter après le commit (voir outbox.py)."""
+    STATUS_PENDING = 'PENDING'
+    STATUS_DONE = 'DONE'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_DONE, 'Traité'),
+        (STATUS_FAILED, 'En échec'),
+    ]
+
+    kind = models.CharField(max_length=50, verbose_name="Type")
+    payload = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    last_error = models.TextField(blank=True, default='', verbose_name="Dernière erreur")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Disponible le")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Traité le")
+
+    class Meta:
+        verbose_name = "Message de la boîte d'envoi"
+        verbose_name_plural = "Messages de la boîte d'envoi"
+        ordering = ['-created_at']
+        indexes = [
+            # Messages à traiter par le dispatcher
+            models.Index(
+                fields=['available_at'],
+                name='core_outbox_pending_idx',
+                condition=models.Q(status='PENDING'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.get_status_display()})"
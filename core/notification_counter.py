@@ -0,0 +1,38 @@
+"""
+Compteur de notifications non lues, mis en cache par utilisateur.
+
+Le compteur est calculé au premier affichage du badge puis conservé dans le
+cache Django. Toute écriture sur les notifications d'un utilisateur
+(création, y compris groupée, passage en lu, suppression) l'invalide après
+le commit de la transaction en cours : voir ``NotificationQuerySet`` et
+``Notification.save``/``delete``. Invalider plus tôt laisserait un affichage
+concurrent remettre en cache le compte d'avant le commit. La durée de vie
+``UNREAD_NOTIFICATIONS_CACHE_TTL`` ne sert que de filet de sécurité.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULT_TTL = 60 * 10
+
+
+def _key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def get_unread_count(user_id):
+    """Retourne le nombre de notifications non lues de l'utilisateur (cache, sinon COUNT)."""
+    count = cache.get(_key(user_id))
+    if count is None:
+        from .models import Notification
+        # is_read__in : recherche sur l'index (user, is_read, ...) y compris sous SQLite
+        count = Notification.objects.filter(user_id=user_id, is_read__in=[False]).count()
+        cache.set(_key(user_id), count, getattr(settings, 'UNREAD_NOTIFICATIONS_CACHE_TTL', DEFAULT_TTL))
+    return count
+
+
+def invalidate_unread_count(user_ids):
+    """Invalide, après le commit, le compteur des utilisateurs donnés (identifiants)."""
+    keys = [_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
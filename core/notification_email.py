@@ -0,0 +1,135 @@
+"""
+Envoi des notifications par email, en différé et groupé.
+
+Quand ``NOTIFICATION_EMAILS_ENABLED`` est vrai, chaque notification créée est
+marquée ``email_pending`` et la tâche ``send_notification_digests`` est
+planifiée après le commit, avec un délai ``NOTIFICATION_EMAIL_DIGEST_DELAY``
+(secondes) pendant lequel les notifications suivantes rejoignent le même
+envoi. La tâche regroupe les notifications en attente par destinataire (un
+email récapitulatif chacun) et envoie les emails par lots de
+``NOTIFICATION_EMAIL_BATCH_SIZE`` sur une seule connexion SMTP par lot.
+
+La tâche planifiée et l'exécution périodique de rattrapage peuvent tourner en
+même temps : chaque exécution réclame d'abord ses notifications (verrou
+``skip_locked`` et passage de ``email_pending`` à faux dans une transaction),
+puis envoie. Les notifications d'un email en échec sont remises en attente,
+destinataire par destinataire.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIGEST_DELAY = 5 * 60
+DEFAULT_BATCH_SIZE = 50
+# Notifications en attente traitées au plus par exécution de la tâche
+MAX_PENDING_PER_RUN = 5000
+_SCHEDULED_KEY = 'notifications:email-digest:scheduled'
+
+
+def emails_enabled():
+    """Valeur par défaut de ``Notification.email_pending``."""
+    return getattr(settings, 'NOTIFICATION_EMAILS_ENABLED', False)
+
+
+def schedule_digest():
+    """Planifie, après le commit, un envoi groupé (une seule tâche par fenêtre de délai)."""
+    delay = getattr(settings, 'NOTIFICATION_EMAIL_DIGEST_DELAY', DEFAULT_DIGEST_DELAY)
+
+    def enqueue():
+        from .tasks import send_notification_digests
+        # La clé expire avec la fenêtre : la tâche planifiée couvre tout ce qui arrive d'ici là
+        if not cache.add(_SCHEDULED_KEY, True, delay):
+            return
+        try:
+            send_notification_digests.apply_async(countdown=delay, retry=False)
+        except Exception as e:
+            cache.delete(_SCHEDULED_KEY)
+            logger.error(f"Impossible de planifier l'envoi des notifications par email : {e}")
+
+    transaction.on_commit(enqueue)
+
+
+def build_digest(user, notifications):
+    """Construit l'email récapitulatif des ``notifications`` d'un utilisateur."""
+    context = {'user': user, 'notifications': notifications}
+    if len(notifications) == 1:
+        subject = notifications[0].get_type_display()
+    else:
+        subject = f"{len(notifications)} nouvelles notifications"
+    return EmailMessage(
+        subject=f"[Formation AssMat] {subject}",
+        body=render_to_string('core/emails/notification_digest.txt', context),
+        to=[user.email],
+    )
+
+
+def _claim_pending():
+    """
+    Réclame les notifications en attente pour l'exécution courante : elles
+    quittent l'attente dans la transaction qui les lit, une exécution
+    concurrente ne peut donc pas les envoyer à son tour.
+    """
+    from .models import Notification
+
+    with transaction.atomic():
+        pending = Notification.objects.filter(email_pending=True).order_by('user_id', 'created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            # Les lignes réclamées par une autre exécution sont ignorées sans attente
+            pending = pending.select_for_update(skip_locked=True)
+        ids = list(pending.values_list('pk', flat=True)[:MAX_PENDING_PER_RUN])
+        Notification.objects.filter(pk__in=ids).update(email_pending=False)
+    return list(
+        Notification.objects.filter(pk__in=ids).select_related('user').order_by('user_id', 'created_at')
+    )
+
+
+def send_digests(batch_size=None):
+    """
+    Envoie les notifications en attente, un email par destinataire, par lots
+    sur une connexion SMTP réutilisée. Les notifications sont réclamées avant
+    l'envoi ; celles d'un email en échec sont remises en attente.
+    Retourne le nombre d'emails envoyés.
+    """
+    from .models import Notification
+
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_EMAIL_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    pending = _claim_pending()
+
+    digests = []
+    by_user = {}
+    for notification in pending:
+        by_user.setdefault(notification.user_id, []).append(notification)
+    for notifications in by_user.values():
+        user = notifications[0].user
+        # Sans destinataire valide, la réclamation suffit à sortir les notifications de l'attente
+        if user.email and user.is_active:
+            digests.append((build_digest(user, notifications), [n.pk for n in notifications]))
+
+    sent, failed = 0, []
+    for start in range(0, len(digests), batch_size):
+        batch = digests[start:start + batch_size]
+        smtp = get_connection()
+        try:
+            smtp.open()
+        except Exception as e:
+            logger.error(f"Échec de la connexion pour un lot de {len(batch)} email(s) de notification : {e}")
+            failed += [pk for _message, ids in batch for pk in ids]
+            continue
+        try:
+            for message, ids in batch:
+                try:
+                    sent += smtp.send_messages([message]) or 0
+                except Exception as e:
+                    logger.error(f"Échec de l'envoi de l'email de notification à {message.to[0]} : {e}")
+                    failed += ids
+        finally:
+            smtp.close()
+    if failed:
+        Notification.objects.filter(pk__in=failed).update(email_pending=True)
+    return sent
@@ -0,0 +1,69 @@
+"""
+Rétention et compactage des notifications.
+
+Deux passes, chacune par lots bornés de ``BATCH_SIZE`` lignes :
+
+- compactage : les notifications ``session_status_update`` répétées pour un
+  même utilisateur et une même session sont réduites à la plus récente, qui
+  porte le dernier statut ;
+- rétention : les notifications lues plus anciennes que
+  ``NOTIFICATION_RETENTION_DAYS`` jours sont supprimées.
+
+Les suppressions passent par ``NotificationQuerySet.delete`` : le compteur de
+non lues des utilisateurs concernés est invalidé.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+DEFAULT_RETENTION_DAYS = 180
+BATCH_SIZE = 1000
+COLLAPSED_TYPES = ['session_status_update']
+
+
+def retention_cutoff():
+    delay = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    return timezone.now() - timedelta(days=delay)
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Supprime les lignes de ``queryset`` par lots d'identifiants ; retourne le nombre supprimé."""
+    from .models import Notification
+
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Notification.objects.filter(pk__in=ids).delete()[0]
+
+
+def collapse_repeated_notifications(batch_size=BATCH_SIZE):
+    """Ne conserve que la plus récente notification répétée par (type, utilisateur, session)."""
+    from .models import Notification
+
+    repeated = Notification.objects.filter(
+        type__in=COLLAPSED_TYPES, related_object_type='Session', related_object_id__isnull=False,
+    )
+    latest = repeated.order_by().values('type', 'user_id', 'related_object_id').annotate(
+        latest=Max('pk')
+    ).values('latest')
+    return _delete_in_batches(repeated.exclude(pk__in=latest), batch_size)
+
+
+def delete_expired_notifications(batch_size=BATCH_SIZE):
+    """Supprime les notifications lues plus anciennes que le délai de rétention."""
+    from .models import Notification
+
+    expired = Notification.objects.filter(is_read__in=[True], created_at__lt=retention_cutoff())
+    return _delete_in_batches(expired, batch_size)
+
+
+def compact_notifications(batch_size=BATCH_SIZE):
+    """Applique le compactage puis la rétention ; retourne le nombre de lignes supprimées par passe."""
+    return {
+        'collapsed': collapse_repeated_notifications(batch_size),
+        'expired': delete_expired_notifications(batch_size),
+    }
@@ -0,0 +1,159 @@
+"""
+Boîte d'envoi transactionnelle (« outbox ») des effets de bord.
+
+Les effets de bord trop lourds pour la requête (notifications de masse
+au-delà de ``NOTIFICATION_BULK_ASYNC_THRESHOLD``, planification du géocodage)
+ne sont pas exécutés pendant celle-ci : ``enqueue`` écrit une ligne
+``OutboxMessage`` dans la même transaction que la modification métier. Un
+rollback l'annule donc avec le reste, et un commit la rend durable.
+
+Les notifications d'un seul destinataire restent insérées dans la requête :
+elles sont déjà atomiques avec la modification, et le processus web diffuse
+ainsi l'évènement en direct et invalide le compteur de non-lues de son propre
+cache (``InProcessBroker`` et ``LocMemCache`` sont propres à chaque processus).
+
+Après le commit, la tâche ``dispatch_outbox`` est déclenchée (et une entrée
+beat la rattrape si le broker était indisponible). ``dispatch`` traite les
+messages par lots, chacun dans un point de sauvegarde : le message n'est
+marqué traité que si son effet a réussi, sinon il est reprogrammé avec un
+délai exponentiel, puis marqué en échec après ``MAX_ATTEMPTS`` tentatives.
+
+Les effets en base (notifications) sont écrits dans la transaction qui marque
+le message traité : ils sont appliqués exactement une fois, de même que le
+drapeau ``Notification.email_pending``. L'email lui-même n'est pas couvert :
+``send_digests`` réclame les notifications avant l'envoi et remet en attente
+celles d'un email refusé, mais un worker interrompu entre la réclamation et
+l'envoi perd l'email (au plus une fois). Le géocodage est confié à Celery :
+``geocode_instance`` peut être planifiée deux fois si le lot échoue après
+coup, mais la tâche est idempotente.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+# Délai avant la n-ième nouvelle tentative : RETRY_BASE_DELAY * 2 ** (n - 1), borné
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 60 * 60
+DEFAULT_RETENTION_DAYS = 7
+
+
+def _deliver_notification(message):
+    from .models import Notification
+
+    payload = message.payload
+    Notification.objects.create_for_users(
+        payload['user_ids'],
+        payload['type'],
+        payload['message'],
+        payload.get('related_object_type'),
+        payload.get('related_object_id'),
+    )
+
+
+def _enqueue_geocoding(message):
+    from .models import OutboxMessage
+    from .tasks import geocode_instance
+
+    label, pk = message.payload['model_label'], message.payload['pk']
+    # Fusion en base, partagée par tous les processus : une demande plus récente
+    # pour la même ligne, encore en attente, planifiera la tâche à sa place
+    if OutboxMessage.objects.filter(
+        kind='geocode', status=OutboxMessage.STATUS_PENDING, pk__gt=message.pk,
+        payload__model_label=label, payload__pk=pk,
+    ).exists():
+        return
+    # Une erreur du broker fait échouer le message, qui sera retenté
+    geocode_instance.apply_async((label, pk), retry=False)
+
+
+HANDLERS = {
+    'notification': _deliver_notification,
+    'geocode': _enqueue_geocoding,
+}
+
+
+def _kick():
+    from .tasks import dispatch_outbox
+
+    try:
+        dispatch_outbox.apply_async(retry=False)
+    except Exception as e:
+        # Les messages restent en base : l'entrée beat les traitera
+        logger.warning(f"Impossible de déclencher la boîte d'envoi : {e}")
+
+
+def enqueue(kind, payload):
+    """Écrit un message dans la transaction en cours et déclenche son traitement après le commit."""
+    from .models import OutboxMessage
+
+    if kind not in HANDLERS:
+        raise ValueError(f"Type de message inconnu : {kind}")
+    message = OutboxMessage.objects.create(kind=kind, payload=payload)
+    transaction.on_commit(_kick)
+    return message
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY))
+
+
+def dispatch(batch_size=BATCH_SIZE):
+    """
+    Traite un lot de messages disponibles, dans l'ordre d'écriture.
+    Retourne ``(traités, en erreur)`` ; un lot plein indique qu'il en reste.
+    """
+    from .models import OutboxMessage
+
+    processed = failed = 0
+    with transaction.atomic():
+        pending = OutboxMessage.objects.filter(
+            status=OutboxMessage.STATUS_PENDING, available_at__lte=timezone.now()
+        ).order_by('pk')
+        if connection.features.has_select_for_update_skip_locked:
+            # Plusieurs workers se partagent les messages sans se bloquer
+            pending = pending.select_for_update(skip_locked=True)
+        messages = list(pending[:batch_size])
+
+        for message in messages:
+            now = timezone.now()
+            try:
+                with transaction.atomic():
+                    HANDLERS[message.kind](message)
+            except Exception as e:
+                failed += 1
+                message.attempts += 1
+                message.last_error = f"{type(e).__name__}: {e}"
+                if message.attempts >= MAX_ATTEMPTS:
+                    message.status = OutboxMessage.STATUS_FAILED
+                    message.processed_at = now
+                    logger.error(f"Message #{message.pk} ({message.kind}) abandonné : {message.last_error}")
+                else:
+                    message.available_at = now + _retry_delay(message.attempts)
+                    logger.warning(f"Message #{message.pk} ({message.kind}) en erreur, nouvelle tentative : {e}")
+            else:
+                processed += 1
+                message.status = OutboxMessage.STATUS_DONE
+                message.processed_at = now
+
+        OutboxMessage.objects.bulk_update(
+            messages, ['status', 'attempts', 'last_error', 'available_at', 'processed_at']
+        )
+    return processed, failed
+
+
+def purge_processed():
+    """Supprime les messages traités depuis plus de ``OUTBOX_RETENTION_DAYS`` jours (les échecs sont conservés)."""
+    from .models import OutboxMessage
+
+    delay = getattr(settings, 'OUTBOX_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    deleted, _ = OutboxMessage.objects.filter(
+        status=OutboxMessage.STATUS_DONE, processed_at__lt=timezone.now() - timedelta(days=delay)
+    ).delete()
+    return deleted
@@ -0,0 +1,258 @@
+"""
+Création de sessions en masse (API JSON et import de tableur).
+
+Chaque ligne décrit une session : formation, statut, dates et salles,
+formateurs, adresse. Toutes les références sont validées contre des tables de
+correspondance chargées en une requête par modèle, chaque couple (code
+postal, ville) n'est géocodé qu'une fois, puis les sessions, leurs dates et
+leurs formateurs sont insérés par ``bulk_create`` dans une seule transaction.
+``bulk_create`` n'émettant pas ``post_save``, le signal est envoyé ensuite pour
+chaque session créée (diffusion en direct, table des distances).
+
+Le résultat est un rapport ligne par ligne : identifiant de la session créée
+ou liste des erreurs. Les lignes en erreur ne sont pas insérées.
+"""
+from datetime import date, datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from openpyxl import load_workbook
+
+from .geocoding import needs_geocoding, schedule_geocoding
+from .geohash import encode as geohash_encode
+from .models import Formation, Session, SessionDate, Trainer, TrainingRoom
+from .utils import get_coordinates_from_postal_code
+
+# Colonnes du modèle de tableur, dans l'ordre
+SPREADSHEET_COLUMNS = [
+    ('formation', 'Formation (id ou code IPERIA)'),
+    ('status', 'Statut'),
+    ('dates', 'Dates (séparées par ;)'),
+    ('rooms', 'Salles (id ou nom, une par date ou une pour toutes)'),
+    ('trainers', 'Formateurs (id ou email, séparés par ;)'),
+    ('address', 'Adresse'),
+    ('city', 'Ville'),
+    ('postal_code', 'Code postal'),
+    ('iperia_opening', 'Ouverture IPERIA'),
+    ('iperia_deadline', 'Clôture IPERIA'),
+]
+
+STATUS_CODES = dict(Session.STATUS_CHOICES)
+STATUS_BY_LABEL = {label.lower(): code for code, label in Session.STATUS_CHOICES}
+
+
+def parse_day(value):
+    """Lit une date ISO (AAAA-MM-JJ), française (JJ/MM/AAAA) ou une cellule date."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Date invalide : {value}")
+
+
+def _split(value):
+    """Découpe une cellule ou un champ multi-valeurs (liste, ou texte séparé par ;)."""
+    if value is None or value == '':
+        return []
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if v not in (None, '')]
+    if isinstance(value, (date, datetime, int, float)):
+        return [value]
+    return [part.strip() for part in str(value).split(';') if part.strip()]
+
+
+def _key(value):
+    """Clé de recherche : identifiant numérique ou texte normalisé."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    # isdecimal et non isdigit : '²' est un chiffre pour isdigit mais int() le refuse
+    return int(value) if value.isdecimal() else value.lower()
+
+
+class _Lookups:
+    """Tables de correspondance préchargées (une requête par modèle)."""
+
+    def __init__(self, rows):
+        formation_keys, room_keys, trainer_keys = set(), set(), set()
+        for row in rows:
+            if row.get('formation') not in (None, ''):
+                formation_keys.add(_key(row['formation']))
+            room_keys.update(_key(v) for v in _split(row.get('rooms')))
+            trainer_keys.update(_key(v) for v in _split(row.get('trainers')))
+
+        self.formations = self._load(Formation, formation_keys, 'code_iperia')
+        self.rooms = self._load(TrainingRoom, room_keys, 'name')
+        self.trainers = self._load(Trainer, trainer_keys, 'email')
+
+    @staticmethod
+    def _load(model, keys, text_field):
+        ids = [k for k in keys if isinstance(k, int)]
+        texts = [k for k in keys if isinstance(k, str)]
+        condition = Q(pk__in=ids)
+        for text in texts:
+            condition |= Q(**{f'{text_field}__iexact': text})
+        mapping = {}
+        if not keys:
+            return mapping
+        for obj in model.objects.filter(condition):
+            mapping[obj.pk] = obj
+            text = getattr(obj, text_field)
+            if text:
+                # Le premier objet trouvé l'emporte en cas d'homonymes
+                mapping.setdefault(text.lower(), obj)
+        return mapping
+
+
+def _validate(row, lookups):
+    """Retourne (session, dates [(jour, salle)], formateurs, erreurs) pour une ligne."""
+    errors = []
+
+    formation = lookups.formations.get(_key(row['formation'])) if row.get('formation') not in (None, '') else None
+    if formation is None:
+        errors.append(f"Formation introuvable : {row.get('formation')!r}")
+
+    status = str(row.get('status') or 'NON_OUVERTE').strip()
+    status = status if status in STATUS_CODES else STATUS_BY_LABEL.get(status.lower())
+    if status is None:
+        errors.append(f"Statut invalide : {row.get('status')!r}")
+
+    days = []
+    for value in _split(row.get('dates')):
+        try:
+            days.append(parse_day(value))
+        except ValueError as e:
+            errors.append(str(e))
+
+    room_values = _split(row.get('rooms'))
+    if len(room_values) == 1 and len(days) > 1:
+        room_values = room_values * len(days)
+    elif room_values and len(room_values) != len(days):
+        errors.append(f"{len(room_values)} salle(s) pour {len(days)} date(s)")
+    rooms = []
+    for value in room_values:
+        room = lookups.rooms.get(_key(value))
+        if room is None:
+            errors.append(f"Salle introuvable : {value!r}")
+        rooms.append(room)
+
+    trainers = []
+    for value in _split(row.get('trainers')):
+        trainer = lookups.trainers.get(_key(value))
+        if trainer is None:
+            errors.append(f"Formateur introuvable : {value!r}")
+        elif trainer not in trainers:
+            trainers.append(trainer)
+
+    iperia = {}
+    for field, name in (('iperia_opening', 'iperia_opening_date'), ('iperia_deadline', 'iperia_deadline')):
+        value = row.get(field)
+        if value in (None, ''):
+            iperia[name] = None
+            continue
+        try:
+            iperia[name] = parse_day(value)
+        except ValueError as e:
+            errors.append(str(e))
+
+    if errors:
+        return None, [], [], errors
+
+    session = Session(
+        formation=formation,
+        status=status,
+        address=str(row.get('address') or '').strip() or None,
+        city=str(row.get('city') or '').strip() or None,
+        postal_code=str(row.get('postal_code') or '').strip() or None,
+        start_date=min(days) if days else None,
+        end_date=max(days) if days else None,
+        **iperia,
+    )
+    return session, list(zip(days, rooms or [None] * len(days))), trainers, []
+
+
+def emit_created_sessions(sessions):
+    """
+    ``bulk_create`` ne déclenche pas les signaux : émet ``post_save`` pour chaque
+    session créée, comme ``Session.save`` (diffusion au personnel, distances si
+    la session est déjà localisée), puis planifie le géocodage des adresses.
+    """
+    for session in sessions:
+        session._coordinates_changed = session.latitude is not None
+        post_save.send(
+            sender=Session, instance=session, created=True, raw=False,
+            using=session._state.db, update_fields=None,
+        )
+        if needs_geocoding(session):
+            schedule_geocoding(session)
+
+
+def create_sessions(rows):
+    """
+    Valide et crée les sessions décrites par ``rows`` (liste de dict).
+    Retourne le rapport : une entrée par ligne, dans l'ordre.
+    """
+    lookups = _Lookups(rows)
+    report = []
+    valid = []
+    for index, row in enumerate(rows, start=1):
+        session, dates, trainers, errors = _validate(row, lookups)
+        if errors:
+            report.append({'row': index, 'success': False, 'errors': errors})
+        else:
+            entry = {'row': index, 'success': True}
+            report.append(entry)
+            valid.append((entry, session, dates, trainers))
+
+    # Un seul géocodage par couple (code postal, ville)
+    coordinates = {}
+    for _entry, session, _dates, _trainers in valid:
+        key = (session.postal_code, session.city)
+        if session.postal_code and key not in coordinates:
+            coordinates[key] = get_coordinates_from_postal_code(*key)
+        session.latitude, session.longitude = coordinates.get(key, (None, None))
+        session.geohash = geohash_encode(session.latitude, session.longitude)
+
+    if not valid:
+        return report
+
+    with transaction.atomic():
+        sessions = Session.objects.bulk_create([session for _e, session, _d, _t in valid])
+        SessionDate.objects.bulk_create([
+            SessionDate(session=session, date=day, location=room)
+            for session, (_e, _s, dates, _t) in zip(sessions, valid)
+            for day, room in dates
+        ])
+        Through = Session.trainers.through
+        Through.objects.bulk_create([
+            Through(session_id=session.pk, trainer_id=trainer.pk)
+            for session, (_e, _s, _d, trainers) in zip(sessions, valid)
+            for trainer in trainers
+        ])
+
+        emit_created_sessions(sessions)
+
+    for (entry, *_rest), session in zip(valid, sessions):
+        entry['session_id'] = session.pk
+    return report
+
+
+def read_spreadsheet(file):
+    """Lit un classeur au format de ``SPREADSHEET_COLUMNS`` et retourne ses lignes (dict)."""
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    sheet = workbook.active
+    fields = [name for name, _label in SPREADSHEET_COLUMNS]
+    rows = []
+    for values in sheet.iter_rows(min_row=2, values_only=True):
+        if not any(v not in (None, '') for v in values):
+            continue
+        rows.append(dict(zip(fields, values)))
+    workbook.close()
+    return rows
@@ -0,0 +1,170 @@
+"""
+Génération de sessions récurrentes par clonage d'une session existante.
+
+Une règle de récurrence est soit ``{"every_months": 3, "count": 4}`` (les
+débuts sont décalés de N mois puis ramenés au même jour de la semaine que la
+session source), soit ``{"start_dates": ["2026-01-05", ...]}``. Chaque clone
+reprend la formation, l'adresse, les formateurs et les salles de la source ;
+ses dates sont décalées du même nombre de jours que son début.
+
+Les conflits (salle ou formateur déjà occupé le même jour par une autre
+session non archivée, ou par un autre clone) sont recherchés en deux requêtes
+dans la transaction, avant toute insertion. Sauf ``allow_conflicts``, aucune
+session n'est créée s'il y en a.
+"""
+import calendar
+from datetime import timedelta
+
+from django.db import transaction
+
+from .models import Session, SessionDate
+from .session_import import emit_created_sessions, parse_day
+
+MAX_OCCURRENCES = 52
+
+
+class RecurrenceError(ValueError):
+    """Règle de récurrence invalide ou inapplicable à la session source."""
+
+
+def add_months(day, months):
+    """Ajoute ``months`` mois à ``day`` (le jour est borné à la fin du mois)."""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def same_weekday(day, weekday):
+    """Retourne le jour de la semaine ``weekday`` le plus proche de ``day`` (±3 jours)."""
+    shift = (weekday - day.weekday() + 3) % 7 - 3
+    return day + timedelta(days=shift)
+
+
+def occurrence_starts(source_start, rule):
+    """Calcule les dates de début des clones à partir de la règle."""
+    if not isinstance(rule, dict):
+        raise RecurrenceError("La règle de récurrence doit être un objet.")
+
+    if rule.get('start_dates'):
+        try:
+            starts = sorted({parse_day(value) for value in rule['start_dates']})
+        except ValueError as e:
+            raise RecurrenceError(str(e))
+    else:
+        try:
+            every = int(rule.get('every_months') or 0)
+            count = int(rule.get('count') or 0)
+        except (TypeError, ValueError):
+            raise RecurrenceError("« every_months » et « count » doivent être des entiers.")
+        if every < 1 or count < 1:
+            raise RecurrenceError("Indiquez « every_months » et « count » (positifs) ou « start_dates ».")
+        starts = [
+            same_weekday(add_months(source_start, every * n), source_start.weekday())
+            for n in range(1, count + 1)
+        ]
+
+    if len(starts) > MAX_OCCURRENCES:
+        raise RecurrenceError(f"Au plus {MAX_OCCURRENCES} occurrences par génération.")
+    return starts
+
+
+def _find_conflicts(planned, trainer_ids):
+    """
+    Recherche les conflits de salle et de formateur pour ``planned`` :
+    liste de (début, [(jour, room_id)]) par clone.
+    """
+    room_ids = {room_id for _start, dates in planned for _day, room_id in dates if room_id}
+    occurrence_by_day = {}
+    rooms_used = set()
+    conflicts = []
+
+    # Conflits entre clones : même jour (formateurs communs) ou même salle le même jour
+    for start, dates in planned:
+        for day, room_id in dates:
+            other = occurrence_by_day.setdefault(day, start)
+            if other == start:
+                rooms_used.add((day, room_id))
+                continue
+            if trainer_ids:
+                conflicts.append({'type': 'trainer', 'date': day, 'occurrence': start, 'other_occurrence': other})
+            if room_id and (day, room_id) in rooms_used:
+                conflicts.append({
+                    'type': 'room', 'date': day, 'room_id': room_id, 'occurrence': start, 'other_occurrence': other,
+                })
+            rooms_used.add((day, room_id))
+
+    existing = SessionDate.objects.filter(date__in=occurrence_by_day, session__is_archive=False)
+    if room_ids:
+        for row in existing.filter(location_id__in=room_ids).values('date', 'location_id', 'session_id'):
+            if (row['date'], row['location_id']) in rooms_used:
+                conflicts.append({
+                    'type': 'room', 'date': row['date'], 'room_id': row['location_id'],
+                    'occurrence': occurrence_by_day[row['date']], 'session_id': row['session_id'],
+                })
+    if trainer_ids:
+        rows = existing.filter(session__trainers__in=trainer_ids) \
+            .values('date', 'session_id', 'session__trainers').distinct()
+        for row in rows:
+            conflicts.append({
+                'type': 'trainer', 'date': row['date'], 'trainer_id': row['session__trainers'],
+                'occurrence': occurrence_by_day[row['date']], 'session_id': row['session_id'],
+            })
+    return sorted(conflicts, key=lambda c: (c['date'], c['type']))
+
+
+def clone_session(source, rule, allow_conflicts=False):
+    """
+    Crée les clones de ``source`` selon ``rule``, en une transaction.
+    Retourne ``(sessions créées, conflits)`` ; en cas de conflit non autorisé,
+    rien n'est créé et la liste des sessions est vide.
+    """
+    source_dates = list(source.dates.order_by('date').values_list('date', 'location_id'))
+    if not source_dates:
+        raise RecurrenceError("La session source n'a aucune date à reproduire.")
+    source_start = source_dates[0][0]
+    trainer_ids = list(source.trainers.values_list('pk', flat=True))
+
+    planned = []
+    for start in occurrence_starts(source_start, rule):
+        offset = start - source_start
+        planned.append((start, [(day + offset, room_id) for day, room_id in source_dates]))
+
+    def shifted(day, offset):
+        return day + offset if day else None
+
+    with transaction.atomic():
+        conflicts = _find_conflicts(planned, trainer_ids)
+        if conflicts and not allow_conflicts:
+            return [], conflicts
+
+        sessions = Session.objects.bulk_create([
+            Session(
+                formation_id=source.formation_id,
+                address=source.address,
+                city=source.city,
+                postal_code=source.postal_code,
+                latitude=source.latitude,
+                longitude=source.longitude,
+                geohash=source.geohash,
+                start_date=dates[0][0],
+                end_date=dates[-1][0],
+                iperia_opening_date=shifted(source.iperia_opening_date, start - source_start),
+                iperia_deadline=shifted(source.iperia_deadline, start - source_start),
+            )
+            for start, dates in planned
+        ])
+        SessionDate.objects.bulk_create([
+            SessionDate(session=session, date=day, location_id=room_id)
+            for session, (_start, dates) in zip(sessions, planned)
+            for day, room_id in dates
+        ])
+        Through = Session.trainers.through
+        Through.objects.bulk_create([
+            Through(session_id=session.pk, trainer_id=trainer_id)
+            for session in sessions
+            for trainer_id in trainer_ids
+        ])
+
+        emit_created_sessions(sessions)
+
+    return sessions, conflicts
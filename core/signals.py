@@ -1,15 +1,80 @@
-from django.db.models.signals import pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import TrainingRoom
-from .utils import get_coordinates_from_address
+from .models import Formation, Session, SessionParticipant, Trainer, TrainingRoom, User
+from . import events
+from .distance_table import delete_session_distances, schedule_distance_refresh
+from .geocoding import needs_geocoding, schedule_geocoding
+from .geohash import encode as geohash_encode
+from .location_index import user_location_index
 
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Formation)
+@receiver(pre_save, sender=Session)
+@receiver(pre_save, sender=Trainer)
 @receiver(pre_save, sender=TrainingRoom)
+def update_geohash(sender, instance, **kwargs):
+    """Maintient le geohash à jour avec les coordonnées."""
+    cell = geohash_encode(instance.latitude, instance.longitude)
+    # Le geohash chargé reflète les coordonnées en base : s'il change, elles ont bougé
+    instance._coordinates_changed = cell != instance.geohash
+    instance.geohash = cell
+
+@receiver(post_save, sender=TrainingRoom)
 def fill_coordinates(sender, instance, **kwargs):
-    if (not instance.latitude or not instance.longitude) and instance.address:
-        lat, lon = get_coordinates_from_address(
-            instance.address,
-            postal_code=instance.postal_code,
-            city=instance.city
-        )
-        instance.latitude = lat
-        instance.longitude = lon
+    """Planifie le géocodage de la salle si ses coordonnées manquent."""
+    if needs_geocoding(instance):
+        schedule_geocoding(instance)
+
+@receiver(post_save, sender=User)
+def update_user_location_index(sender, instance, **kwargs):
+    """Répercute les coordonnées de l'utilisateur dans l'index spatial."""
+    if getattr(instance, '_coordinates_changed', False):
+        user_location_index.update(instance.pk, instance.latitude, instance.longitude)
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Session)
+def refresh_session_distances(sender, instance, **kwargs):
+    """Recalcule en tâche de fond les distances utilisateur / session si les coordonnées ont changé."""
+    if getattr(instance, '_coordinates_changed', False):
+        schedule_distance_refresh(instance)
+
+@receiver(post_save, sender=Session)
+def drop_archived_session_distances(sender, instance, **kwargs):
+    """Une session archivée sort de la table des distances (voir aussi archive_old_sessions)."""
+    if instance.is_archive:
+        delete_session_distances([instance.pk])
+
+@receiver(post_delete, sender=User)
+def remove_user_from_location_index(sender, instance, **kwargs):
+    user_location_index.remove(instance.pk)
+
+@receiver(post_save, sender=Session)
+def publish_session_change(sender, instance, created, **kwargs):
+    """Diffuse en direct au personnel le statut de la session enregistrée."""
+    events.publish_on_commit(events.STAFF_CHANNEL, 'session', {
+        'session_id': instance.pk,
+        'created': created,
+        'status': instance.status,
+        'status_display': instance.get_status_display(),
+        'status_class': instance.get_status_class(),
+    })
+
+@receiver(post_save, sender=SessionParticipant)
+def publish_participant_change(sender, instance, created, **kwargs):
+    """Diffuse en direct au personnel le statut du participant enregistré."""
+    events.publish_on_commit(events.STAFF_CHANNEL, 'participant', {
+        'participant_id': instance.pk,
+        'session_id': instance.session_id,
+        'created': created,
+        'status': instance.status,
+        'status_display': instance.get_status_display(),
+        'status_class': instance.get_status_badge_class(),
+    })
+
+@receiver(post_delete, sender=SessionParticipant)
+def publish_participant_removal(sender, instance, **kwargs):
+    """Signale au personnel le retrait d'un participant."""
+    events.publish_on_commit(events.STAFF_CHANNEL, 'participant_removed', {
+        'participant_id': instance.pk,
+        'session_id': instance.session_id,
+    })
@@ -1,6 +1,17 @@
 from celery import shared_task
+from django.apps import apps
 from django.utils import timezone
+from .archive import move_sessions_to_cold_storage
+from .distance_table import rebuild_distances, refresh_session_distances, refresh_user_distances
+from .geocoding import (
+    GEOCODED_FIELDS, GeocodingError, geocode_address, get_geocoding_source, needs_geocoding,
+)
+from .geohash import encode as geohash_encode
+from .location_index import user_location_index
 from .models import Session
+from .notification_email import send_digests
+from .notification_retention import compact_notifications
+from .outbox import BATCH_SIZE as OUTBOX_BATCH_SIZE, dispatch, purge_processed
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,3 +26,108 @@ def archive_old_sessions():
     except Exception as e:
         logger.error(f"Erreur lors de l'archivage des sessions : {str(e)}")
         raise
+
+
+@shared_task
+def move_archived_sessions_to_cold_storage():
+    """Tâche périodique : déplace les sessions archivées anciennes vers le stockage froid."""
+    count = move_sessions_to_cold_storage()
+    logger.info(f"{count} session(s) archivée(s) déplacée(s) vers le stockage froid")
+    return count
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(GeocodingError,),
+    retry_backoff=30,
+    retry_backoff_max=60 * 60,
+    retry_jitter=True,
+    max_retries=6,
+    ignore_result=True,
+)
+def geocode_instance(self, model_label, pk):
+    """Géocode une ligne en arrière-plan et enregistre ses coordonnées."""
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_geocoding(instance):
+        return None
+
+    address, postal_code, city = get_geocoding_source(instance)
+    lat, lon = geocode_address(address, postal_code, city, raise_errors=True)
+    if lat is None or lon is None:
+        logger.info(f"Aucune coordonnée trouvée pour {model_label} #{pk}")
+        return None
+
+    # update() plutôt que save() : pas de signaux ni de nouveau géocodage, et
+    # on n'écrase pas une adresse modifiée entre-temps.
+    source_filter = {
+        name: value
+        for name, value in zip(GEOCODED_FIELDS[model_label], (address, postal_code, city))
+        if name
+    }
+    updated = model.objects.filter(pk=pk, **source_filter).update(
+        latitude=lat, longitude=lon, geohash=geohash_encode(lat, lon)
+    )
+    if updated and model_label == 'core.user':
+        # Signale le changement aux processus web (version partagée dans le cache)
+        user_location_index.update(pk, lat, lon)
+    if updated and model_label in ('core.user', 'core.session'):
+        refresh_distances.delay(model_label.split('.')[1], pk)
+    return updated
+
+
+@shared_task(ignore_result=True)
+def refresh_distances(kind, pk):
+    """Recalcule les distances matérialisées d'un utilisateur ou d'une session."""
+    if kind == 'session':
+        count = refresh_session_distances(pk)
+    else:
+        count = refresh_user_distances(pk)
+    logger.info(f"{count} distance(s) recalculée(s) pour {kind} #{pk}")
+    return count
+
+
+@shared_task
+def rebuild_user_session_distances():
+    """Tâche périodique : reconstruit toute la table des distances utilisateur / session."""
+    count = rebuild_distances()
+    logger.info(f"{count} distance(s) utilisateur / session reconstruite(s)")
+    return count
+
+
+@shared_task
+def purge_notifications():
+    """Tâche périodique : compacte les notifications répétées et supprime les notifications lues expirées."""
+    report = compact_notifications()
+    logger.info(
+        f"Notifications : {report['collapsed']} doublon(s) de statut compacté(s), "
+        f"{report['expired']} notification(s) lue(s) expirée(s) supprimée(s)"
+    )
+    return report
+
+
+@shared_task(ignore_result=True)
+def send_notification_digests():
+    """Envoie par email, groupées par destinataire, les notifications en attente."""
+    count = send_digests()
+    logger.info(f"{count} email(s) récapitulatif(s) de notifications envoyé(s)")
+    return count
+
+
+@shared_task(ignore_result=True)
+def dispatch_outbox():
+    """Traite un lot de la boîte d'envoi ; se relance tant que les lots sont pleins."""
+    processed, failed = dispatch()
+    if processed or failed:
+        logger.info(f"Boîte d'envoi : {processed} message(s) traité(s), {failed} en erreur")
+    if processed + failed >= OUTBOX_BATCH_SIZE:
+        dispatch_outbox.delay()
+    return processed
+
+
+@shared_task
+def purge_outbox():
+    """Tâche périodique : supprime les messages de la boîte d'envoi déjà traités."""
+    count = purge_processed()
+    logger.info(f"{count} message(s) traité(s) supprimé(s) de la boîte d'envoi")
+    return count
@@ -1,15 +1,20 @@
 # core/templatetags/custom_tags.py
 
 from django import template
-from core.utils import haversine1 as haversine  # ou haversine si tu l'as renommée
+from core.utils import haversine1
 
 register = template.Library()
 
 @register.filter
 def get_distance(session, user):
+    # Distance déjà calculée par la vue (annotate_distance / table des distances)
+    distance = getattr(session, 'distance', None)
+    if distance is not None:
+        return round(distance, 1)
     if (
         session.latitude is not None and session.longitude is not None and
         user.latitude is not None and user.longitude is not None
     ):
-        return round(haversine(user.latitude, user.longitude, session.latitude, session.longitude), 1)
+        # Un seul couple de points : math suffit, NumPy serait plus lent
+        return round(haversine1(user.latitude, user.longitude, session.latitude, session.longitude), 1)
     return "?"
@@ -1,3 +1,1191 @@
-from django.test import TestCase
-
-# Create your tests here.
+import io
+import json
+import socketserver
+import threading
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import events, geocoding, geohash, notification_email, outbox
+from .archive import move_sessions_to_cold_storage
+from .distance_table import refresh_session_distances, refresh_user_distances
+from .geocoding import lookup_postal_code, nominatim_geocode
+from .geohash import encode as geohash_encode
+from .location_index import UserLocationIndex
+from .notification_counter import get_unread_count
+from .notification_email import send_digests
+from .notification_retention import compact_notifications
+from .session_import import create_sessions
+from .tasks import geocode_instance
+from .templatetags.custom_tags import get_distance
+from .utils import haversine1, rank_by_distance, sort_by_distance
+from .models import (
+    ArchivedSession, Formation, GeocodeCache, Notification, OutboxMessage, PostalCode, Session, SessionDate,
+    SessionParticipant, Trainer, TrainingRoom, TrainingWish, User, UserSessionDistance,
+)
+
+
+class GazetteerLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        PostalCode.objects.bulk_create([
+            PostalCode(code_postal='69100', commune='Villeurbanne', nom_normalise='VILLEURBANNE',
+                       latitude=45.77, longitude=4.88),
+            PostalCode(code_postal='42100', commune='Saint-Étienne', nom_normalise='ST ETIENNE',
+                       latitude=45.43, longitude=4.39),
+            PostalCode(code_postal='42100', commune='Villars', nom_normalise='VILLARS',
+                       latitude=45.47, longitude=4.35),
+        ])
+
+    def setUp(self):
+        geocoding._lru.clear()
+
+    def test_city_is_matched_on_its_normalized_name(self):
+        self.assertEqual(lookup_postal_code('42100', 'saint-etienne'), (45.43, 4.39))
+        self.assertEqual(lookup_postal_code(' 42 100', 'VILLARS'), (45.47, 4.35))
+
+    def test_unknown_city_falls_back_to_the_first_commune(self):
+        self.assertEqual(lookup_postal_code('42100', 'Ailleurs'), (45.43, 4.39))
+        self.assertEqual(lookup_postal_code(69100), (45.77, 4.88))
+
+    def test_unknown_or_invalid_code_resolves_to_nothing_without_network(self):
+        with mock.patch('core.geocoding._query_nominatim') as query:
+            self.assertEqual(lookup_postal_code('75001', 'Paris'), (None, None))
+            self.assertEqual(lookup_postal_code('abc'), (None, None))
+        query.assert_not_called()
+
+
+class GeocodeCacheTests(TestCase):
+    def setUp(self):
+        geocoding._lru.clear()
+
+    def test_lru_entries_expire_after_their_ttl(self):
+        lru = geocoding.LRUCache(maxsize=2)
+        with mock.patch('core.geocoding.time.monotonic', return_value=1000):
+            lru.set('a', (1.0, 2.0), ttl=60)
+            lru.set('b', (3.0, 4.0), ttl=60)
+            lru.set('c', (5.0, 6.0), ttl=60)
+            self.assertIs(lru.get('a'), geocoding._MISSING)
+            self.assertEqual(lru.get('c'), (5.0, 6.0))
+        with mock.patch('core.geocoding.time.monotonic', return_value=1061):
+            self.assertIs(lru.get('c'), geocoding._MISSING)
+
+    @override_settings(GEOCODING_NEGATIVE_CACHE_TTL=60)
+    def test_misses_are_cached_until_the_negative_ttl_expires(self):
+        with mock.patch('core.geocoding._query_nominatim', return_value=(None, None)) as query:
+            self.assertEqual(nominatim_geocode('3 Rue Inconnue, Évry'), (None, None))
+            self.assertEqual(nominatim_geocode('3 rue inconnue evry'), (None, None))
+        query.assert_called_once_with('3 Rue Inconnue, Évry, France')
+        entry = GeocodeCache.objects.get()
+        self.assertEqual(entry.query, '3 rue inconnue evry')
+        self.assertTrue(entry.is_negative)
+
+        # Entrée expirée (en base comme en mémoire) : nouvelle requête
+        GeocodeCache.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        geocoding._lru.clear()
+        with mock.patch('core.geocoding._query_nominatim', return_value=(48.63, 2.44)) as query:
+            self.assertEqual(nominatim_geocode('3 Rue Inconnue, Évry'), (48.63, 2.44))
+        query.assert_called_once()
+        self.assertFalse(GeocodeCache.objects.get().is_negative)
+
+    def test_transient_errors_are_not_cached(self):
+        with mock.patch('core.geocoding._query_nominatim', side_effect=geocoding.GeocodingError('quota')):
+            self.assertEqual(nominatim_geocode('1 place Bellecour Lyon'), (None, None))
+            with self.assertRaises(geocoding.GeocodingError):
+                nominatim_geocode('1 place Bellecour Lyon', raise_errors=True)
+        self.assertFalse(GeocodeCache.objects.exists())
+
+    def test_postal_code_misses_are_not_cached_before_the_gazetteer_is_loaded(self):
+        self.assertEqual(lookup_postal_code('69100'), (None, None))
+        PostalCode.objects.create(code_postal='69100', commune='Villeurbanne', nom_normalise='VILLEURBANNE',
+                                  latitude=45.77, longitude=4.88)
+        self.assertEqual(lookup_postal_code('69100'), (45.77, 4.88))
+
+
+class GeocodeInstanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        PostalCode.objects.create(code_postal='69100', commune='Villeurbanne', nom_normalise='VILLEURBANNE',
+                                  latitude=45.77, longitude=4.88)
+
+    def setUp(self):
+        cache.clear()
+        geocoding._lru.clear()
+
+    def test_saved_user_is_geocoded_in_the_background(self):
+        user = User.objects.create_user(username='u', email='u@example.com', password='secret',
+                                        code_postal='69100', city='Villeurbanne')
+        message = OutboxMessage.objects.get(kind='geocode')
+        self.assertEqual(message.payload, {'model_label': 'core.user', 'pk': user.pk})
+
+        with mock.patch('core.tasks.refresh_distances.delay') as refresh:
+            self.assertEqual(geocode_instance('core.user', user.pk), 1)
+        refresh.assert_called_once_with('user', user.pk)
+        user.refresh_from_db()
+        self.assertEqual((user.latitude, user.longitude), (45.77, 4.88))
+        self.assertEqual(user.geohash, geohash_encode(45.77, 4.88))
+        # Déjà géocodé : plus rien à faire
+        self.assertIsNone(geocode_instance('core.user', user.pk))
+
+    def test_address_changed_meanwhile_is_not_overwritten(self):
+        user = User.objects.create_user(username='u', email='u@example.com', password='secret',
+                                        code_postal='69100', city='Villeurbanne')
+
+        def geocode_while_the_address_changes(*args, **kwargs):
+            User.objects.filter(pk=user.pk).update(code_postal='69003')
+            return 45.77, 4.88
+
+        with mock.patch('core.tasks.geocode_address', side_effect=geocode_while_the_address_changes):
+            self.assertEqual(geocode_instance('core.user', user.pk), 0)
+        user.refresh_from_db()
+        self.assertIsNone(user.latitude)
+
+    def test_only_address_changes_schedule_geocoding(self):
+        user = User.objects.create_user(username='u', email='u@example.com', password='secret',
+                                        address='1 rue Introuvable', city='Nulle Part')
+        OutboxMessage.objects.all().delete()
+        cache.clear()
+
+        user = User.objects.get(pk=user.pk)
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        user.code_postal = '69100'
+        user.save()
+        self.assertTrue(OutboxMessage.objects.filter(kind='geocode').exists())
+
+    def test_transient_errors_are_raised_for_retry(self):
+        room = TrainingRoom.objects.create(name='Salle', address='1 rue Inconnue', city='Lyon', capacity=10)
+        with mock.patch('core.geocoding._query_nominatim', side_effect=geocoding.GeocodingError('quota')):
+            with self.assertRaises(geocoding.GeocodingError):
+                geocode_instance('core.trainingroom', room.pk)
+
+
+class GeocodeBackfillTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        PostalCode.objects.create(code_postal='69100', commune='Villeurbanne', nom_normalise='VILLEURBANNE',
+                                  latitude=45.77, longitude=4.88)
+        cls.local = [
+            User.objects.create_user(username=f'l{i}', email=f'l{i}@example.com', password='secret',
+                                     code_postal='69100', city=city)
+            for i, city in enumerate(['Villeurbanne', 'VILLEURBANNE'])
+        ]
+        cls.remote = [
+            User.objects.create_user(username=f'r{i}', email=f'r{i}@example.com', password='secret',
+                                     address=address, city='Évry')
+            for i, address in enumerate(['3 Rue de la Paix', '3, rue de la paix', '5 rue Haute'])
+        ]
+
+    def setUp(self):
+        geocoding._lru.clear()
+
+    def backfill(self, *args):
+        out = io.StringIO()
+        with mock.patch('core.management.commands.geocode_backfill.rebuild_user_session_distances.delay'):
+            call_command('geocode_backfill', '--models', 'core.user', '--rate', '1000', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_writes_nothing_and_skips_nominatim(self):
+        with mock.patch('core.management.commands.geocode_backfill.nominatim_geocode') as geocode:
+            output = self.backfill('--dry-run')
+        geocode.assert_not_called()
+        self.assertIn('2/5 ligne(s) géocodée(s)', output)
+        self.assertFalse(User.objects.filter(latitude__isnull=False).exists())
+
+    def test_identical_addresses_are_resolved_once(self):
+        cache.set('users:location-index:version', 3, None)
+        with mock.patch('core.management.commands.geocode_backfill.nominatim_geocode',
+                        return_value=(48.63, 2.44)) as geocode:
+            output = self.backfill('--chunk-size', '10')
+        # Une requête par adresse distincte hors référentiel
+        self.assertEqual(geocode.call_count, 2)
+        # Version de l'index spatial incrémentée : les autres processus le reconstruisent
+        self.assertEqual(cache.get('users:location-index:version'), 4)
+        self.assertIn('5/5 ligne(s) géocodée(s)', output)
+        self.assertEqual(
+            set(User.objects.filter(pk__in=[u.pk for u in self.local]).values_list('latitude', 'longitude')),
+            {(45.77, 4.88)},
+        )
+        self.assertEqual(
+            set(User.objects.filter(pk__in=[u.pk for u in self.remote]).values_list('latitude', 'longitude')),
+            {(48.63, 2.44)},
+        )
+
+    def test_address_changed_meanwhile_is_not_overwritten(self):
+        moved = self.remote[2]
+        lookup = geocoding.lookup_postal_code
+
+        # L'adresse change une fois les lignes lues, avant l'écriture des coordonnées
+        def lookup_while_the_address_changes(postal_code, city):
+            User.objects.filter(pk=moved.pk).update(address='8 rue Basse')
+            return lookup(postal_code, city)
+
+        with mock.patch('core.management.commands.geocode_backfill.lookup_postal_code',
+                        side_effect=lookup_while_the_address_changes), \
+                mock.patch('core.management.commands.geocode_backfill.nominatim_geocode',
+                           return_value=(48.63, 2.44)):
+            output = self.backfill()
+        self.assertIn('4/5 ligne(s) géocodée(s)', output)
+        moved.refresh_from_db()
+        self.assertIsNone(moved.latitude)
+
+
+LYON = (45.76, 4.84)
+# (nom, latitude, longitude), par distance croissante depuis Lyon
+NEARBY_PLACES = [
+    ('Villeurbanne', 45.77, 4.88),
+    ('Vienne', 45.52, 4.87),
+    ('Saint-Étienne', 45.43, 4.39),
+    ('Grenoble', 45.19, 5.72),
+]
+
+
+def create_formations():
+    formations = [
+        Formation.objects.create(name=name, code_iperia=name.upper(), duration=10, latitude=lat, longitude=lon)
+        for name, lat, lon in NEARBY_PLACES
+    ]
+    formations.append(Formation.objects.create(name='Sans lieu', code_iperia='AUCUN', duration=10))
+    return formations
+
+
+class DistanceRankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formations = create_formations()
+
+    def test_rank_by_distance_orders_located_rows(self):
+        ids, distances = rank_by_distance(Formation.objects.all(), *LYON)
+        self.assertEqual(ids.tolist(), [f.pk for f in self.formations[:4]])
+        self.assertAlmostEqual(distances[0], haversine1(*LYON, 45.77, 4.88))
+        self.assertEqual(list(distances), sorted(distances))
+
+    def test_limit_keeps_only_the_nearest(self):
+        ids, distances = rank_by_distance(Formation.objects.all(), *LYON, limit=2)
+        self.assertEqual(ids.tolist(), [f.pk for f in self.formations[:2]])
+        self.assertEqual(rank_by_distance(Formation.objects.all(), *LYON, limit=0)[0].tolist(), [])
+
+    def test_sort_by_distance_puts_unlocated_rows_last(self):
+        formations = sort_by_distance(Formation.objects.all(), *LYON)
+        self.assertEqual([f.pk for f in formations], [f.pk for f in self.formations])
+        self.assertIsNone(formations[-1].distance)
+        self.assertEqual([f.pk for f in sort_by_distance(Formation.objects.all(), *LYON, limit=3)],
+                         [f.pk for f in self.formations[:3]])
+
+    def test_get_distance_filter(self):
+        user = User(latitude=LYON[0], longitude=LYON[1])
+        session = Session(latitude=45.77, longitude=4.88)
+        self.assertEqual(get_distance(session, user), round(haversine1(*LYON, 45.77, 4.88), 1))
+        self.assertEqual(get_distance(Session(), user), '?')
+
+    def test_catalogue_lists_every_formation_by_default(self):
+        user = User.objects.create_user(username='u', email='u@example.com', password='secret',
+                                        latitude=LYON[0], longitude=LYON[1])
+        self.client.force_login(user)
+        response = self.client.get(reverse('core:formation_list'))
+        self.assertEqual([f.pk for f in response.context['formations']], [f.pk for f in self.formations])
+        with self.settings(FORMATION_LIST_LIMIT=2):
+            response = self.client.get(reverse('core:formation_list'))
+        self.assertEqual([f.pk for f in response.context['formations']], [f.pk for f in self.formations[:2]])
+
+
+class RadiusQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formations = create_formations()
+
+    def test_within_radius_keeps_exact_distances_only(self):
+        formations = Formation.objects.within_radius(*LYON, radius_km=60)
+        self.assertEqual([f.pk for f in formations], [f.pk for f in self.formations[:3]])
+        self.assertTrue(all(f.distance <= 60 for f in formations))
+        self.assertEqual(len(Formation.objects.within_radius(*LYON, radius_km=60, limit=1)), 1)
+
+    def test_bounding_box_contains_the_circle(self):
+        inside = set(Formation.objects.within_bounding_box(*LYON, 30).values_list('pk', flat=True))
+        self.assertEqual(inside, {f.pk for f in self.formations[:2]})
+        self.assertFalse(Formation.objects.within_radius(*LYON, radius_km=1))
+
+
+class GeohashNearTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formations = create_formations()
+
+    def test_geohash_follows_coordinates(self):
+        formation = self.formations[0]
+        self.assertEqual(formation.geohash, geohash_encode(45.77, 4.88))
+        self.assertEqual(self.formations[-1].geohash, '')
+        formation.latitude, formation.longitude = 45.43, 4.39
+        formation.save()
+        self.assertEqual(Formation.objects.get(pk=formation.pk).geohash, geohash_encode(45.43, 4.39))
+
+    def test_neighbour_cells_cover_the_radius(self):
+        self.assertEqual(len(geohash.neighbors(geohash_encode(*LYON, 4))), 9)
+        for radius in (5, 30, 60):
+            near = set(Formation.objects.near(*LYON, radius).values_list('pk', flat=True))
+            exact = {f.pk for f in Formation.objects.within_radius(*LYON, radius_km=radius)}
+            # Pré-filtre : jamais de faux négatif, ni de ligne sans coordonnées
+            self.assertLessEqual(exact, near)
+            self.assertNotIn(self.formations[-1].pk, near)
+
+    def test_neighbours_cross_a_cell_boundary(self):
+        lat_min, lat_max, lon_min, lon_max = geohash.decode_bounds(geohash_encode(*LYON, 5))
+        # Deux points de part et d'autre du bord est de la cellule
+        west = geohash_encode(LYON[0], lon_max - 1e-4, 5)
+        east = geohash_encode(LYON[0], lon_max + 1e-4, 5)
+        self.assertNotEqual(west, east)
+        self.assertIn(east, geohash.neighbors(west))
+
+
+class UserLocationIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=name, email=f'{i}@example.com', password='secret',
+                                     latitude=lat, longitude=lon)
+            for i, (name, lat, lon) in enumerate(NEARBY_PLACES)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.index = UserLocationIndex()
+
+    def test_nearest_and_within_radius(self):
+        ids, distances = self.index.nearest(*LYON, k=2)
+        self.assertEqual(ids.tolist(), [u.pk for u in self.users[:2]])
+        ids, _distances = self.index.within_radius(*LYON, 60, candidates={self.users[1].pk, self.users[3].pk})
+        self.assertEqual(ids.tolist(), [self.users[1].pk])
+
+    def test_changes_made_by_another_process_are_picked_up(self):
+        self.assertEqual(len(self.index), 4)
+        # Un autre processus (ici une autre instance) géocode un utilisateur via update()
+        user = self.users[3]
+        User.objects.filter(pk=user.pk).update(latitude=45.76, longitude=4.85)
+        with self.assertNumQueries(0):
+            UserLocationIndex().update(user.pk, 45.76, 4.85)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.index.nearest(*LYON, k=1)[0].tolist(), [user.pk])
+
+    def test_local_update_does_not_force_a_reload(self):
+        self.assertEqual(len(self.index), 4)
+        user = self.users[3]
+        User.objects.filter(pk=user.pk).update(latitude=45.76, longitude=4.85)
+        self.index.update(user.pk, 45.76, 4.85)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.nearest(*LYON, k=1)[0].tolist(), [user.pk])
+
+    @override_settings(USER_LOCATION_INDEX_TTL=0)
+    def test_index_is_rebuilt_after_its_ttl(self):
+        self.assertEqual(len(self.index), 4)
+        User.objects.filter(pk=self.users[0].pk).update(latitude=None, longitude=None)
+        self.assertEqual(len(self.index), 3)
+
+
+class UserSessionDistanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+        cls.user = User.objects.create_user(username='staff', email='staff@example.com', password='secret',
+                                            is_staff=True, latitude=LYON[0], longitude=LYON[1])
+        cls.sessions = [
+            Session.objects.create(formation=cls.formation, status='OUVERTE', city=name, latitude=lat, longitude=lon)
+            for name, lat, lon in NEARBY_PLACES
+        ]
+
+    def distances(self):
+        return dict(UserSessionDistance.objects.filter(user=self.user).values_list('session_id', 'distance_km'))
+
+    def test_refresh_writes_and_prunes_pairs(self):
+        self.assertEqual(refresh_user_distances(self.user.pk), 4)
+        self.assertAlmostEqual(self.distances()[self.sessions[0].pk], haversine1(*LYON, 45.77, 4.88))
+
+        with self.settings(USER_SESSION_DISTANCE_MAX_KM=60):
+            self.assertEqual(refresh_user_distances(self.user.pk), 3)
+        self.assertNotIn(self.sessions[3].pk, self.distances())
+
+        Session.objects.filter(pk=self.sessions[0].pk).update(latitude=45.19, longitude=5.72)
+        refresh_session_distances(self.sessions[0].pk)
+        self.assertGreater(self.distances()[self.sessions[0].pk], 90)
+
+    def test_archiving_removes_the_session_rows(self):
+        refresh_user_distances(self.user.pk)
+        session = self.sessions[0]
+        session.is_archive = True
+        session.save()
+        self.assertNotIn(session.pk, self.distances())
+
+        Session.objects.filter(pk=self.sessions[1].pk).update(
+            status='TERMINEE', last_status_change=timezone.now() - timedelta(days=1000)
+        )
+        self.assertEqual(Session.archive_old_sessions(), 1)
+        self.assertEqual(set(self.distances()), {s.pk for s in self.sessions[2:]})
+
+    def test_list_falls_back_to_computed_distances(self):
+        self.client.force_login(self.user)
+        url = reverse('core:admin_training_sessions')
+        # Aucune distance matérialisée pour cet utilisateur
+        response = self.client.get(url, {'rayon': 60})
+        self.assertEqual([s.pk for s in response.context['sessions']], [s.pk for s in self.sessions[:3]])
+
+        # Table partielle : la session manquante est calculée en SQL
+        refresh_user_distances(self.user.pk)
+        UserSessionDistance.objects.filter(session=self.sessions[0]).delete()
+        response = self.client.get(url)
+        self.assertEqual([s.pk for s in response.context['sessions']], [s.pk for s in self.sessions])
+        self.assertAlmostEqual(response.context['sessions'][0].distance, haversine1(*LYON, 45.77, 4.88))
+        self.assertContains(response, '3,3 km')
+
+    def test_list_is_paginated_with_page_links(self):
+        Session.objects.bulk_create([Session(formation=self.formation, status='OUVERTE') for _ in range(50)])
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:admin_training_sessions'), {'rpe': ''})
+        self.assertEqual(len(response.context['sessions']), 50)
+        self.assertContains(response, '?rpe=&amp;page=2')
+        response = self.client.get(reverse('core:admin_training_sessions'), {'page': 2})
+        self.assertEqual(len(response.context['sessions']), 4)
+
+
+class ArchiveOldSessionsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+
+    def create_session(self, status, days_ago):
+        session = Session.objects.create(formation=self.formation, status=status)
+        Session.objects.filter(pk=session.pk).update(last_status_change=timezone.now() - timedelta(days=days_ago))
+        return session
+
+    @override_settings(SESSION_ARCHIVE_DELAY_DAYS=30)
+    def test_only_long_finished_sessions_are_archived(self):
+        old = self.create_session('TERMINEE', 31)
+        recent = self.create_session('TERMINEE', 29)
+        open_ = self.create_session('OUVERTE', 365)
+        # Suppression des distances puis un seul UPDATE, dans une transaction
+        with self.assertNumQueries(4):
+            self.assertEqual(Session.archive_old_sessions(), 1)
+        self.assertEqual(set(Session.objects.filter(is_archive=True).values_list('pk', flat=True)), {old.pk})
+        self.assertEqual(Session.archive_old_sessions(), 0)
+        self.assertFalse(Session.objects.filter(pk__in=[recent.pk, open_.pk], is_archive=True).exists())
+
+    def test_archived_sessions_are_hidden_from_the_session_list(self):
+        staff = User.objects.create_user(username='staff', email='staff@example.com', password='secret', is_staff=True)
+        archived = self.create_session('TERMINEE', 1000)
+        Session.archive_old_sessions()
+        self.client.force_login(staff)
+        response = self.client.get(reverse('core:admin_training_sessions'))
+        self.assertNotIn(archived.pk, [s.pk for s in response.context['sessions']])
+
+
+class ColdStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+        cls.other_formation = Formation.objects.create(name='Autre formation', code_iperia='TEST2', duration=10)
+        cls.user = User.objects.create_user(username='u', email='u@example.com', password='secret')
+
+    def setUp(self):
+        self.session = Session.objects.create(
+            formation=self.formation, status='TERMINEE', city='Lyon', is_archive=True,
+        )
+        SessionDate.objects.create(session=self.session, date=date(2024, 3, 4))
+        SessionParticipant.objects.create(session=self.session, user=self.user, status='FILE_EMAIL')
+        TrainingWish.objects.create(user=self.user, formation=self.other_formation, session=self.session)
+        self.recent = Session.objects.create(formation=self.formation, status='TERMINEE', is_archive=True)
+        Session.objects.filter(pk=self.session.pk).update(updated_at=timezone.now() - timedelta(days=400))
+
+    @override_settings(SESSION_COLD_STORAGE_DELAY_DAYS=365)
+    def test_move_keeps_participations_for_the_profile(self):
+        self.assertEqual(move_sessions_to_cold_storage(), 1)
+        self.assertFalse(Session.objects.filter(pk=self.session.pk).exists())
+        self.assertTrue(Session.objects.filter(pk=self.recent.pk).exists())
+
+        archived = ArchivedSession.objects.get(original_id=self.session.pk)
+        self.assertEqual(archived.session_dates, [date(2024, 3, 4)])
+        self.assertGreater(archived.archived_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(
+            sorted(archived.participations.values_list('user_id', 'kind', 'status')),
+            [(self.user.pk, 'PARTICIPANT', 'FILE_EMAIL'), (self.user.pk, 'WISH', '')],
+        )
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:profile'))
+        completed = response.context['completed_trainings']
+        self.assertEqual([t['formation']['name'] for t in completed], ['Formation test'])
+        wishes = response.context['training_wishes_with_session']
+        self.assertEqual([w['session'] for w in wishes], [archived])
+        self.assertContains(response, '04/03/2024')
+
+    @override_settings(SESSION_COLD_STORAGE_DELAY_DAYS=365)
+    def test_manage_session_filters_and_paginates_cold_storage(self):
+        move_sessions_to_cold_storage()
+        ArchivedSession.objects.bulk_create(
+            ArchivedSession(
+                original_id=10_000 + i, formation=self.other_formation, formation_name='Autre formation',
+                status='TERMINEE', start_date=date(2023, 1, 1), archived_at=timezone.now(),
+            )
+            for i in range(60)
+        )
+        staff = User.objects.create_user(username='staff', email='staff@example.com', password='secret', is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse('core:manage_session'), {'archived_filter': 'oui'})
+        self.assertEqual(len(response.context['cold_sessions']), 50)
+        self.assertEqual(response.context['cold_page'].paginator.count, 61)
+        self.assertContains(response, 'cold_page=2')
+
+        response = self.client.get(
+            reverse('core:manage_session'), {'archived_filter': 'oui', 'formation_id': self.formation.pk}
+        )
+        self.assertEqual([s.original_id for s in response.context['cold_sessions']], [self.session.pk])
+        response = self.client.get(
+            reverse('core:manage_session'), {'archived_filter': 'oui', 'date_from': '2024-01-01'}
+        )
+        self.assertEqual([s.original_id for s in response.context['cold_sessions']], [self.session.pk])
+
+        response = self.client.get(reverse('core:export_archived_sessions'), {'formation_id': self.formation.pk})
+        sheet = load_workbook(io.BytesIO(response.content)).active
+        # En-tête, la session encore active puis celle du stockage froid
+        self.assertEqual(sheet.max_row, 3)
+
+
+class SessionSaveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+        cls.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='secret', is_staff=True
+        )
+
+    def setUp(self):
+        self.session = Session.objects.create(formation=self.formation, status='OUVERTE')
+        Session.objects.filter(pk=self.session.pk).update(
+            last_status_change=timezone.now() - timedelta(days=10)
+        )
+
+    def test_status_change_is_saved_in_one_write(self):
+        session = Session.objects.get(pk=self.session.pk)
+        before = session.last_status_change
+        session.status = 'COMPLETE'
+        # Les bornes sont tenues à jour par SessionDate : un seul UPDATE
+        with self.assertNumQueries(1):
+            session.save()
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'COMPLETE')
+        self.assertGreater(session.last_status_change, before)
+
+    def test_save_without_status_change_keeps_last_status_change(self):
+        session = Session.objects.get(pk=self.session.pk)
+        before = session.last_status_change
+        session.city = 'Lyon'
+        session.save()
+        session.refresh_from_db()
+        self.assertEqual(session.last_status_change, before)
+
+    def test_change_session_status_view_query_count(self):
+        self.client.force_login(self.staff)
+        url = reverse('core:change_session_status', args=[self.session.pk])
+        # Session Django + utilisateur, lecture de la session, UPDATE
+        with self.assertNumQueries(4):
+            response = self.client.post(url, {'status': 'TERMINEE'})
+        self.assertEqual(response.status_code, 200)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, 'TERMINEE')
+        self.assertGreater(self.session.last_status_change, timezone.now() - timedelta(minutes=1))
+
+    def test_update_session_status_view_query_count(self):
+        self.client.force_login(self.staff)
+        url = reverse('core:update_session_status')
+        # Comme ci-dessus, plus la lecture des participants (aucun ici) et le point de sauvegarde
+        with self.assertNumQueries(7):
+            response = self.client.post(url, {'session_id': self.session.pk, 'status': 'PREPAREE'})
+        self.assertEqual(response.status_code, 200)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, 'PREPAREE')
+
+
+class SessionDateBoundsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+
+    def setUp(self):
+        self.session = Session.objects.create(formation=self.formation)
+        self.other = Session.objects.create(formation=self.formation)
+
+    def assertBounds(self, session, start, end):
+        session.refresh_from_db()
+        self.assertEqual((session.start_date, session.end_date), (start, end))
+
+    def test_create_updates_bounds_in_one_query(self):
+        SessionDate.objects.create(session=self.session, date=date(2025, 3, 4))
+        # INSERT + UPDATE des bornes
+        with self.assertNumQueries(2):
+            SessionDate.objects.create(session=self.session, date=date(2025, 3, 1))
+        self.assertBounds(self.session, date(2025, 3, 1), date(2025, 3, 4))
+
+    def test_bulk_create(self):
+        SessionDate.objects.bulk_create([
+            SessionDate(session=self.session, date=date(2025, 5, d)) for d in (12, 3, 7)
+        ] + [SessionDate(session=self.other, date=date(2025, 6, 1))])
+        self.assertBounds(self.session, date(2025, 5, 3), date(2025, 5, 12))
+        self.assertBounds(self.other, date(2025, 6, 1), date(2025, 6, 1))
+
+    def test_update_and_move(self):
+        first = SessionDate.objects.create(session=self.session, date=date(2025, 1, 10))
+        SessionDate.objects.create(session=self.session, date=date(2025, 1, 20))
+        SessionDate.objects.filter(pk=first.pk).update(date=date(2025, 1, 5))
+        self.assertBounds(self.session, date(2025, 1, 5), date(2025, 1, 20))
+
+        moved = SessionDate.objects.get(pk=first.pk)
+        moved.session = self.other
+        moved.save()
+        self.assertBounds(self.session, date(2025, 1, 20), date(2025, 1, 20))
+        self.assertBounds(self.other, date(2025, 1, 5), date(2025, 1, 5))
+
+    def test_delete(self):
+        first = SessionDate.objects.create(session=self.session, date=date(2025, 2, 1))
+        SessionDate.objects.create(session=self.session, date=date(2025, 2, 9))
+        SessionDate.objects.create(session=self.session, date=date(2025, 2, 5))
+        first.delete()
+        self.assertBounds(self.session, date(2025, 2, 5), date(2025, 2, 9))
+        SessionDate.objects.filter(date=date(2025, 2, 9)).delete()
+        self.assertBounds(self.session, date(2025, 2, 5), date(2025, 2, 5))
+
+
+class UpdateSessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+        cls.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='secret', is_staff=True
+        )
+        cls.trainers = [Trainer.objects.create(first_name=f'F{i}', last_name='Test') for i in range(3)]
+        cls.rooms = [
+            TrainingRoom.objects.create(name=f'Salle {i}', address='1 rue test', capacity=10) for i in range(2)
+        ]
+
+    def setUp(self):
+        self.session = Session.objects.create(formation=self.formation, status='OUVERTE')
+        self.session.trainers.add(self.trainers[0], self.trainers[1])
+        self.kept = SessionDate.objects.create(session=self.session, date=date(2025, 4, 1), location=self.rooms[0])
+        self.moved = SessionDate.objects.create(session=self.session, date=date(2025, 4, 2), location=self.rooms[0])
+        self.dropped = SessionDate.objects.create(session=self.session, date=date(2025, 4, 3))
+        self.client.force_login(self.staff)
+
+    def post(self, **data):
+        payload = {
+            'formation': self.formation.pk,
+            'status': 'OUVERTE',
+            'iperia_opening': '2025-01-01',
+            'iperia_deadline': '2025-02-01',
+        }
+        payload.update(data)
+        return self.client.post(reverse('core:update_session', args=[self.session.pk]), payload).json()
+
+    def test_only_changed_rows_are_touched(self):
+        kept_created_at = self.kept.created_at
+        result = self.post(**{
+            'trainers[]': [self.trainers[1].pk, self.trainers[2].pk],
+            'session_dates[]': ['2025-04-01', '2025-04-02', '2025-04-10'],
+            'session_rooms[]': [self.rooms[0].pk, self.rooms[1].pk, ''],
+        })
+        self.assertTrue(result['success'], result)
+
+        self.assertEqual(
+            set(self.session.trainers.values_list('pk', flat=True)),
+            {self.trainers[1].pk, self.trainers[2].pk},
+        )
+        dates = {d.date: d for d in self.session.dates.all()}
+        self.assertEqual(sorted(dates), [date(2025, 4, 1), date(2025, 4, 2), date(2025, 4, 10)])
+        self.assertEqual(dates[date(2025, 4, 1)].pk, self.kept.pk)
+        self.assertEqual(dates[date(2025, 4, 1)].created_at, kept_created_at)
+        self.assertEqual(dates[date(2025, 4, 2)].pk, self.moved.pk)
+        self.assertEqual(dates[date(2025, 4, 2)].location_id, self.rooms[1].pk)
+        self.assertFalse(SessionDate.objects.filter(pk=self.dropped.pk).exists())
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.start_date, self.session.end_date), (date(2025, 4, 1), date(2025, 4, 10)))
+
+    def test_unknown_trainer_is_rejected_without_changes(self):
+        result = self.post(**{'trainers[]': [self.trainers[0].pk, 999999], 'session_dates[]': []})
+        self.assertFalse(result['success'])
+        self.assertEqual(self.session.trainers.count(), 2)
+        self.assertEqual(self.session.dates.count(), 3)
+
+
+class BulkCreateSessionsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+        cls.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='secret', is_staff=True
+        )
+        cls.room = TrainingRoom.objects.create(name='Salle A', address='1 rue test', capacity=10)
+        cls.trainer = Trainer.objects.create(first_name='F', last_name='Test', email='formateur@example.com')
+
+    def test_valid_rows_are_created_and_invalid_rows_reported(self):
+        self.client.force_login(self.staff)
+        rows = [
+            {
+                'formation': 'test1',
+                'status': 'OUVERTE',
+                'dates': ['2026-01-12', '2026-01-05'],
+                'rooms': ['Salle A'],
+                'trainers': [self.trainer.pk],
+            }
+            for _ in range(5)
+        ]
+        rows.append({'formation': 'inconnue', 'dates': ['2026-01-05'], 'trainers': ['personne@example.com']})
+
+        response = self.client.post(
+            reverse('core:bulk_create_sessions'), json.dumps({'sessions': rows}), content_type='application/json'
+        )
+        data = response.json()
+
+        self.assertEqual(data['created'], 5)
+        self.assertFalse(data['results'][5]['success'])
+        self.assertEqual(len(data['results'][5]['errors']), 2)
+        session = Session.objects.get(pk=data['results'][0]['session_id'])
+        self.assertEqual((session.start_date, session.end_date), (date(2026, 1, 5), date(2026, 1, 12)))
+        self.assertEqual(list(session.trainers.all()), [self.trainer])
+        self.assertEqual(set(session.dates.values_list('location_id', flat=True)), {self.room.pk})
+
+    def test_csrf_token_is_required(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.staff)
+        rows = [{'formation': 'TEST1', 'dates': ['2026-01-05']}]
+        response = client.post(reverse('core:bulk_create_sessions'), json.dumps({'sessions': rows}),
+                               content_type='text/plain')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Session.objects.exists())
+
+    def test_created_sessions_emit_post_save_and_odd_digits_are_rejected(self):
+        rows = [
+            {'formation': 'TEST1', 'dates': ['2026-01-05'], 'city': 'Lyon', 'postal_code': '69001'},
+            {'formation': '²', 'dates': ['2026-01-05']},
+        ]
+        with mock.patch('core.session_import.get_coordinates_from_postal_code', return_value=(45.76, 4.83)), \
+                mock.patch('core.events.get_broker') as get_broker, \
+                mock.patch('core.tasks.refresh_distances.apply_async') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                report = create_sessions(rows)
+
+        self.assertEqual(report[1]['errors'], ["Formation introuvable : '²'"])
+        session_id = report[0]['session_id']
+        channel, message = get_broker.return_value.publish.call_args.args
+        self.assertEqual(channel, events.STAFF_CHANNEL)
+        self.assertIn(f'"session_id": {session_id}', events.format_sse(message))
+        refresh.assert_called_once_with(('session', session_id), retry=False)
+
+
+class RecurringSessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+        cls.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='secret', is_staff=True
+        )
+        cls.room = TrainingRoom.objects.create(name='Salle A', address='1 rue test', capacity=10)
+        cls.trainer = Trainer.objects.create(first_name='F', last_name='Test')
+
+    def setUp(self):
+        # Lundi 5 et lundi 12 janvier 2026
+        self.source = Session.objects.create(formation=self.formation, status='TERMINEE')
+        self.source.trainers.add(self.trainer)
+        for day in (5, 12):
+            SessionDate.objects.create(session=self.source, date=date(2026, 1, day), location=self.room)
+        self.client.force_login(self.staff)
+
+    def post(self, **data):
+        url = reverse('core:generate_recurring_sessions', args=[self.source.pk])
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_clones_are_published_and_csrf_is_required(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.staff)
+        url = reverse('core:generate_recurring_sessions', args=[self.source.pk])
+        data = json.dumps({'rule': {'every_months': 3, 'count': 2}})
+        self.assertEqual(client.post(url, data, content_type='text/plain').status_code, 403)
+
+        with mock.patch('core.events.get_broker') as get_broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.post(rule={'every_months': 3, 'count': 2})
+        clone_ids = {c.pk for c in Session.objects.exclude(pk=self.source.pk)}
+        self.assertEqual(len(clone_ids), 2, response.content)
+        published = [
+            json.loads(call.args[1])['data']['session_id']
+            for call in get_broker.return_value.publish.call_args_list
+            if call.args[0] == events.STAFF_CHANNEL
+        ]
+        self.assertEqual(set(published), clone_ids)
+
+    def test_every_three_months_keeps_weekday_pattern(self):
+        response = self.post(rule={'every_months': 3, 'count': 2})
+        self.assertEqual(response.status_code, 200, response.content)
+        clones = Session.objects.exclude(pk=self.source.pk).order_by('start_date')
+        self.assertEqual(
+            [(s.start_date, s.end_date) for s in clones],
+            [(date(2026, 4, 6), date(2026, 4, 13)), (date(2026, 7, 6), date(2026, 7, 13))],
+        )
+        for clone in clones:
+            self.assertEqual(clone.status, 'NON_OUVERTE')
+            self.assertEqual(list(clone.trainers.all()), [self.trainer])
+            self.assertEqual(set(clone.dates.values_list('location_id', flat=True)), {self.room.pk})
+
+    def test_conflicts_are_reported_without_creating(self):
+        busy = Session.objects.create(formation=self.formation)
+        SessionDate.objects.create(session=busy, date=date(2026, 3, 9), location=self.room)
+
+        response = self.post(rule={'start_dates': ['2026-03-02', '2026-06-01']})
+        self.assertEqual(response.status_code, 409)
+        conflicts = response.json()['conflicts']
+        self.assertEqual([(c['type'], c['date'], c['session_id']) for c in conflicts],
+                         [('room', '2026-03-09', busy.pk)])
+        self.assertEqual(Session.objects.count(), 2)
+
+        response = self.post(rule={'start_dates': ['2026-03-02']}, allow_conflicts=True)
+        self.assertEqual(response.json()['created'], 1)
+
+
+class BulkNotifyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+        cls.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='secret', is_staff=True
+        )
+        cls.users = [
+            User.objects.create_user(username=f'u{i}', email=f'u{i}@example.com', password='secret')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.session = Session.objects.create(formation=self.formation, status='OUVERTE')
+        SessionParticipant.objects.bulk_create([
+            SessionParticipant(session=self.session, user=user) for user in self.users
+        ])
+
+    def test_status_update_notifies_participants_in_one_insert(self):
+        self.client.force_login(self.staff)
+        # Comme SessionSaveTests, plus le point de sauvegarde et un seul INSERT pour les cinq notifications
+        with self.assertNumQueries(8):
+            self.client.post(reverse('core:update_session_status'), {'session_id': self.session.pk, 'status': 'PREPAREE'})
+        # Insérées dans la requête : rien ne passe par la boîte d'envoi
+        self.assertFalse(OutboxMessage.objects.exists())
+        notifications = Notification.objects.filter(type='session_status_update')
+        self.assertEqual(sorted(n.user_id for n in notifications), sorted(u.pk for u in self.users))
+        self.assertTrue(all(n.related_object_id == self.session.pk for n in notifications))
+
+    @override_settings(NOTIFICATION_BULK_ASYNC_THRESHOLD=2)
+    def test_large_fan_out_is_deferred_to_the_outbox(self):
+        with mock.patch('core.tasks.dispatch_outbox.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                created = Notification.objects.bulk_notify(self.users, 'general', 'Message', self.session)
+        self.assertEqual(created, [])
+        self.assertFalse(Notification.objects.exists())
+        apply_async.assert_called_once()
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.payload['user_ids'], [u.pk for u in self.users])
+        self.assertEqual(outbox.dispatch(), (1, 0))
+        self.assertEqual(Notification.objects.filter(related_object_id=self.session.pk).count(), 5)
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='u', email='u@example.com', password='secret')
+
+    def test_rolled_back_transaction_leaves_no_message(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Notification.objects.bulk_notify([self.user], 'general', 'Message', defer=True)
+                raise RuntimeError
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failed_message_is_retried_with_backoff_then_delivered_once(self):
+        Notification.objects.bulk_notify([self.user], 'general', 'Message', defer=True)
+        with mock.patch.object(Notification.objects, 'create_for_users', side_effect=RuntimeError('panne')):
+            self.assertEqual(outbox.dispatch(), (0, 1))
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.STATUS_PENDING, 1))
+        self.assertGreater(message.available_at, timezone.now())
+        self.assertFalse(Notification.objects.exists())
+
+        # Pas encore disponible : le message n'est pas repris
+        self.assertEqual(outbox.dispatch(), (0, 0))
+        OutboxMessage.objects.update(available_at=timezone.now())
+        self.assertEqual(outbox.dispatch(), (1, 0))
+        self.assertEqual(outbox.dispatch(), (0, 0))
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.STATUS_DONE)
+
+    def test_geocoding_requests_are_merged_in_the_database(self):
+        room = TrainingRoom(name='Salle', address='1 rue test', city='Lyon', capacity=10)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                room.save()
+                raise RuntimeError
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        room = TrainingRoom.objects.create(name='Salle', address='1 rue test', city='Lyon', capacity=10)
+        geocoding.schedule_geocoding(room)
+        with mock.patch('core.tasks.geocode_instance.apply_async') as apply_async:
+            self.assertEqual(outbox.dispatch(), (2, 0))
+            # Deux demandes, une seule tâche planifiée
+            apply_async.assert_called_once_with(('core.trainingroom', room.pk), retry=False)
+
+            # Une demande ultérieure (adresse corrigée) n'est pas ignorée
+            geocoding.schedule_geocoding(room)
+            self.assertEqual(outbox.dispatch(), (1, 0))
+            self.assertEqual(apply_async.call_count, 2)
+
+
+class UnreadNotificationCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='u', email='u@example.com', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        Notification.objects.bulk_notify([self.user], 'general', 'Premier message')
+
+    def test_count_is_cached_and_invalidated_on_writes(self):
+        self.assertEqual(get_unread_count(self.user.pk), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user.pk), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.bulk_notify([self.user], 'general', 'Second message')
+            # Pas d'invalidation avant le commit : un affichage concurrent garderait l'ancien compte
+            self.assertEqual(get_unread_count(self.user.pk), 1)
+        self.assertEqual(get_unread_count(self.user.pk), 2)
+
+        notification = Notification.objects.filter(user=self.user).first()
+        notification.is_read = True
+        with self.captureOnCommitCallbacks(execute=True):
+            notification.save()
+        self.assertEqual(get_unread_count(self.user.pk), 1)
+
+        self.client.force_login(self.user)
+        unread = Notification.objects.filter(user=self.user, is_read=False).values_list('pk', flat=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('core:mark_notifications_page_read'), {'ids': list(unread)})
+        self.assertEqual(get_unread_count(self.user.pk), 0)
+
+    def test_badge_is_rendered_from_the_counter(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:formation_list'))
+        self.assertContains(response, '<span class="badge bg-danger">1</span>', html=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.filter(user=self.user).update(is_read=True)
+        response = self.client.get(reverse('core:formation_list'))
+        self.assertNotContains(response, '<span class="badge bg-danger">')
+
+
+class NotificationInboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='u', email='u@example.com', password='secret')
+        cls.other = User.objects.create_user(username='o', email='o@example.com', password='secret')
+        now = timezone.now()
+        Notification.objects.bulk_create([
+            Notification(user=cls.user, type='general', message=f'n{i}', is_read=i % 3 == 0,
+                         created_at=now - timedelta(minutes=i))
+            for i in range(45)
+        ] + [Notification(user=cls.other, type='general', message='autre')])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_keyset_pages_list_unread_first_without_gaps(self):
+        seen, after = [], None
+        while True:
+            response = self.client.get(reverse('core:notifications_list'), {'after': after} if after else {})
+            seen += response.context['notifications']
+            after = response.context['next_cursor']
+            if after is None:
+                break
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len({n.pk for n in seen}), 45)
+        self.assertEqual([n.is_read for n in seen], sorted(n.is_read for n in seen))
+        unread = [n for n in seen if not n.is_read]
+        self.assertEqual(unread, sorted(unread, key=lambda n: n.created_at, reverse=True))
+
+    def test_mark_page_read_only_touches_visible_rows(self):
+        response = self.client.get(reverse('core:notifications_list'))
+        shown = response.context['unread_ids']
+        self.assertEqual(len(shown), 20)
+        foreign = Notification.objects.get(user=self.other).pk
+
+        self.client.post(reverse('core:mark_notifications_page_read'), {'ids': shown + [foreign]})
+        self.assertEqual(Notification.objects.filter(user=self.user, is_read=False).count(), 30 - 20)
+        self.assertFalse(Notification.objects.get(pk=foreign).is_read)
+
+
+class NotificationRetentionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.formation = Formation.objects.create(name='Formation test', code_iperia='TEST1', duration=10)
+        cls.user = User.objects.create_user(username='u', email='u@example.com', password='secret')
+
+    def test_repeated_status_updates_are_collapsed_and_old_read_rows_expire(self):
+        session = Session.objects.create(formation=self.formation)
+        other = Session.objects.create(formation=self.formation)
+        for status in ('OUVERTE', 'COMPLETE', 'PREPAREE'):
+            Notification.objects.bulk_notify([self.user], 'session_status_update', status, related_object=session)
+        Notification.objects.bulk_notify([self.user], 'session_status_update', 'OUVERTE', related_object=other)
+        old = timezone.now() - timedelta(days=400)
+        Notification.objects.bulk_create([
+            Notification(user=self.user, type='general', message='ancienne lue', is_read=True, created_at=old),
+            Notification(user=self.user, type='general', message='ancienne non lue', created_at=old),
+        ])
+
+        report = compact_notifications(batch_size=1)
+
+        self.assertEqual(report, {'collapsed': 2, 'expired': 1})
+        self.assertEqual(
+            sorted(Notification.objects.values_list('message', flat=True)),
+            ['OUVERTE', 'PREPAREE', 'ancienne non lue'],
+        )
+
+
+class LiveEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='u', email='u@example.com', password='secret')
+
+    async def test_in_process_broker_delivers_only_subscribed_channels(self):
+        broker = events.InProcessBroker()
+        subscription = await broker.subscribe([events.user_channel(1)])
+        broker.publish(events.user_channel(2), 'autre')
+        broker.publish(events.user_channel(1), 'message')
+        self.assertEqual(await subscription.get(1), 'message')
+        self.assertIsNone(await subscription.get(0.01))
+        await subscription.close()
+        self.assertEqual(broker._subscriptions, {})
+
+    def test_notifications_are_published_after_commit(self):
+        with mock.patch('core.events.get_broker') as get_broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                Notification.objects.bulk_notify([self.user], 'general', 'Bonjour')
+                get_broker.return_value.publish.assert_not_called()
+        channel, message = get_broker.return_value.publish.call_args.args
+        self.assertEqual(channel, events.user_channel(self.user.pk))
+        self.assertEqual(events.format_sse(message).splitlines()[0], 'event: notification')
+
+    def test_stream_is_not_served_under_wsgi(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('core:event_stream')).status_code, 204)
+
+
+class _SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Serveur SMTP minimal en mémoire : compte les connexions, conserve les
+    messages reçus et refuse les destinataires de ``rejected``.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+        self.rejected = set()
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stand-in')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command == 'EHLO':
+                self.reply('250 stand-in')
+            elif command == 'RCPT' and any(address in line for address in self.server.rejected):
+                self.reply('550 mailbox unavailable')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                lines = []
+                while (data := self.rfile.readline().decode()) not in ('.\r\n', ''):
+                    lines.append(data)
+                self.server.messages.append(''.join(lines))
+                self.reply('250 queued')
+            else:
+                self.reply('250 ok')
+
+
+@override_settings(
+    NOTIFICATION_EMAILS_ENABLED=True,
+    EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+    EMAIL_HOST='127.0.0.1',
+    EMAIL_USE_TLS=False,
+    EMAIL_HOST_USER='',
+    EMAIL_HOST_PASSWORD='',
+)
+class NotificationEmailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'u{i}', email=f'u{i}@example.com', password='secret')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.smtp = _SMTPStandIn()
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+
+    def test_digests_are_grouped_per_user_and_sent_in_batches(self):
+        with mock.patch('core.tasks.send_notification_digests.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                Notification.objects.bulk_notify(self.users, 'general', 'Premier message')
+                Notification.objects.bulk_notify(self.users[:2], 'general', 'Second message')
+        # Une seule tâche planifiée pour les deux envois
+        apply_async.assert_called_once()
+
+        with self.settings(EMAIL_PORT=self.smtp.server_address[1]):
+            sent = send_digests(batch_size=3)
+
+        self.assertEqual(sent, 5)
+        self.assertEqual(self.smtp.connections, 2)
+        self.assertEqual(len(self.smtp.messages), 5)
+        digest = next(m for m in self.smtp.messages if 'To: u0@example.com' in m)
+        self.assertIn('Premier message', digest)
+        self.assertIn('Second message', digest)
+        self.assertFalse(Notification.objects.filter(email_pending=True).exists())
+
+    def test_failed_recipient_stays_pending_and_claimed_rows_are_not_resent(self):
+        with mock.patch('core.tasks.send_notification_digests.apply_async'):
+            Notification.objects.bulk_notify(self.users, 'general', 'Premier message')
+        self.smtp.rejected.add('u1@example.com')
+
+        with self.settings(EMAIL_PORT=self.smtp.server_address[1]):
+            self.assertEqual(send_digests(batch_size=5), 4)
+        self.assertEqual(len(self.smtp.messages), 4)
+        self.assertEqual(
+            list(Notification.objects.filter(email_pending=True).values_list('user', flat=True)),
+            [self.users[1].pk],
+        )
+
+        # Une exécution concurrente a déjà réclamé la notification restante : rien n'est renvoyé
+        self.assertEqual(len(notification_email._claim_pending()), 1)
+        with self.settings(EMAIL_PORT=self.smtp.server_address[1]):
+            self.assertEqual(send_digests(), 0)
+        self.assertEqual(len(self.smtp.messages), 4)
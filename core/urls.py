@@ -64,6 +64,9 @@ urlpatterns = [
     path('manage-session/detail/<int:session_id>/', views.session_detail, name='session_detail'),
     path('manage-session/get/<int:session_id>/', views.get_session, name='get_session'),
     path('manage-session/<int:session_id>/update/', views.update_session, name='update_session'),
+    path('manage-session/bulk-create/', views.bulk_create_sessions, name='bulk_create_sessions'),
+    path('manage-session/import/', views.import_sessions_xlsx, name='import_sessions_xlsx'),
+    path('manage-session/<int:session_id>/recurrence/', views.generate_recurring_sessions, name='generate_recurring_sessions'),
     path('manage-session/<int:session_id>/delete/', views.delete_session, name='delete_session'),
     path('session/<int:session_id>/update_status/', views.update_session_status, name='update_session_status'),
     path('session/<int:session_id>/archive/', views.archive_session, name='archive_session'),
@@ -139,6 +142,8 @@ urlpatterns = [
     # Notifications
     path('notifications/', views.notifications_list, name='notifications_list'),
     path('notifications/<int:notification_id>/mark-read/', views.mark_notification_read, name='mark_notification_read'),
+    path('notifications/mark-page-read/', views.mark_notifications_page_read, name='mark_notifications_page_read'),
+    path('events/', views.event_stream, name='event_stream'),
     
     # URLs pour la réinitialisation du mot de passe
     path('password_reset/', 
@@ -1,35 +1,34 @@
-from geopy.geocoders import Nominatim
 from django.http import JsonResponse
 from functools import wraps
 
-from geopy.geocoders import Nominatim
-
-from geopy.geocoders import Nominatim
+from .geocoding import geocode_address, lookup_postal_code
 
 def get_coordinates_from_postal_code(postal_code, city_name=None):
     """
     Retourne (latitude, longitude) à partir du code postal et éventuellement du nom de la ville.
-    """
-    geolocator = Nominatim(user_agent="formasmat_app")
-    try:
-        if city_name:
-            query = f"{postal_code} {city_name}, France"
-        else:
-            query = f"{postal_code}, France"
 
-        location = geolocator.geocode(query)
-        if location:
-            return location.latitude, location.longitude
-    except Exception:
-        pass
-    return None, None
+    La résolution se fait sur le référentiel local des codes postaux, sans appel réseau.
+    """
+    return lookup_postal_code(postal_code, city_name)
 
 
 import math
 
+import numpy as np
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371
+
+# Moteurs dont Django expose SIN/COS/ASIN/SQRT/RADIANS (fonctions natives, ou
+# enregistrées par Django pour SQLite)
+TRIG_FUNCTION_VENDORS = {'postgresql', 'mysql', 'sqlite', 'oracle'}
+
+
 def haversine1(lat1, lon1, lat2, lon2):
 
-    R = 6371  # Rayon de la Terre en km
+    R = EARTH_RADIUS_KM  # Rayon de la Terre en km
 
     phi1 = math.radians(lat1)
     phi2 = math.radians(lat2)
@@ -43,18 +42,113 @@ def haversine1(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
     return R * c
-from geopy.geocoders import Nominatim
+
+
+def haversine_distances(lat, lon, lats, lons):
+    """
+    Distances (km) entre un point et un tableau de points, calculées en une
+    seule passe NumPy. Accepte aussi des scalaires.
+    """
+    phi1 = np.radians(lat)
+    phi2 = np.radians(np.asarray(lats, dtype=float))
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(np.asarray(lons, dtype=float) - lon)
+
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def rank_by_distance(queryset, lat, lon, limit=None):
+    """
+    Classe les lignes géolocalisées d'un queryset par distance au point donné.
+
+    Seuls (id, latitude, longitude) sont lus en base. Retourne deux tableaux
+    NumPy (ids, distances) triés par distance croissante ; avec ``limit``,
+    seuls les ``limit`` plus proches sont sélectionnés (argpartition).
+    """
+    rows = list(
+        queryset.filter(latitude__isnull=False, longitude__isnull=False)
+        .order_by()
+        .values_list('pk', 'latitude', 'longitude')
+    )
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    data = np.array(rows, dtype=float)
+    ids = data[:, 0].astype(np.int64)
+    distances = haversine_distances(lat, lon, data[:, 1], data[:, 2])
+
+    if limit is not None and limit < len(distances):
+        if limit <= 0:
+            return ids[:0], distances[:0]
+        order = np.argpartition(distances, limit - 1)[:limit]
+        order = order[np.argsort(distances[order], kind='stable')]
+    else:
+        order = np.argsort(distances, kind='stable')
+    return ids[order], distances[order]
+
+
+def sort_by_distance(queryset, lat, lon, limit=None, attr='distance'):
+    """
+    Retourne les objets du queryset triés par distance, chacun annoté d'un
+    attribut ``distance`` (km, arrondi à 2 décimales). Les objets sans
+    coordonnées sont placés à la fin, avec une distance à None.
+    """
+    ids, distances = rank_by_distance(queryset, lat, lon, limit=limit)
+    objects = queryset.in_bulk(ids.tolist())
+
+    result = []
+    for pk, distance in zip(ids.tolist(), distances.tolist()):
+        obj = objects.get(pk)
+        if obj is not None:
+            setattr(obj, attr, round(distance, 2))
+            result.append(obj)
+
+    if limit is None or len(result) < limit:
+        remaining = queryset.filter(Q(latitude__isnull=True) | Q(longitude__isnull=True))
+        if limit is not None:
+            remaining = remaining[:limit - len(result)]
+        for obj in remaining:
+            setattr(obj, attr, None)
+            result.append(obj)
+    return result
+
+
+def distance_expression(lat, lon, lat_field='latitude', lon_field='longitude'):
+    """Expression SQL (haversine) de la distance en km entre le point et chaque ligne."""
+    phi1 = math.radians(lat)
+    half_d_phi = Radians(F(lat_field) - Value(lat)) / 2
+    half_d_lambda = Radians(F(lon_field) - Value(lon)) / 2
+    a = Power(Sin(half_d_phi), 2) + Value(math.cos(phi1)) * Cos(Radians(F(lat_field))) * Power(Sin(half_d_lambda), 2)
+    # Least() protège ASIN des arrondis légèrement supérieurs à 1
+    return Value(2.0 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(a), Value(1.0), output_field=FloatField()))
+
+
+def annotate_distance(queryset, lat, lon, attr='distance', limit=None):
+    """
+    Annote chaque objet du queryset de sa distance (km) au point donné et les
+    trie par distance croissante, objets sans coordonnées à la fin. Avec
+    ``limit``, seuls les ``limit`` premiers sont retournés.
+
+    Le calcul est fait en SQL quand le moteur le permet (un queryset est alors
+    retourné) ; sinon en une passe NumPy via ``sort_by_distance`` (liste).
+    """
+    if connections[queryset.db].vendor in TRIG_FUNCTION_VENDORS:
+        queryset = queryset.annotate(**{attr: distance_expression(lat, lon)}).order_by(
+            F(attr).asc(nulls_last=True), 'pk'
+        )
+        return queryset[:limit] if limit is not None else queryset
+    return sort_by_distance(queryset, lat, lon, limit=limit, attr=attr)
+
 
 def get_coordinates_from_address(address, postal_code=None, city=None):
-    geolocator = Nominatim(user_agent="formasmat_app")
-    try:
-        full_address = f"{address}, {postal_code or ''} {city or ''}, France"
-        location = geolocator.geocode(full_address.strip())
-        if location:
-            return location.latitude, location.longitude
-    except Exception as e:
-        print("Erreur géocodage :", e)
-    return None, None
+    """
+    Retourne (latitude, longitude) pour une adresse.
+
+    Le code postal est d'abord résolu localement ; Nominatim n'est interrogé
+    qu'en repli sur l'adresse complète.
+    """
+    return geocode_address(address, postal_code=postal_code, city=city)
 
 
 def ajax_login_required(view_func):
@@ -14,15 +14,20 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q, F
+from django.db.models import Q, F, OuterRef, Subquery
+from django.conf import settings
+from django.core.paginator import Paginator
 from django.utils import timezone
 from django.db import IntegrityError
 from django.urls import reverse
 from django.views.decorators.http import require_http_methods,require_GET   
 from django.contrib.auth.forms import AuthenticationForm
 from django.utils.timezone import now
-from datetime import timedelta
-from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import chain, zip_longest
+from django.utils.dateparse import parse_date
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 
 
 
@@ -38,12 +43,18 @@ from django.utils.encoding import smart_str
 from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import PatternFill, Alignment, Font, Border, Side
-from core.utils import ajax_login_required, get_coordinates_from_postal_code, haversine1
+from core.utils import ajax_login_required, annotate_distance, get_coordinates_from_postal_code
+from core.distance_table import annotate_session_distance
+from core.geocoding import needs_geocoding, schedule_geocoding
+from core import events
+from core.location_index import user_location_index
+from core.session_import import SPREADSHEET_COLUMNS, create_sessions, read_spreadsheet
+from core.session_recurrence import RecurrenceError, clone_session
 
 from .models import (
     TrainingRoomComment, User, Formation, Trainer, TrainingRoom, TrainingWish, Session, 
     SessionDate, Participant, SessionParticipant, ParticipantComment, 
-    Notification, CompletedTraining
+    Notification, CompletedTraining, UserSessionDistance, ArchivedSession, ArchivedParticipation
 )
 from .forms import (
     UserRegistrationForm, UserProfileForm, FormationForm, 
@@ -242,10 +253,22 @@ def profile(request):
     ).select_related('formation').prefetch_related('dates', 'dates__location', 'session_participants').distinct()
 
     # Souhaits de formation
-    training_wishes_with_session = TrainingWish.objects.filter(
+    training_wishes_with_session = list(TrainingWish.objects.filter(
         user=request.user,
         session__isnull=False
-    ).select_related('formation', 'session').order_by('-created_at')
+    ).select_related('formation', 'session').order_by('-created_at'))
+
+    # Participations et souhaits des sessions passées en stockage froid
+    archived_participations = ArchivedParticipation.objects.filter(
+        user=request.user
+    ).select_related('archived_session').order_by('-archived_session__end_date')
+    for ap in archived_participations:
+        if ap.kind == ArchivedParticipation.KIND_WISH:
+            training_wishes_with_session.append({
+                'formation': {'name': ap.archived_session.formation_name},
+                'session': ap.archived_session,
+                'created_at': ap.created_at,
+            })
 
     training_wishes_without_session = TrainingWish.objects.filter(
         user=request.user,
@@ -269,6 +292,13 @@ def profile(request):
             'completion_date': sp.session.end_date,
             'certificate_number': getattr(sp, 'certificate_number', None)
         })
+    for ap in archived_participations:
+        if ap.kind == ArchivedParticipation.KIND_PARTICIPANT and ap.archived_session.status == 'TERMINEE':
+            completed_trainings.append({
+                'formation': {'name': ap.archived_session.formation_name},
+                'completion_date': ap.archived_session.end_date,
+                'certificate_number': None,
+            })
 
     context = {
         'form': form,
@@ -278,25 +308,153 @@ def profile(request):
         'completed_trainings': completed_trainings,
     }
     return render(request, 'core/profile.html', context)
+def _parse_session_dates(session_dates, session_rooms):
+    """
+    Associe les dates postées à leurs salles : retourne une liste de
+    (date, room_id ou None), en ignorant les dates vides.
+    """
+    parsed = []
+    for value, room_id in zip_longest(session_dates, session_rooms):
+        if not value:
+            continue
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Date invalide : {value}")
+        parsed.append((day, int(room_id) if room_id else None))
+    return parsed
+
+
+def _missing_ids(model, ids):
+    """Retourne les identifiants absents de la table, en une seule requête in_bulk."""
+    ids = set(ids)
+    return sorted(ids - set(model.objects.in_bulk(ids)))
+
+
+@login_required
+@staff_member_required
+@require_POST
+def bulk_create_sessions(request):
+    """
+    Crée plusieurs sessions en une requête (JSON : {"sessions": [...]}).
+    Retourne un rapport par ligne : identifiant créé ou erreurs.
+    """
+    try:
+        rows = json.loads(request.body).get('sessions')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'JSON invalide.'}, status=400)
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return JsonResponse({'success': False, 'error': 'Le champ "sessions" doit être une liste d\'objets.'}, status=400)
+
+    results = create_sessions(rows)
+    created = sum(1 for r in results if r['success'])
+    return JsonResponse({'success': created == len(results), 'created': created, 'results': results})
+
+
+@login_required
+@staff_member_required
+def import_sessions_xlsx(request):
+    """
+    GET : télécharge le modèle de tableur. POST : importe le fichier "file"
+    et retourne le rapport ligne par ligne.
+    """
+    if request.method == 'GET':
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Sessions"
+        ws.append([label for _name, label in SPREADSHEET_COLUMNS])
+        for col_num in range(1, len(SPREADSHEET_COLUMNS) + 1):
+            cell = ws.cell(row=1, column=col_num)
+            cell.font = Font(bold=True)
+            ws.column_dimensions[get_column_letter(col_num)].width = len(str(cell.value)) + 2
+        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response['Content-Disposition'] = 'attachment; filename="modele_import_sessions.xlsx"'
+        wb.save(response)
+        return response
+
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['GET', 'POST'])
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'success': False, 'error': 'Aucun fichier fourni.'}, status=400)
+    try:
+        rows = read_spreadsheet(upload)
+    except Exception as e:
+        logger.warning(f"Import de sessions : fichier illisible ({e})")
+        return JsonResponse({'success': False, 'error': 'Fichier Excel illisible.'}, status=400)
+
+    results = create_sessions(rows)
+    # Numéros de ligne du tableur (la ligne 1 contient les en-têtes)
+    for result in results:
+        result['row'] += 1
+    created = sum(1 for r in results if r['success'])
+    return JsonResponse({'success': created == len(results), 'created': created, 'results': results})
+
+
+@login_required
+@staff_member_required
+@require_POST
+def generate_recurring_sessions(request, session_id):
+    """
+    Génère les sessions récurrentes d'une session source (JSON : {"rule": {...},
+    "allow_conflicts": false}). Les conflits de salle ou de formateur sont
+    retournés sans rien créer, sauf si "allow_conflicts" est vrai.
+    """
+    source = get_object_or_404(Session, id=session_id)
+    try:
+        data = json.loads(request.body)
+        rule = data.get('rule')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'JSON invalide.'}, status=400)
+
+    try:
+        sessions, conflicts = clone_session(source, rule, allow_conflicts=bool(data.get('allow_conflicts')))
+    except RecurrenceError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    if not sessions:
+        return JsonResponse({'success': False, 'error': 'Conflits détectés, aucune session créée.',
+                             'conflicts': conflicts}, status=409)
+    return JsonResponse({
+        'success': True,
+        'created': len(sessions),
+        'sessions': [
+            {'id': s.pk, 'start_date': s.start_date, 'end_date': s.end_date} for s in sessions
+        ],
+        'conflicts': conflicts,
+    })
+
+
 @login_required
 @staff_member_required
 @csrf_exempt
 def update_session(request, session_id):
-    """Handles session editing via AJAX."""
+    """Handles session editing via AJAX, only touching trainers and dates that changed."""
     if request.method == 'POST':
         try:
             session = get_object_or_404(Session, id=session_id)
             formation_id = request.POST.get('formation')
-            trainers = request.POST.getlist('trainers[]')
+            trainer_ids = {int(pk) for pk in request.POST.getlist('trainers[]') if pk}
             status = request.POST.get('status')
-            session_dates = request.POST.getlist('session_dates[]')
-            session_rooms = request.POST.getlist('session_rooms[]')
             iperia_opening = request.POST.get('iperia_opening')
             iperia_deadline = request.POST.get('iperia_deadline')
+            try:
+                posted_dates = _parse_session_dates(
+                    request.POST.getlist('session_dates[]'), request.POST.getlist('session_rooms[]')
+                )
+            except ValueError as e:
+                return JsonResponse({'success': False, 'error': str(e)})
 
             # Validate formation
             formation = get_object_or_404(Formation, id=formation_id)
 
+            # Valider tous les formateurs et salles en une requête chacun
+            missing_trainers = _missing_ids(Trainer, trainer_ids)
+            if missing_trainers:
+                return JsonResponse({'success': False, 'error': f"Formateur(s) introuvable(s) : {missing_trainers}"})
+            missing_rooms = _missing_ids(TrainingRoom, {room_id for _day, room_id in posted_dates if room_id})
+            if missing_rooms:
+                return JsonResponse({'success': False, 'error': f"Salle(s) introuvable(s) : {missing_rooms}"})
+
             # Update session
             with transaction.atomic():
                 session.formation = formation
@@ -305,18 +463,44 @@ def update_session(request, session_id):
                 session.iperia_deadline = iperia_deadline
                 session.save()
 
-                # Update trainers
-                session.trainers.clear()
-                for trainer_id in trainers:
-                    trainer = get_object_or_404(Trainer, id=trainer_id)
-                    session.trainers.add(trainer)
-
-                # Update session dates and rooms
-                session.dates.all().delete()  # Clear all existing dates
-                for date, room_id in zip(session_dates, session_rooms):
-                    if date:  # Ensure the date is not empty
-                        room = get_object_or_404(TrainingRoom, id=room_id) if room_id else None
-                        SessionDate.objects.create(session=session, date=date, location=room)
+                # Formateurs : uniquement les ajouts et retraits
+                current_trainers = set(session.trainers.values_list('pk', flat=True))
+                if trainer_ids - current_trainers:
+                    session.trainers.add(*(trainer_ids - current_trainers))
+                if current_trainers - trainer_ids:
+                    session.trainers.remove(*(current_trainers - trainer_ids))
+
+                # Dates : les lignes identiques sont conservées (created_at inchangé),
+                # une même date avec une autre salle est modifiée, le reste est
+                # supprimé ou créé.
+                existing = list(session.dates.all())
+                remaining = list(posted_dates)
+                unmatched = []
+                for session_date in existing:
+                    key = (session_date.date, session_date.location_id)
+                    if key in remaining:
+                        remaining.remove(key)
+                    else:
+                        unmatched.append(session_date)
+
+                changed = []
+                for day, room_id in list(remaining):
+                    session_date = next((d for d in unmatched if d.date == day), None)
+                    if session_date is not None:
+                        unmatched.remove(session_date)
+                        remaining.remove((day, room_id))
+                        session_date.location_id = room_id
+                        changed.append(session_date)
+
+                if unmatched:
+                    SessionDate.objects.filter(pk__in=[d.pk for d in unmatched]).delete()
+                if changed:
+                    SessionDate.objects.bulk_update(changed, ['location'])
+                if remaining:
+                    SessionDate.objects.bulk_create([
+                        SessionDate(session=session, date=day, location_id=room_id)
+                        for day, room_id in remaining
+                    ])
 
             return JsonResponse({'success': True, 'message': 'Session updated successfully.'})
         except Exception as e:
@@ -424,6 +608,34 @@ def assign_to_session(request):
     return JsonResponse({'status': 'error'}, status=400)
 
 
+def _parse_radius(value):
+    """Rayon de recherche en km (paramètre GET ``rayon``), ou None."""
+    try:
+        radius = float(value)
+    except (TypeError, ValueError):
+        return None
+    return radius if radius > 0 else None
+
+
+def _filter_sessions(queryset, params):
+    """
+    Filtres de la gestion des sessions (formation, statut, période), communs
+    aux sessions actives (``Session``) et au stockage froid (``ArchivedSession``).
+    """
+    formation_id = params.get('formation_id', '')
+    if formation_id.isdecimal():
+        queryset = queryset.filter(formation_id=formation_id)
+    if params.get('status'):
+        queryset = queryset.filter(status=params['status'])
+    date_from = parse_date(params.get('date_from') or '')
+    if date_from:
+        queryset = queryset.filter(start_date__gte=date_from)
+    date_to = parse_date(params.get('date_to') or '')
+    if date_to:
+        queryset = queryset.filter(end_date__lte=date_to)
+    return queryset
+
+
 # Formations
 def formation_list_api(request):
     formations = Formation.objects.filter(is_active=True)  # facultatif : filtre les formations actives
@@ -456,6 +668,7 @@ def formation_list(request):
     is_asynchrone = request.GET.get('is_asynchrone', '') == 'true'
     min_duration = request.GET.get('min_duration', '')
     max_duration = request.GET.get('max_duration', '')
+    radius = _parse_radius(request.GET.get('rayon'))
 
     # Filtres ORM
     if search_query:
@@ -477,23 +690,18 @@ def formation_list(request):
     if max_duration:
         formations_qs = formations_qs.filter(duration__lte=int(max_duration))
 
-    # Séparation des formations
-    formations_with_coords = []
-    formations_without_coords = []
-
-    for f in formations_qs:
-        if f.latitude is not None and f.longitude is not None and user.latitude and user.longitude:
-            distance = haversine1(user.latitude, user.longitude, f.latitude, f.longitude)
-            f.distance = round(distance, 2)  # Pour affichage si besoin
-            formations_with_coords.append(f)
+    # Tri par distance calculée en base, formations sans coordonnées à la fin ;
+    # FORMATION_LIST_LIMIT peut borner le classement (par défaut, tout le catalogue)
+    limit = getattr(settings, 'FORMATION_LIST_LIMIT', None)
+    if user.latitude and user.longitude:
+        if radius:
+            formations = formations_qs.near(user.latitude, user.longitude, radius).within_radius(
+                user.latitude, user.longitude, radius, limit=limit
+            )
         else:
-            formations_without_coords.append(f)
-
-    # Tri des formations avec coordonnées
-    formations_with_coords.sort(key=lambda f: f.distance)
-
-    # Fusion avec les formations sans coordonnées
-    formations = formations_with_coords + formations_without_coords
+            formations = annotate_distance(formations_qs, user.latitude, user.longitude, limit=limit)
+    else:
+        formations = list(formations_qs)
 
     context = {
         'formations': formations,
@@ -501,6 +709,7 @@ def formation_list(request):
         'type_filter': type_filter,
         'min_duration': min_duration,
         'max_duration': max_duration,
+        'radius': radius or '',
         'type_choices': Formation.FORMATION_TYPES,
     }
 
@@ -984,18 +1193,7 @@ def delete_wish(request, pk):
     return render(request, 'core/wish_confirm_delete.html', {'wish': wish})
 
 def session_list(request):
-    # 🔍 Vérification automatique des sessions "TERMINEE" à archiver
-    print("📦 Vérification des sessions à archiver...")
-
-    for session in Session.objects.filter(status='TERMINEE', is_archive=False):
-        if session.last_status_change:
-            time_diff = now() - session.last_status_change
-            print(f"🔍 Session ID {session.id} — Temps écoulé : {time_diff}")
-            if time_diff > timedelta(minutes=2):  # ⚠️ tu voulais 2 minutes
-                session.is_archive = True
-                session.save()
-                print(f"✅ Session ID {session.id} archivée.")
-
+    # L'archivage des sessions terminées est fait par la tâche planifiée archive_old_sessions
     sessions = Session.objects.filter(is_archive=False).select_related('formation')
     return render(request, 'core/sessions_list.html', {
         'sessions': sessions
@@ -1364,7 +1562,14 @@ def add_room_comment(request):
 
 @staff_member_required
 def export_archived_sessions_xlsx(request):
-    sessions = Session.objects.filter(is_archive=True)
+    # Sessions archivées encore dans les tables actives, puis celles du stockage froid,
+    # avec les filtres de la page de gestion ; lues par paquets
+    hot = _filter_sessions(Session.objects.filter(is_archive=True), request.GET).select_related('formation')
+    cold = _filter_sessions(ArchivedSession.objects.all(), request.GET).defer('payload')
+    sessions = chain(
+        ((session.formation.name, session) for session in hot.order_by('start_date').iterator(chunk_size=500)),
+        ((session.formation_name, session) for session in cold.iterator(chunk_size=500)),
+    )
 
     wb = Workbook()
     ws = wb.active
@@ -1392,9 +1597,9 @@ def export_archived_sessions_xlsx(request):
         cell.border = thin_border
 
     # Remplir les données
-    for session in sessions:
+    for formation_name, session in sessions:
         row = [
-            session.formation.name,
+            formation_name,
             session.start_date.strftime('%d/%m/%Y') if session.start_date else '',
             session.end_date.strftime('%d/%m/%Y') if session.end_date else '',
             session.city or '',
@@ -1421,21 +1626,7 @@ def export_archived_sessions_xlsx(request):
 @login_required
 @staff_member_required
 def manage_session(request):
-    """Renders the session management page and archives old sessions."""
-
-    # 🔍 Archivage automatique
-    print("📦 [DEBUG] Début vérification des sessions à archiver...")
-
-    for session in Session.objects.filter(status='TERMINEE', is_archive=False):
-        if session.last_status_change:
-            time_diff = now() - session.last_status_change
-            print(f"🔍 Session ID {session.id} — Temps écoulé : {time_diff}")
-            if time_diff > timedelta(days=30*19):
-                session.is_archive = True
-                session.save()
-                print(f"✅ Session ID {session.id} archivée automatiquement.")
-        else:
-            print(f"⚠️ Session ID {session.id} n'a pas de date de changement de statut.")
+    """Renders the session management page (archiving is done by the archive_old_sessions task)."""
 
     # Rendu de la page avec les données habituelles
     sessions = Session.objects.prefetch_related('trainers', 'dates', 'formation').all()
@@ -1449,10 +1640,18 @@ def manage_session(request):
         sessions = sessions.filter(is_archive=False)
     elif archived_filter == 'oui':
         sessions = sessions.filter(is_archive=True)
-    
+    sessions = _filter_sessions(sessions, request.GET)
+
+    # Les sessions déplacées vers le stockage froid sont affichées à la suite, par pages
+    cold_sessions = ArchivedSession.objects.none()
+    if archived_filter != 'non':
+        cold_sessions = _filter_sessions(ArchivedSession.objects.all(), request.GET)
+    cold_page = Paginator(cold_sessions, 50).get_page(request.GET.get('cold_page'))
 
     return render(request, 'core/manage_session.html', {
         'sessions': sessions,
+        'cold_sessions': cold_page,
+        'cold_page': cold_page,
         'formations': formations,
         'trainers': trainers,
         'training_rooms': training_rooms,
@@ -1502,19 +1701,9 @@ def create_session(request):
                 )
                 print(f"🆕 Session créée avec ID : {session.id}")
 
-                # Géolocalisation automatique
-                if postal_code:
-                    lat, lon = get_coordinates_from_postal_code(postal_code, city)
-                    print(f"📍 Coordonnées obtenues : lat={lat}, lon={lon}")
-                    if lat is not None and lon is not None:
-                        session.latitude = lat
-                        session.longitude = lon
-                        session.save()
-                        print("✅ Coordonnées enregistrées dans la session")
-                    else:
-                        print("⚠️ Coordonnées non disponibles pour le code postal et la ville fournis")
-                else:
-                    print("⚠️ Code postal non fourni, géolocalisation ignorée")
+                # Géolocalisation en tâche de fond, annulée avec la transaction
+                if needs_geocoding(session):
+                    schedule_geocoding(session)
 
                 # Add trainers
                 for trainer_id in trainers:
@@ -1544,35 +1733,49 @@ def assign_wishes_to_session(request, session_id):
     ).select_related('user')
 
     sort_by = request.GET.get('sort')
+    radius = _parse_radius(request.GET.get('rayon'))
     wishes_with_distances = []
 
     # Récupérer les coordonnées de la session
     session_lat, session_lon = get_coordinates_from_postal_code(session.postal_code, session.city)
 
-    if session_lat and session_lon:
-        for wish in wishes:
-            user = wish.user
-
-            # ⚡ D'abord utiliser les coordonnées existantes si disponibles
-            if user.latitude and user.longitude:
-                user_lat, user_lon = user.latitude, user.longitude
-            else:
-                # Sinon essayer de récupérer via Nominatim
-                user_lat, user_lon = get_coordinates_from_postal_code(user.code_postal, user.city)
-
-            print(f"USER: {user.get_full_name()}, CP: {user.code_postal}, VILLE: {user.city}, coords: {user_lat}, {user_lon}")
-
-            if user_lat and user_lon:
-                distance = haversine1(session_lat, session_lon, user_lat, user_lon)
-            else:
-                distance = float('inf')  # Très loin si pas de coordonnées
+    if not session.is_archive and session.user_distances.exists():
+        # Distances précalculées : filtrage et tri directement en SQL
+        distance = UserSessionDistance.objects.filter(
+            session=session, user=OuterRef('user_id')
+        ).values('distance_km')[:1]
+        wishes = wishes.annotate(distance_km=Subquery(distance))
+        if radius:
+            wishes = wishes.filter(distance_km__lte=radius)
+        if sort_by == 'date':
+            wishes = wishes.order_by('created_at')
+        elif sort_by == 'distance' or radius:
+            wishes = wishes.order_by(F('distance_km').asc(nulls_last=True), 'created_at')
+        wishes_with_distances = [
+            (wish, wish.distance_km if wish.distance_km is not None else float('inf'))
+            for wish in wishes
+        ]
+    elif session_lat and session_lon:
+        # Distances de tous les souhaitants en un seul appel à l'index spatial
+        user_ids = {wish.user_id for wish in wishes}
+        if radius:
+            ids, dists = user_location_index.within_radius(
+                session_lat, session_lon, radius, candidates=user_ids
+            )
+        else:
+            ids, dists = user_location_index.nearest(session_lat, session_lon, candidates=user_ids)
+        distances = dict(zip(ids.tolist(), dists.tolist()))
 
-            wishes_with_distances.append((wish, distance))
+        for wish in wishes:
+            if wish.user_id in distances:
+                wishes_with_distances.append((wish, distances[wish.user_id]))
+            elif not radius:
+                wishes_with_distances.append((wish, float('inf')))  # Très loin si pas de coordonnées
 
-        if sort_by == 'distance':
-            wishes_with_distances.sort(key=lambda x: x[1])
-        elif sort_by == 'date':
+        if sort_by == 'date':
             wishes_with_distances.sort(key=lambda x: x[0].created_at)
+        elif sort_by == 'distance' or radius:
+            wishes_with_distances.sort(key=lambda x: x[1])
     else:
         # Si pas de coordonnées pour la session, on met infini pour tous
         wishes_with_distances = [(wish, float('inf')) for wish in wishes]
@@ -1580,6 +1783,7 @@ def assign_wishes_to_session(request, session_id):
     context = {
         'session': session,
         'wishes_with_distances': wishes_with_distances,
+        'radius': radius or '',
     }
     return render(request, 'core/assign_wishes_to_session.html', context)
 @login_required
@@ -1645,32 +1849,34 @@ def add_participant(request, session_id):
         user_id = request.POST.get('user_id')
         user = User.objects.get(id=user_id)
         
-        # Créer le participant
-        participant = SessionParticipant.objects.create(
-            session=session,
-            user=user,
-            status='CONTACTED'  # Statut par défaut
-        )
-        
-        # Créer une notification pour l'utilisateur
-        Notification.objects.create(
-            user=user,
-            title='Inscription à une formation',
-            message=f'Vous avez été inscrit à la formation "{session.formation.name}".',
-            notification_type='SESSION_REGISTRATION'
-        )
-        
-        # Mettre à jour le voeu de formation correspondant s'il existe
-        try:
-            training_wish = TrainingWish.objects.get(
-                user=user, 
-                formation=session.formation
+        # Participant, notification et voeu sont écrits ensemble (ou pas du tout)
+        with transaction.atomic():
+            # Créer le participant
+            participant = SessionParticipant.objects.create(
+                session=session,
+                user=user,
+                status='CONTACTED'  # Statut par défaut
             )
-            training_wish.session = session
-            training_wish.save()
-        except TrainingWish.DoesNotExist:
-            # Pas de voeu trouvé, ce n'est pas une erreur bloquante
-            pass
+
+            # Créer une notification pour l'utilisateur
+            Notification.objects.bulk_notify(
+                [user],
+                'SESSION_REGISTRATION',
+                f'Vous avez été inscrit à la formation "{session.formation.name}".',
+                related_object=session,
+            )
+
+            # Mettre à jour le voeu de formation correspondant s'il existe
+            try:
+                training_wish = TrainingWish.objects.get(
+                    user=user, 
+                    formation=session.formation
+                )
+                training_wish.session = session
+                training_wish.save()
+            except TrainingWish.DoesNotExist:
+                # Pas de voeu trouvé, ce n'est pas une erreur bloquante
+                pass
         
         return JsonResponse({
             'success': True,
@@ -1699,29 +1905,32 @@ def remove_participant(request, participant_id):
         user = participant.user
         formation = session.formation
 
-        # Créer une notification pour l'utilisateur
-        Notification.objects.create(
-            user=user,
-            type='session_created',  # Utiliser un type existant
-            message=f'Votre participation à la formation "{formation.name}" a été annulée par un administrateur.',
-        )
+        # Notification, voeu et suppression sont écrits ensemble (ou pas du tout)
+        with transaction.atomic():
+            # Créer une notification pour l'utilisateur
+            Notification.objects.bulk_notify(
+                [user],
+                'session_created',  # Utiliser un type existant
+                f'Votre participation à la formation "{formation.name}" a été annulée par un administrateur.',
+                related_object=session,
+            )
 
-        # Créer ou réactiver un voeu de formation
-        training_wish, created = TrainingWish.objects.get_or_create(
-            user=user, 
-            formation=formation,
-            defaults={
-                'notes': 'Voeu recréé suite à annulation de participation',
-                'created_at': timezone.now()
-            }
-        )
-        
-        # Toujours réinitialiser le statut du voeu
-        training_wish.session = None
-        training_wish.save()
+            # Créer ou réactiver un voeu de formation
+            training_wish, created = TrainingWish.objects.get_or_create(
+                user=user, 
+                formation=formation,
+                defaults={
+                    'notes': 'Voeu recréé suite à annulation de participation',
+                    'created_at': timezone.now()
+                }
+            )
+
+            # Toujours réinitialiser le statut du voeu
+            training_wish.session = None
+            training_wish.save()
 
-        # Supprimer le participant de la session
-        participant.delete()
+            # Supprimer le participant de la session
+            participant.delete()
         
         return JsonResponse({
             'success': True,
@@ -1765,7 +1974,7 @@ def update_session_status(request):
         session_id = request.POST.get('session_id')
         new_status = request.POST.get('status')
         
-        session = Session.objects.get(id=session_id)
+        session = Session.objects.select_related('formation').get(id=session_id)
         logger.info(f"Mise à jour du statut de la session {session_id} en {new_status}")
         
         # Vérifier que le statut est valide
@@ -1774,22 +1983,23 @@ def update_session_status(request):
             logger.error(f"Statut invalide : {new_status}")
             return JsonResponse({'error': 'Statut invalide'}, status=400)
         
-        # Mettre à jour le statut
-        session.status = new_status
-        session.save()
-        logger.info(f"Statut de la session {session_id} mis à jour en {new_status}")
-        
-
-        # Créer une notification pour chaque participant
-        participants = session.session_participants.all()
-        for participant in participants:
-            Notification.create_notification(
-                user=participant.user,
-                title=f'Mise à jour du statut de la formation "{session.formation.name}"',
-                notification_type='session_status_update',
-                message=f'Le statut a été mis à jour à "{valid_statuses[new_status]}".'
-            )
-            logger.info(f"Notification envoyée à {participant.user.username} pour la mise à jour du statut de la session {session_id}")
+        # Le statut et les notifications sont écrits ensemble (ou pas du tout)
+        with transaction.atomic():
+            # Mettre à jour le statut
+            session.status = new_status
+            session.save()
+            logger.info(f"Statut de la session {session_id} mis à jour en {new_status}")
+
+            # Notifier tous les participants en un seul INSERT, dans la transaction du changement de statut
+            participant_ids = list(session.session_participants.values_list('user_id', flat=True))
+            if participant_ids:
+                Notification.objects.bulk_notify(
+                    participant_ids,
+                    'session_status_update',
+                    f'Le statut de la formation "{session.formation.name}" a été mis à jour à "{valid_statuses[new_status]}".',
+                    related_object=session,
+                )
+                logger.info(f"{len(participant_ids)} participant(s) notifié(s) de la mise à jour du statut de la session {session_id}")
 
         return JsonResponse({
     'success': True,
@@ -1810,23 +2020,12 @@ def admin_training_sessions(request):
     user_lat = getattr(user, 'latitude', None)
     user_lon = getattr(user, 'longitude', None)
 
-    # 🔍 Vérification automatique des sessions "TERMINEE" à archiver
-    print("📦 Vérification des sessions à archiver...")
-
-    for session in Session.objects.filter(status='TERMINEE', is_archive=False):
-        if session.last_status_change:
-            time_diff = now() - session.last_status_change
-            print(f"🔍 Session ID {session.id} — Temps écoulé : {time_diff}")
-            if time_diff > timedelta(minutes=1):
-                session.is_archive = True
-                session.save()
-                print(f"✅ Session ID {session.id} archivée.")
-
     formations = Formation.objects.all()
     selected_formation_id = request.GET.get('formation')
     city_filter = request.GET.get('rpe')
     date_from = request.GET.get('date_from')
     date_to = request.GET.get('date_to')
+    radius = _parse_radius(request.GET.get('rayon'))
 
     # 🔒 On filtre pour n'afficher que les sessions non archivées
     sessions = Session.objects.filter(is_archive=False).select_related('formation')
@@ -1842,40 +2041,34 @@ def admin_training_sessions(request):
     if date_to:
         sessions = sessions.filter(end_date__lte=parsedate(date_to))
 
-    # Ajoute la distance si latitude et longitude sont connues
-    sessions_with_distance = []
-    for session in sessions:
-        if session.latitude and session.longitude and user_lat and user_lon:
-            distance = haversine1(user_lat, user_lon, session.latitude, session.longitude)
-        else:
-            distance = float('inf')
-        sessions_with_distance.append((distance, session))
+    # Tri par distance via la table des distances précalculées, complétée en SQL
+    if user_lat and user_lon:
+        sessions = annotate_session_distance(sessions, user, user_lat, user_lon)
+        if radius:
+            if isinstance(sessions, list):
+                sessions = [s for s in sessions if s.distance is not None and s.distance <= radius]
+            else:
+                sessions = sessions.filter(distance__lte=radius)
+    else:
+        sessions = sessions.order_by('start_date')
 
-    sessions_with_distance.sort(key=lambda x: x[0])
-    sessions = [s for _, s in sessions_with_distance]
+    page_obj = Paginator(sessions, 50).get_page(request.GET.get('page'))
 
     context = {
         'formations': formations,
-        'sessions': sessions,
+        'sessions': page_obj,
+        'page_obj': page_obj,
         'current_formation_filter': selected_formation_id,
         'current_rpe_filter': city_filter,
         'current_date_from': date_from,
         'current_date_to': date_to,
+        'current_radius': radius or '',
     }
     return render(request, 'core/admin_training_sessions.html', context)
 @login_required
 @staff_member_required
 def get_session(request, session_id):
-    """Fetches session details for editing, and archive old sessions if needed."""
-
-    print("🔍 Vérification des sessions terminées non archivées...")
-    for session in Session.objects.filter(status='TERMINEE', is_archive=False):
-        delta = now() - session.last_status_change
-        print(f"🕓 Session ID {session.id} - Dernier changement : {session.last_status_change} (delta: {delta})")
-        if session.last_status_change and delta > timedelta(minutes=1):
-            session.is_archive = True
-            session.save()
-            print(f"✅ Session ID {session.id} archivée automatiquement.")
+    """Fetches session details for editing."""
 
     session = get_object_or_404(Session, id=session_id)
     print(f"📦 Chargement de la session ID {session.id}")
@@ -2175,13 +2368,6 @@ def add_training_wish(request, formation_pk):
         messages.warning(request, "Vous avez déjà souhaité cette formation.")
 
     return redirect('core:formation_list')
-@login_required
-def notifications_list(request):
-    # Ajoutez votre logique ici
-    return render(request, 'core/notifications.html', {
-        'notifications': [],  # Remplacez par vos notifications
-    })
-
 @staff_member_required
 def admin_training_wishes(request):
     """Vue pour la gestion des souhaits de formation par les administrateurs."""
@@ -2463,29 +2649,6 @@ def add_training_wish(request, formation_pk):
         
         return redirect('core:formation_detail', pk=formation_pk)
 
-@login_required
-def notifications_list(request):
-    """Liste des notifications de l'utilisateur."""
-    # Récupérer toutes les notifications non lues
-    unread_notifications = request.user.notifications.filter(is_read=False)
-    
-    # Récupérer les notifications lues, limitées à 20
-    read_notifications = request.user.notifications.filter(is_read=True).order_by('-created_at')[:20]
-    
-    # Combiner et trier les notifications
-    notifications = list(unread_notifications) + list(read_notifications)
-    
-    # Marquer les notifications comme lues
-    unread_notifications.update(is_read=True)
-    
-    context = {
-        'notifications': notifications,
-        'title': 'Mes notifications'
-    }
-    
-    return render(request, 'core/notifications_list.html', context)
-
-
 @staff_member_required
 def admin_training_wishes(request):
     """Vue pour la gestion des souhaits de formation par les administrateurs."""
@@ -2779,29 +2942,6 @@ def add_training_wish(request, formation_pk):
         
         return redirect('core:formation_detail', pk=formation_pk)
 
-@login_required
-def notifications_list(request):
-    """Liste des notifications de l'utilisateur."""
-    # Récupérer toutes les notifications non lues
-    unread_notifications = request.user.notifications.filter(is_read=False)
-    
-    # Récupérer les notifications lues, limitées à 20
-    read_notifications = request.user.notifications.filter(is_read=True).order_by('-created_at')[:20]
-    
-    # Combiner et trier les notifications
-    notifications = list(unread_notifications) + list(read_notifications)
-    
-    # Marquer les notifications comme lues
-    unread_notifications.update(is_read=True)
-    
-    context = {
-        'notifications': notifications,
-        'title': 'Mes notifications'
-    }
-    
-    return render(request, 'core/notifications_list.html', context)
-
-
 @staff_member_required
 def admin_training_wishes(request):
     """Vue pour la gestion des souhaits de formation par les administrateurs."""
@@ -3095,29 +3235,6 @@ def add_training_wish(request, formation_pk):
         
         return redirect('core:formation_detail', pk=formation_pk)
 
-@login_required
-def notifications_list(request):
-    """Liste des notifications de l'utilisateur."""
-    # Récupérer toutes les notifications non lues
-    unread_notifications = request.user.notifications.filter(is_read=False)
-    
-    # Récupérer les notifications lues, limitées à 20
-    read_notifications = request.user.notifications.filter(is_read=True).order_by('-created_at')[:20]
-    
-    # Combiner et trier les notifications
-    notifications = list(unread_notifications) + list(read_notifications)
-    
-    # Marquer les notifications comme lues
-    unread_notifications.update(is_read=True)
-    
-    context = {
-        'notifications': notifications,
-        'title': 'Mes notifications'
-    }
-    
-    return render(request, 'core/notifications_list.html', context)
-
-
 @staff_member_required
 def admin_training_wishes(request):
     """Vue pour la gestion des souhaits de formation par les administrateurs."""
@@ -3411,29 +3528,6 @@ def add_training_wish(request, formation_pk):
         
         return redirect('core:formation_detail', pk=formation_pk)
 
-@login_required
-def notifications_list(request):
-    """Liste des notifications de l'utilisateur."""
-    # Récupérer toutes les notifications non lues
-    unread_notifications = request.user.notifications.filter(is_read=False)
-    
-    # Récupérer les notifications lues, limitées à 20
-    read_notifications = request.user.notifications.filter(is_read=True).order_by('-created_at')[:20]
-    
-    # Combiner et trier les notifications
-    notifications = list(unread_notifications) + list(read_notifications)
-    
-    # Marquer les notifications comme lues
-    unread_notifications.update(is_read=True)
-    
-    context = {
-        'notifications': notifications,
-        'title': 'Mes notifications'
-    }
-    
-    return render(request, 'core/notifications_list.html', context)
-
-
 @staff_member_required
 def admin_training_wishes(request):
     """Vue pour la gestion des souhaits de formation par les administrateurs."""
@@ -3727,29 +3821,6 @@ def add_training_wish(request, formation_pk):
         
         return redirect('core:formation_detail', pk=formation_pk)
 
-@login_required
-def notifications_list(request):
-    """Liste des notifications de l'utilisateur."""
-    # Récupérer toutes les notifications non lues
-    unread_notifications = request.user.notifications.filter(is_read=False)
-    
-    # Récupérer les notifications lues, limitées à 20
-    read_notifications = request.user.notifications.filter(is_read=True).order_by('-created_at')[:20]
-    
-    # Combiner et trier les notifications
-    notifications = list(unread_notifications) + list(read_notifications)
-    
-    # Marquer les notifications comme lues
-    unread_notifications.update(is_read=True)
-    
-    context = {
-        'notifications': notifications,
-        'title': 'Mes notifications'
-    }
-    
-    return render(request, 'core/notifications_list.html', context)
-
-
 @staff_member_required
 def admin_training_wishes(request):
     """Vue pour la gestion des souhaits de formation par les administrateurs."""
@@ -4043,29 +4114,6 @@ def add_training_wish(request, formation_pk):
         
         return redirect('core:formation_detail', pk=formation_pk)
 
-@login_required
-def notifications_list(request):
-    """Liste des notifications de l'utilisateur."""
-    # Récupérer toutes les notifications non lues
-    unread_notifications = request.user.notifications.filter(is_read=False)
-    
-    # Récupérer les notifications lues, limitées à 20
-    read_notifications = request.user.notifications.filter(is_read=True).order_by('-created_at')[:20]
-    
-    # Combiner et trier les notifications
-    notifications = list(unread_notifications) + list(read_notifications)
-    
-    # Marquer les notifications comme lues
-    unread_notifications.update(is_read=True)
-    
-    context = {
-        'notifications': notifications,
-        'title': 'Mes notifications'
-    }
-    
-    return render(request, 'core/notifications_list.html', context)
-
-
 @staff_member_required
 def admin_training_wishes(request):
     """Vue pour la gestion des souhaits de formation par les administrateurs."""
@@ -4124,12 +4172,11 @@ def assign_wish_to_session(request, wish_id):
             )
             
             # Créer une notification
-            Notification.objects.create(
-                user=wish.user,
-                type='wish_assigned',
-                message=f'Votre souhait pour la formation {wish.formation.name} a été assigné à une session',
-                related_object_id=session.id,
-                related_object_type='Session'
+            Notification.objects.bulk_notify(
+                [wish.user_id],
+                'wish_assigned',
+                f'Votre souhait pour la formation {wish.formation.name} a été assigné à une session',
+                related_object=session,
             )
             
             # Supprimer le souhait
@@ -4311,11 +4358,11 @@ def add_participant_from_wish(request, session_id):
         )
         
         # Créer une notification pour l'utilisateur
-        Notification.objects.create(
-            user=user,
-            title='Inscription à une formation',
-            message=f'Vous avez été inscrit à la formation "{session.formation.name}".',
-            notification_type='SESSION_REGISTRATION'
+        Notification.objects.bulk_notify(
+            [user],
+            'SESSION_REGISTRATION',
+            f'Vous avez été inscrit à la formation "{session.formation.name}".',
+            related_object=session,
         )
         
         # Mettre à jour le voeu de formation
@@ -4359,28 +4406,83 @@ def add_training_wish(request, formation_pk):
         
         return redirect('core:formation_detail', pk=formation_pk)
 
+NOTIFICATIONS_PAGE_SIZE = 20
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _encode_notification_cursor(cursor):
+    """Sérialise un curseur (is_read, created_at, id) pour l'URL : "0-<µs depuis 1970>-<id>"."""
+    is_read, created_at, pk = cursor
+    return f"{int(is_read)}-{(created_at - _EPOCH) // timedelta(microseconds=1)}-{pk}"
+
+
+def _decode_notification_cursor(value):
+    """Inverse de ``_encode_notification_cursor`` ; None si le curseur est absent ou invalide."""
+    try:
+        is_read, micros, pk = (int(part) for part in value.split('-'))
+    except (AttributeError, ValueError):
+        return None
+    return bool(is_read), _EPOCH + timedelta(microseconds=micros), pk
+
+
 @login_required
 def notifications_list(request):
-    """Liste des notifications de l'utilisateur."""
-    # Récupérer toutes les notifications non lues
-    unread_notifications = request.user.notifications.filter(is_read=False)
-    
-    # Récupérer les notifications lues, limitées à 20
-    read_notifications = request.user.notifications.filter(is_read=True).order_by('-created_at')[:20]
-    
-    # Combiner et trier les notifications
-    notifications = list(unread_notifications) + list(read_notifications)
-    
-    # Marquer les notifications comme lues
-    unread_notifications.update(is_read=True)
-    
+    """
+    Liste des notifications de l'utilisateur, non lues d'abord, paginée par
+    clé (paramètre "after"). L'affichage ne modifie rien : voir
+    ``mark_notifications_page_read``.
+    """
+    cursor = _decode_notification_cursor(request.GET.get('after'))
+    notifications, next_cursor = request.user.notifications.inbox_page(cursor, NOTIFICATIONS_PAGE_SIZE)
+
     context = {
         'notifications': notifications,
+        'unread_ids': [n.pk for n in notifications if not n.is_read],
+        'next_cursor': _encode_notification_cursor(next_cursor) if next_cursor else None,
+        'is_first_page': cursor is None,
         'title': 'Mes notifications'
     }
-    
+
     return render(request, 'core/notifications_list.html', context)
 
+
+@login_required
+async def event_stream(request):
+    """
+    Flux Server-Sent Events : notifications de l'utilisateur et, pour le
+    personnel, changements de statut des sessions et des participants.
+    Nécessite un serveur ASGI (formation_assmat/asgi.py).
+    """
+    if not isinstance(request, ASGIRequest):
+        # Sous WSGI le flux serait mis en mémoire tampon sans fin ; 204 arrête
+        # les reconnexions d'EventSource.
+        return HttpResponse(status=204)
+    user = await request.auser()
+    channels = [events.user_channel(user.pk)]
+    if user.is_staff:
+        channels.append(events.STAFF_CHANNEL)
+    return StreamingHttpResponse(
+        events.stream(channels),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@login_required
+@require_POST
+def mark_notifications_page_read(request):
+    """Marque comme lues les notifications affichées sur la page (champ "ids")."""
+    ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
+    if ids:
+        # Limité aux notifications non lues de l'utilisateur : un seul UPDATE ciblé
+        request.user.notifications.filter(pk__in=ids, is_read=False).update(is_read=True)
+
+    url = reverse('core:notifications_list')
+    after = request.POST.get('after')
+    if _decode_notification_cursor(after):
+        url = f"{url}?after={after}"
+    return redirect(url)
+
 def sessions_calendar(request):
     selected_formation = request.GET.get('formation')
     
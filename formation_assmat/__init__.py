@@ -0,0 +1,5 @@
+# Charge l'application Celery au démarrage de Django pour que les tâches
+# planifiées depuis les vues utilisent le broker configuré.
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
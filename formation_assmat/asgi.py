@@ -2,6 +2,8 @@
 ASGI config for formation_assmat project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The live event stream (core.views.event_stream) is only served under ASGI,
+e.g. ``uvicorn formation_assmat.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
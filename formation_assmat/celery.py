@@ -20,4 +20,28 @@ app.conf.beat_schedule = {
         'task': 'core.tasks.archive_old_sessions',
         'schedule': crontab(hour=0, minute=0),  # Exécution quotidienne à minuit
     },
+    'move-archived-sessions-to-cold-storage': {
+        'task': 'core.tasks.move_archived_sessions_to_cold_storage',
+        'schedule': crontab(hour=0, minute=30, day_of_week=0),  # Chaque dimanche, après l'archivage
+    },
+    'rebuild-user-session-distances': {
+        'task': 'core.tasks.rebuild_user_session_distances',
+        'schedule': crontab(hour=1, minute=0),  # Rattrape les coordonnées modifiées hors signaux
+    },
+    'purge-notifications': {
+        'task': 'core.tasks.purge_notifications',
+        'schedule': crontab(hour=2, minute=0),  # Compactage et rétention des notifications
+    },
+    'send-notification-digests': {
+        'task': 'core.tasks.send_notification_digests',
+        'schedule': crontab(minute='*/15'),  # Rattrape les envois non planifiés (broker indisponible)
+    },
+    'dispatch-outbox': {
+        'task': 'core.tasks.dispatch_outbox',
+        'schedule': crontab(),  # Rattrape les messages en attente et les nouvelles tentatives
+    },
+    'purge-outbox': {
+        'task': 'core.tasks.purge_outbox',
+        'schedule': crontab(hour=2, minute=30),  # Suppression des messages traités
+    },
 }
@@ -157,6 +157,63 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Cache
+# Sert notamment à fusionner les tâches de géocodage en double ; en production,
+# utiliser un cache partagé entre processus (ex. RedisCache sur le broker Celery).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Sessions terminées archivées par la tâche planifiée archive_old_sessions après ce délai (~18 mois)
+SESSION_ARCHIVE_DELAY_DAYS = 18 * 30
+# Sessions archivées déplacées vers le stockage froid (ArchivedSession) après ce délai
+SESSION_COLD_STORAGE_DELAY_DAYS = 365
+
+# Géocodage
+# Les codes postaux sont résolus via le référentiel local (manage.py load_postal_codes).
+# Nominatim n'est interrogé qu'en repli pour les adresses complètes.
+GEOCODING_NOMINATIM_FALLBACK = True
+# Durées de vie du cache de géocodage (secondes) ; les échecs sont gardés moins longtemps.
+GEOCODING_CACHE_TTL = 60 * 60 * 24 * 90
+GEOCODING_NEGATIVE_CACHE_TTL = 60 * 60 * 24
+GEOCODING_LRU_SIZE = 2048
+# Reconstruction complète de l'index spatial des utilisateurs (secondes)
+USER_LOCATION_INDEX_TTL = 60 * 10
+# Distance maximale (km) conservée dans la table des distances utilisateur / session (None = toutes)
+USER_SESSION_DISTANCE_MAX_KM = None
+# Nombre maximal de formations classées par distance dans le catalogue (None = toutes)
+FORMATION_LIST_LIMIT = None
+
+# Notifications groupées : au-delà de ce nombre de destinataires, création différée via la boîte d'envoi (None = jamais)
+NOTIFICATION_BULK_ASYNC_THRESHOLD = 200
+# Durée de vie (secondes) du compteur de notifications non lues en cache ; invalidé à chaque écriture
+UNREAD_NOTIFICATIONS_CACHE_TTL = 60 * 10
+# Notifications lues supprimées par la tâche planifiée purge_notifications après ce délai (jours)
+NOTIFICATION_RETENTION_DAYS = 180
+# Messages traités de la boîte d'envoi (core/outbox.py) conservés ce nombre de jours ; les échecs sont gardés
+OUTBOX_RETENTION_DAYS = 7
+
+# Email
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Pour le développement
+EMAIL_HOST = 'smtp.gmail.com'  # À configurer pour la production
+EMAIL_PORT = 587
+EMAIL_USE_TLS = True
+
+# Notifications par email : récapitulatif par destinataire envoyé par une tâche Celery
+NOTIFICATION_EMAILS_ENABLED = False
+# Délai (secondes) pendant lequel les notifications sont regroupées avant envoi
+NOTIFICATION_EMAIL_DIGEST_DELAY = 5 * 60
+# Nombre d'emails envoyés sur une même connexion SMTP
+NOTIFICATION_EMAIL_BATCH_SIZE = 50
+
+# Événements en direct (SSE, core/events.py) : broker en mémoire, valable pour un seul
+# processus ASGI. Avec plusieurs processus ou pour relayer les workers Celery :
+# EVENTS_BROKER = 'core.events.RedisBroker' (EVENTS_REDIS_URL, par défaut CELERY_BROKER_URL)
+EVENTS_BROKER = 'core.events.InProcessBroker'
+EVENTS_HEARTBEAT_SECONDS = 15
+
 # Logging Configuration
 LOGGING = {
     'version': 1,